@@ -0,0 +1,115 @@
+"""
+Benchmark de rendimiento de los endpoints de estudiantes síncronos frente a
+sus variantes asíncronas (routers/students_async.py).
+
+Puebla una base de datos SQLite temporal y lanza peticiones concurrentes a
+GET /students/{class_id} (roster con las últimas entradas del historial) y,
+con --write-ratio, a POST /students/{class_id}/update_grades, primero contra
+el router síncrono (threadpool + Session) y después contra el asíncrono
+(AsyncSession). SQLite no admite escrituras concurrentes, así que las
+escrituras solo se activan por defecto con otra base de datos: basta con
+apuntar MYSQLDATABASE_URL a una base de datos MySQL de pruebas.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_async_db --requests 400 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+_directory = tempfile.mkdtemp()
+os.environ.setdefault("MYSQLDATABASE_URL", f"sqlite:///{os.path.join(_directory, 'bench_async_db.db')}")
+
+from benchmarks.seed import seed_database  # noqa: E402
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+import database  # noqa: E402
+from models import User  # noqa: E402
+from routers import students, students_async  # noqa: E402
+from routers.auth import get_current_user  # noqa: E402
+from services.user_cache import CurrentUser  # noqa: E402
+
+TEACHER = CurrentUser(id=1, username="profesor", email="profesor@example.com", is_teacher=True)
+
+
+def build_app(router) -> FastAPI:
+    app = FastAPI()
+    app.include_router(router, prefix="/students")
+    app.dependency_overrides[get_current_user] = lambda: TEACHER
+    return app
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run_scenario(app, stats, students_per_class, requests, concurrency, write_ratio, seed=7):
+    rng = random.Random(seed)
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one_request():
+            class_id = rng.randint(1, stats["classes"])
+            async with semaphore:
+                start = time.perf_counter()
+                if rng.random() >= write_ratio:
+                    response = await client.get(f"/students/{class_id}", params={"history": "last"})
+                else:
+                    student = rng.randint(0, students_per_class - 1)
+                    response = await client.post(
+                        f"/students/{class_id}/update_grades",
+                        json={"student_names": [f"Estudiante {student} de la clase {class_id}"], "category_name": "Comportamiento", "points": 1},
+                    )
+                assert response.status_code == 200, response.text
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one_request() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    # Cerrar las conexiones asíncronas dentro del event loop que las creó
+    if database.async_engine is not None:
+        await database.async_engine.dispose()
+
+    return {
+        "requests_per_second": requests / elapsed,
+        "p50": statistics.median(latencies),
+        "p99": percentile(latencies, 0.99),
+    }
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--classes", type=int, default=50)
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--history", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--write-ratio", type=float, default=None,
+                        help="Fracción de peticiones update_grades (por defecto 0 en SQLite y 0.2 en el resto)")
+    args = parser.parse_args()
+    if args.write_ratio is None:
+        args.write_ratio = 0.0 if database.DATABASE_URL.startswith("sqlite") else 0.2
+
+    User.metadata.create_all(bind=database.engine)
+    stats = seed_database(database.engine, classes=args.classes, students_per_class=args.students, history_per_grade=args.history)
+    print(f"Datos: {stats['classes']} clases, {stats['students']} estudiantes, "
+          f"{stats['grades']} notas, {stats['history']} entradas de historial")
+    print(f"{args.requests} peticiones ({args.write_ratio:.0%} update_grades), concurrencia {args.concurrency}\n")
+
+    for label, router in (("síncrono (threadpool)", students.router), ("asíncrono (AsyncSession)", students_async.router)):
+        result = asyncio.run(run_scenario(build_app(router), stats, args.students, args.requests, args.concurrency, args.write_ratio))
+        print(f"{label}:")
+        print(f"  peticiones/s: {result['requests_per_second']:.1f}")
+        print(f"  latencia: p50 {result['p50']:.1f} ms, p99 {result['p99']:.1f} ms\n")
+
+
+if __name__ == "__main__":
+    main_benchmark()
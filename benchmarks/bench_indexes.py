@@ -0,0 +1,134 @@
+"""
+Benchmark de los índices compuestos de las migraciones a3c9e1f04b27 y c71d2b9e5a13.
+
+Crea una base de datos SQLite temporal con el esquema anterior a la migración,
+la puebla, mide el plan de ejecución y el tiempo de las consultas más
+frecuentes, aplica la migración con Alembic y vuelve a medir.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_indexes --classes 200 --students 30
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.seed import seed_database
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import MetaData, create_engine, text
+from models import User
+
+BASE_REVISION = "6de48f9f52d1"
+NEW_INDEXES = {
+    "unique_grade_per_student_category",
+    "ix_categories_class_id_parent_id",
+    "ix_categories_name",
+    "ix_class_members_class_user_role",
+    "ix_grade_histories_grade_id_created_at",
+    "ix_categories_class_id_name",
+    "ix_students_class_id_name",
+}
+
+QUERIES = {
+    "grade por (student_id, category_id)":
+        "SELECT * FROM grades WHERE student_id = :student_id AND category_id = :category_id",
+    "categorías por (class_id, parent_id)":
+        "SELECT * FROM categories WHERE class_id = :class_id AND parent_id = :parent_id",
+    "categoría por nombre":
+        "SELECT * FROM categories WHERE name = :name LIMIT 1",
+    "categoría por (class_id, nombre)":
+        "SELECT * FROM categories WHERE class_id = :class_id AND name = :name",
+    "estudiantes por class_id":
+        "SELECT id, name FROM students WHERE class_id = :class_id ORDER BY name",
+    "miembro por (class_id, user_id, role)":
+        "SELECT * FROM class_members WHERE class_id = :class_id AND user_id = :user_id AND role = 'teacher'",
+    "historial por grade_id ordenado":
+        "SELECT * FROM grade_histories WHERE grade_id = :grade_id ORDER BY created_at DESC",
+}
+
+
+def create_schema_before_migration(engine):
+    """
+    Crea las tablas de los modelos sin los índices que añade la migración.
+    """
+    metadata = MetaData()
+    for table in User.metadata.sorted_tables:
+        table.to_metadata(metadata)
+    for table in metadata.tables.values():
+        for index in list(table.indexes):
+            if index.name in NEW_INDEXES:
+                table.indexes.discard(index)
+    metadata.create_all(engine)
+
+
+def random_params(rng, stats, students_per_class):
+    class_id = rng.randint(1, stats["classes"])
+    leaves = stats["leaf_categories"][class_id]
+    student_id = (class_id - 1) * students_per_class + rng.randint(1, students_per_class)
+    return {
+        "class_id": class_id,
+        "user_id": class_id,
+        "parent_id": leaves[-1] - 2,
+        "student_id": student_id,
+        "category_id": rng.choice(leaves),
+        "name": rng.choice(["Lectura", "Final", "Comportamiento"]),
+        "grade_id": rng.randint(1, stats["grades"]),
+    }
+
+
+def measure(engine, stats, students_per_class, iterations):
+    results = {}
+    with engine.connect() as connection:
+        for label, sql in QUERIES.items():
+            rng = random.Random(7)
+            params = random_params(rng, stats, students_per_class)
+            plan = connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params).fetchall()
+            start = time.perf_counter()
+            for _ in range(iterations):
+                connection.execute(text(sql), random_params(rng, stats, students_per_class)).fetchall()
+            elapsed = (time.perf_counter() - start) / iterations
+            results[label] = (" | ".join(row[-1] for row in plan), elapsed * 1e6)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--classes", type=int, default=200)
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--history", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'bench_indexes.db')}"
+        engine = create_engine(url)
+        create_schema_before_migration(engine)
+        stats = seed_database(engine, classes=args.classes, students_per_class=args.students, history_per_grade=args.history)
+        print(f"Datos: {stats['classes']} clases, {stats['students']} estudiantes, "
+              f"{stats['grades']} notas, {stats['history']} entradas de historial\n")
+
+        before = measure(engine, stats, args.students, args.iterations)
+
+        alembic_config = Config("alembic.ini")
+        alembic_config.set_main_option("sqlalchemy.url", url)
+        command.stamp(alembic_config, BASE_REVISION)
+        command.upgrade(alembic_config, "head")
+        # Conexiones nuevas para que SQLite no reutilice planes preparados antes de los índices
+        engine.dispose()
+
+        after = measure(engine, stats, args.students, args.iterations)
+        engine.dispose()
+
+    for label in QUERIES:
+        plan_before, time_before = before[label]
+        plan_after, time_after = after[label]
+        print(label)
+        print(f"  antes:   {time_before:9.1f} µs  {plan_before}")
+        print(f"  después: {time_after:9.1f} µs  {plan_after}")
+        print(f"  mejora:  x{time_before / time_after:.1f}\n")
+
+
+if __name__ == "__main__":
+    main()
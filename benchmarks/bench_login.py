@@ -0,0 +1,108 @@
+"""
+Benchmark de latencia durante una avalancha de logins.
+
+Lanza logins concurrentes contra /auth/token mientras otra tarea consulta sin
+parar un endpoint ajeno (GET /) y mide su latencia. Se compara bcrypt dentro
+del event loop (0 hilos, comportamiento anterior) con el pool de bcrypt.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.bench_login --logins 40 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+_directory = tempfile.mkdtemp()
+os.environ["MYSQLDATABASE_URL"] = f"sqlite:///{os.path.join(_directory, 'bench_login.db')}"
+
+import benchmarks.seed  # noqa: E402,F401  (variables de entorno por defecto)
+import httpx  # noqa: E402
+import database  # noqa: E402
+import main  # noqa: E402
+from models import User  # noqa: E402
+from services.passwords import configure_password_pool, pwd_context  # noqa: E402
+
+EMAIL = "profesor@example.com"
+PASSWORD = "Benchmark1!"
+PROBE_INTERVAL = 0.01
+
+
+def create_user():
+    User.metadata.create_all(bind=database.engine)
+    db = database.SessionLocal()
+    db.add(User(
+        username="profesor", email=EMAIL, hashed_password=pwd_context.hash(PASSWORD),
+        is_email_confirmed=True, is_teacher=True,
+    ))
+    db.commit()
+    db.close()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run_scenario(logins, concurrency):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        probe_latencies = []
+        done = asyncio.Event()
+
+        async def probe():
+            # La latencia se mide desde el instante en que la petición debía salir,
+            # así que incluye el tiempo que el event loop tarda en atenderla
+            scheduled = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(max(0, scheduled - time.perf_counter()))
+                await client.get("/")
+                finished = time.perf_counter()
+                probe_latencies.append((finished - scheduled) * 1000)
+                scheduled = max(scheduled + PROBE_INTERVAL, finished)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def login():
+            async with semaphore:
+                response = await client.post("/auth/token", json={"email": EMAIL, "password": PASSWORD})
+                assert response.status_code == 200, response.text
+
+        probe_task = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe_task
+
+    return {
+        "logins_per_second": logins / elapsed,
+        "probes": len(probe_latencies),
+        "p50": statistics.median(probe_latencies),
+        "p99": percentile(probe_latencies, 0.99),
+        "max": max(probe_latencies),
+    }
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    create_user()
+    for workers in (0, args.workers):
+        configure_password_pool(workers)
+        result = asyncio.run(run_scenario(args.logins, args.concurrency))
+        label = "bcrypt en el event loop" if workers == 0 else f"pool de bcrypt ({workers} hilos)"
+        print(f"{label}:")
+        print(f"  logins/s: {result['logins_per_second']:.1f}")
+        print(f"  latencia de GET / con {result['probes']} peticiones: "
+              f"p50 {result['p50']:.1f} ms, p99 {result['p99']:.1f} ms, máx {result['max']:.1f} ms\n")
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,100 @@
+"""
+Utilidades para poblar una base de datos de pruebas con datos realistas
+(clases, profesores, categorías, estudiantes, notas e historial).
+
+Los benchmarks importan los modelos de la aplicación, así que se dan valores
+por defecto a las variables de entorno obligatorias de `config.Settings`.
+"""
+import os
+import random
+from datetime import datetime, timedelta
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("FRONTEND_URL", "http://localhost:3000")
+os.environ.setdefault("LOGO_URL", "http://localhost:3000/logo.png")
+os.environ.setdefault("MYSQLDATABASE_URL", "sqlite:///./benchmark.db")
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from sqlalchemy import insert  # noqa: E402
+from models import User, Class, ClassMember, Category, Student, Grade, GradeHistory  # noqa: E402
+
+TOP_LEVEL_CATEGORIES = ["Comportamiento", "Participación", "Tareas", "Exámenes"]
+SUBCATEGORIES = {"Tareas": ["Lectura", "Escritura"], "Exámenes": ["Parcial", "Final"]}
+CHUNK_SIZE = 5000
+
+
+def _insert_chunked(connection, table, rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        connection.execute(insert(table), rows[start:start + CHUNK_SIZE])
+
+
+def seed_database(engine, classes=100, students_per_class=30, history_per_grade=4, seed=42):
+    """
+    Inserta datos de prueba con inserciones por lotes y devuelve un resumen con
+    los ids generados, útil para elegir parámetros de las consultas medidas.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    users, class_rows, members, categories, students, grades, history = [], [], [], [], [], [], []
+    leaf_categories = {}
+    category_id = student_id = grade_id = history_id = 0
+
+    for class_id in range(1, classes + 1):
+        users.append({
+            "id": class_id, "username": f"profesor{class_id}", "email": f"profesor{class_id}@example.com",
+            "hashed_password": "x", "is_email_confirmed": True, "is_teacher": True,
+        })
+        class_rows.append({"id": class_id, "name": f"Clase {class_id}", "description": ""})
+        members.append({"class_id": class_id, "user_id": class_id, "role": "teacher"})
+
+        leaves = []
+        for name in TOP_LEVEL_CATEGORIES:
+            category_id += 1
+            parent_id = category_id
+            categories.append({"id": parent_id, "class_id": class_id, "parent_id": None, "name": name, "weight": 1.0})
+            children = SUBCATEGORIES.get(name, [])
+            if not children:
+                leaves.append(parent_id)
+            for child in children:
+                category_id += 1
+                categories.append({"id": category_id, "class_id": class_id, "parent_id": parent_id, "name": child, "weight": 1.0})
+                leaves.append(category_id)
+        leaf_categories[class_id] = leaves
+
+        for index in range(students_per_class):
+            student_id += 1
+            students.append({
+                "id": student_id, "name": f"Estudiante {index} de la clase {class_id}",
+                "email": f"estudiante{student_id}@example.com", "class_id": class_id, "is_active": True,
+            })
+            for leaf_id in leaves:
+                grade_id += 1
+                total = 0.0
+                for step in range(history_per_grade):
+                    history_id += 1
+                    change = float(rng.randint(-5, 10))
+                    total += change
+                    history.append({
+                        "id": history_id, "grade_id": grade_id, "change_amount": change,
+                        "current_grade": total, "percentage_change": 100.0,
+                        "created_at": now - timedelta(days=history_per_grade - step, seconds=rng.randint(0, 3600)),
+                        "description": "benchmark",
+                    })
+                grades.append({"id": grade_id, "student_id": student_id, "category_id": leaf_id, "grade": total})
+
+    with engine.begin() as connection:
+        _insert_chunked(connection, User.__table__, users)
+        _insert_chunked(connection, Class.__table__, class_rows)
+        _insert_chunked(connection, ClassMember.__table__, members)
+        _insert_chunked(connection, Category.__table__, categories)
+        _insert_chunked(connection, Student.__table__, students)
+        _insert_chunked(connection, Grade.__table__, grades)
+        _insert_chunked(connection, GradeHistory.__table__, history)
+
+    return {
+        "classes": classes,
+        "students": student_id,
+        "grades": grade_id,
+        "history": history_id,
+        "leaf_categories": leaf_categories,
+    }
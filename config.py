@@ -12,5 +12,59 @@ class Settings:
     SSL_KEYFILE = config("SSL_KEYFILE", default=None)
     USE_HTTPS = ENVIRONMENT == "production"
     SQLALCHEMY_DATABASE_URL = config("MYSQLDATABASE_URL")
+    DB_POOL_SIZE = config("DB_POOL_SIZE", cast=int, default=5)
+    DB_MAX_OVERFLOW = config("DB_MAX_OVERFLOW", cast=int, default=10)
+    DB_POOL_TIMEOUT_SECONDS = config("DB_POOL_TIMEOUT_SECONDS", cast=float, default=30)
+    DB_POOL_RECYCLE_SECONDS = config("DB_POOL_RECYCLE_SECONDS", cast=int, default=1800)
+    DB_POOL_PRE_PING = config("DB_POOL_PRE_PING", cast=bool, default=True)
+    DB_SLOW_QUERY_MS = config("DB_SLOW_QUERY_MS", cast=int, default=500)
+    DB_QUERY_HEADERS = config("DB_QUERY_HEADERS", cast=bool, default=ENVIRONMENT != "production")  # X-DB-Queries / X-DB-Time
+    DB_QUERY_WARN_THRESHOLD = config("DB_QUERY_WARN_THRESHOLD", cast=int, default=50)
+    DB_N_PLUS_ONE_THRESHOLD = config("DB_N_PLUS_ONE_THRESHOLD", cast=int, default=10)
+    METRICS_TOKEN = config("METRICS_TOKEN", default=None)  # /metrics y /api/chat/metrics exigen "Authorization: Bearer <token>"; sin él, solo fuera de producción
+    DB_ASYNC_ENABLED = config("DB_ASYNC_ENABLED", cast=bool, default=False)
+    DB_ASYNC_MYSQL_DRIVER = config("DB_ASYNC_MYSQL_DRIVER", default="aiomysql")  # "aiomysql" o "asyncmy"
+    ASYNC_DATABASE_URL = config("ASYNC_DATABASE_URL", default=None)
+    USER_CACHE_TTL_SECONDS = config("USER_CACHE_TTL_SECONDS", cast=int, default=60)
+    USER_CACHE_MAX_SIZE = config("USER_CACHE_MAX_SIZE", cast=int, default=10000)
+    # Dónde se marcan los usuarios invalidados (cambio de contraseña, confirmación...):
+    # "memory" solo vale con un único worker; con varios, "redis" para que todos lo vean
+    USER_CACHE_BACKEND = config("USER_CACHE_BACKEND", default="memory")  # "memory" o "redis"
+    USER_CACHE_REDIS_URL = config("USER_CACHE_REDIS_URL", default=None)  # por defecto, CHAT_SESSION_REDIS_URL
+    PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS", cast=int, default=4)
+    LLM_TIMEOUT_SECONDS = config("LLM_TIMEOUT_SECONDS", cast=float, default=30)
+    LLM_MAX_CONCURRENCY = config("LLM_MAX_CONCURRENCY", cast=int, default=8)
+    CHAT_SESSION_MAX_SESSIONS = config("CHAT_SESSION_MAX_SESSIONS", cast=int, default=500)
+    CHAT_SESSION_IDLE_TTL_SECONDS = config("CHAT_SESSION_IDLE_TTL_SECONDS", cast=int, default=1800)
+    CHAT_SESSION_MEMORY_BUDGET_MB = config("CHAT_SESSION_MEMORY_BUDGET_MB", cast=int, default=64)
+    CHAT_SESSION_BACKEND = config("CHAT_SESSION_BACKEND", default="memory")  # "memory" o "redis"
+    CHAT_SESSION_REDIS_URL = config("CHAT_SESSION_REDIS_URL", default=None)
+    CHAT_CONTEXT_MAX_TOKENS = config("CHAT_CONTEXT_MAX_TOKENS", cast=int, default=2000)
+    CHAT_CONTEXT_MAX_UPDATES = config("CHAT_CONTEXT_MAX_UPDATES", cast=int, default=50)
+    NAME_INDEX_TTL_SECONDS = config("NAME_INDEX_TTL_SECONDS", cast=int, default=300)
+    NAME_INDEX_MAX_CLASSES = config("NAME_INDEX_MAX_CLASSES", cast=int, default=1000)
+    DASHBOARD_CACHE_TTL_SECONDS = config("DASHBOARD_CACHE_TTL_SECONDS", cast=int, default=600)
+    DASHBOARD_CACHE_MAX_ENTRIES = config("DASHBOARD_CACHE_MAX_ENTRIES", cast=int, default=5000)
+    AUDIO_MAX_UPLOAD_MB = config("AUDIO_MAX_UPLOAD_MB", cast=int, default=20)
+    AUDIO_INLINE_MAX_MB = config("AUDIO_INLINE_MAX_MB", cast=int, default=4)  # por encima, API de ficheros de Gemini
+    AUDIO_UPLOAD_TIMEOUT_SECONDS = config("AUDIO_UPLOAD_TIMEOUT_SECONDS", cast=float, default=60)
+    GRADE_EVENTS_BACKEND = config("GRADE_EVENTS_BACKEND", default="memory")  # "memory" o "redis"
+    GRADE_EVENTS_REDIS_URL = config("GRADE_EVENTS_REDIS_URL", default=None)  # por defecto, CHAT_SESSION_REDIS_URL
+    GRADE_EVENTS_HISTORY_SIZE = config("GRADE_EVENTS_HISTORY_SIZE", cast=int, default=100)
+    GRADE_EVENTS_QUEUE_SIZE = config("GRADE_EVENTS_QUEUE_SIZE", cast=int, default=100)
+    GRADE_EVENTS_HEARTBEAT_SECONDS = config("GRADE_EVENTS_HEARTBEAT_SECONDS", cast=float, default=15)
+    SMTP_SERVER = config("SMTP_SERVER", default="localhost")
+    SMTP_PORT = config("SMTP_PORT", cast=int, default=587)
+    SMTP_STARTTLS = config("SMTP_STARTTLS", cast=bool, default=True)
+    SMTP_TIMEOUT_SECONDS = config("SMTP_TIMEOUT_SECONDS", cast=float, default=30)
+    SMTP_IDLE_SECONDS = config("SMTP_IDLE_SECONDS", cast=float, default=60)  # cerrar la conexión reutilizada tras este tiempo sin uso
+    EMAIL_USER = config("EMAIL_USER", default="")  # sin usuario no se hace login (p. ej. un SMTP local de pruebas)
+    EMAIL_PASS = config("EMAIL_PASS", default="")
+    EMAIL_FROM = config("EMAIL_FROM", default=None)  # por defecto, EMAIL_USER
+    EMAIL_OUTBOX_ENABLED = config("EMAIL_OUTBOX_ENABLED", cast=bool, default=True)  # worker de envío en este proceso
+    EMAIL_BATCH_SIZE = config("EMAIL_BATCH_SIZE", cast=int, default=20)
+    EMAIL_MAX_ATTEMPTS = config("EMAIL_MAX_ATTEMPTS", cast=int, default=6)
+    EMAIL_RETRY_BASE_SECONDS = config("EMAIL_RETRY_BASE_SECONDS", cast=float, default=30)
+    EMAIL_POLL_SECONDS = config("EMAIL_POLL_SECONDS", cast=float, default=10)
 
 settings = Settings()
\ No newline at end of file
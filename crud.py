@@ -1,22 +1,19 @@
 # crud.py
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
 from models import User
 from sqlalchemy.exc import NoResultFound
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from services.user_cache import invalidate_user
+from services.passwords import pwd_context, hash_password
 
 # Check if the username exists
 
 def get_user_by_username(db: Session, username: str):
-    user = db.query(User).filter(User.username == username).first()
-    print(f"Buscando usuario: {username}, Resultado: {user}")
-    return user
+    return db.query(User).filter(User.username == username).first()
 def get_user_by_email(db: Session, email: str):
     return db.query(User).filter(User.email == email).first()
 
 def create_user(db: Session, username: str, email: str, password: str, confirmation_code: str):
-    hashed_password = pwd_context.hash(password)
+    hashed_password = hash_password(password)
     new_user = User(
         username=username,
         email=email,
@@ -38,3 +35,4 @@ def activate_user(db: Session, user: User):
     user.is_email_confirmed = True
     db.commit()
     db.refresh(user)
+    invalidate_user(user.id)
@@ -1,6 +1,8 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from starlette.concurrency import run_in_threadpool
 from config import settings
+from services.db_metrics import instrument_engine, InstrumentedQueuePool, InstrumentedAsyncAdaptedQueuePool
 
 # Obtener la URL de la base de datos desde config.py
 DATABASE_URL = settings.SQLALCHEMY_DATABASE_URL
@@ -9,16 +11,119 @@ DATABASE_URL = settings.SQLALCHEMY_DATABASE_URL
 if DATABASE_URL.startswith("mysql://"):
     DATABASE_URL = DATABASE_URL.replace("mysql://", "mysql+pymysql://")
 
+# Drivers asíncronos equivalentes a los síncronos
+ASYNC_DRIVERS = {
+    "mysql+pymysql": f"mysql+{settings.DB_ASYNC_MYSQL_DRIVER}",
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def to_async_url(url: str) -> str:
+    """
+    Convierte la URL síncrona en la del driver asíncrono equivalente
+    (mysql+pymysql -> mysql+aiomysql, sqlite -> sqlite+aiosqlite).
+    """
+    scheme, _, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+
+def pool_options(url: str, pool_class) -> dict:
+    """
+    Parámetros del pool de conexiones definidos en config.py, con un pool
+    instrumentado (services/db_metrics.py). Las bases de datos SQLite en memoria
+    usan el pool por defecto de SQLAlchemy y solo reciben pre-ping y reciclado.
+    """
+    options = {
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+    }
+    if ":memory:" not in url and not url.endswith(":///") and not url.endswith("://"):
+        options.update(
+            poolclass=pool_class,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        )
+    return options
+
+
 # Crear la conexión con SQLAlchemy
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
+    **pool_options(DATABASE_URL, InstrumentedQueuePool),
+)
+instrument_engine(engine, "sync")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+ASYNC_DATABASE_URL = settings.ASYNC_DATABASE_URL or to_async_url(DATABASE_URL)
+
+# El motor asíncrono se crea al usarlo por primera vez: así el driver
+# (aiomysql/asyncmy/aiosqlite) solo hace falta si se activa DB_ASYNC_ENABLED.
+async_engine = None
+AsyncSessionLocal = None
+
+
+def get_async_engine():
+    global async_engine, AsyncSessionLocal
+    if async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+        async_engine = create_async_engine(
+            ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL, InstrumentedAsyncAdaptedQueuePool)
+        )
+        instrument_engine(async_engine.sync_engine, "async")
+        AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+    return async_engine
+
 # Dependencia para obtener la sesión de la base de datos
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Dependencia para obtener una sesión asíncrona
+async def get_async_db():
+    get_async_engine()
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Dependencia para endpoints async: sesión asíncrona si DB_ASYNC_ENABLED está
+# activo y, si no, la síncrona de siempre (que se usa a través de run_db)
+async def get_request_db():
+    if settings.DB_ASYNC_ENABLED:
+        async for db in get_async_db():
+            yield db
+    else:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
+
+
+async def release_db(db):
+    """
+    Termina la transacción de lectura en curso para devolver la conexión al pool
+    antes de una espera larga (p. ej. la respuesta del modelo).
+    """
+    if hasattr(db, "run_sync"):
+        await db.rollback()
+    else:
+        await run_in_threadpool(db.rollback)
+
+
+async def run_db(db, func, *args):
+    """
+    Ejecuta código ORM síncrono (`func(session, *args)`) desde un endpoint async
+    sin bloquear el event loop: con una AsyncSession mediante run_sync y con una
+    Session síncrona en el threadpool.
+    """
+    if hasattr(db, "run_sync"):
+        return await db.run_sync(func, *args)
+    return await run_in_threadpool(func, db, *args)
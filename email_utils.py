@@ -1,8 +1,7 @@
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from typing import Tuple
+from sqlalchemy.orm import Session
 from config import settings
-from decouple import config
+from services.email_outbox import queue_email
 
 frontend_url = settings.FRONTEND_URL
 
@@ -71,90 +70,55 @@ def format_email(message: str):
     return html_content
 
 
-
-
-def send_confirmation_email(to_email: str, confirmation_code: str):
-
-    sender_email = config("EMAIL_USER")
-    sender_password = config("EMAIL_PASS")
-    smtp_server = config("SMTP_SERVER")
-    smtp_port = config("SMTP_PORT")
-
-    try:
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(sender_email, sender_password)
-            message = f"""<div class="email-header">Verifica tu correo electrónico</div>
-            <div class="email-text">
-                Necesitamos verificar tu dirección de correo electrónico <strong>{to_email}</strong> antes de que puedas acceder a tu cuenta.
-                Ingresa el código a continuación en tu ventana del navegador.
-            </div>
-            <div class="verification-code">{confirmation_code}</div>
-            <div class="email-footer">
-                Este código expira en 10 minutos.<br>
-                Si no te registraste en este servicio, puedes ignorar este correo.
-            </div>"""
-        
-            html_content = format_email(message)
-
-            # Configuración del mensaje
-            msg = MIMEMultipart("alternative")
-            msg["Subject"] = "Verify your email address"
-            msg["From"] = sender_email
-            msg["To"] = to_email
-            msg.attach(MIMEText(html_content, "html"))
-
-            server.sendmail(sender_email, to_email, msg.as_string())  # Enviar email
-        print("Email enviado correctamente.")
-        return True
-    except Exception as e:
-        print(f"Error al enviar el correo: {e}")
-        return False 
-
-
-
-
-def send_recovery_email(to_email: str, token: str):
+def confirmation_email(to_email: str, confirmation_code: str) -> Tuple[str, str]:
     """
-    Send a password recovery email to the user.
+    Asunto y cuerpo HTML del correo con el código de confirmación.
     """
-    sender_email = config("EMAIL_USER")
-    sender_password = config("EMAIL_PASS")
-    smtp_server = config("SMTP_SERVER")
-    smtp_port = config("SMTP_PORT")
-
-    try:
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(sender_email, sender_password)
-            message = f"""<div class="email-header">Recuperación de contraseña</div>
-            <div class="email-text">
-                Para recuperar tu contraseña, haz clic en el enlace a continuación:
-            </div>
-            <div class="email-text">
-                <a href="{frontend_url}/password-recovery?token={token}" style="color: #0066cc; text-decoration: underline;">
-                    Haz clic aquí para restablecer tu contraseña
-                </a>
-            </div>
-            <div class="email-footer">
-                Este enlace expira en 10 minutos.<br>
-                Si no solicitaste recuperar tu contraseña, puedes ignorar este correo.
-            </div>"""
-        
-            html_content = format_email(message)
-
-            # Configuración del mensaje
-            msg = MIMEMultipart("alternative")
-            msg["Subject"] = "Recovery password"
-            msg["From"] = sender_email
-            msg["To"] = to_email
-            msg.attach(MIMEText(html_content, "html"))
+    message = f"""<div class="email-header">Verifica tu correo electrónico</div>
+    <div class="email-text">
+        Necesitamos verificar tu dirección de correo electrónico <strong>{to_email}</strong> antes de que puedas acceder a tu cuenta.
+        Ingresa el código a continuación en tu ventana del navegador.
+    </div>
+    <div class="verification-code">{confirmation_code}</div>
+    <div class="email-footer">
+        Este código expira en 10 minutos.<br>
+        Si no te registraste en este servicio, puedes ignorar este correo.
+    </div>"""
+    return "Verify your email address", format_email(message)
+
+
+def recovery_email(token: str) -> Tuple[str, str]:
+    """
+    Asunto y cuerpo HTML del correo de recuperación de contraseña.
+    """
+    message = f"""<div class="email-header">Recuperación de contraseña</div>
+    <div class="email-text">
+        Para recuperar tu contraseña, haz clic en el enlace a continuación:
+    </div>
+    <div class="email-text">
+        <a href="{frontend_url}/password-recovery?token={token}" style="color: #0066cc; text-decoration: underline;">
+            Haz clic aquí para restablecer tu contraseña
+        </a>
+    </div>
+    <div class="email-footer">
+        Este enlace expira en 10 minutos.<br>
+        Si no solicitaste recuperar tu contraseña, puedes ignorar este correo.
+    </div>"""
+    return "Recovery password", format_email(message)
+
+
+def send_confirmation_email(db: Session, to_email: str, confirmation_code: str):
+    """
+    Deja el correo de confirmación en la cola de salida; se envía cuando la
+    sesión hace commit (services/email_outbox.py).
+    """
+    subject, html_content = confirmation_email(to_email, confirmation_code)
+    return queue_email(db, to_email, subject, html_content)
 
-            server.sendmail(sender_email, to_email, msg.as_string())  # Enviar email
-        print("Email enviado correctamente.")
-        return True
-    except Exception as e:
-        print(f"Error al enviar el correo: {e}")
-        return False
 
-    
\ No newline at end of file
+def send_recovery_email(db: Session, to_email: str, token: str):
+    """
+    Deja el correo de recuperación en la cola de salida.
+    """
+    subject, html_content = recovery_email(token)
+    return queue_email(db, to_email, subject, html_content)
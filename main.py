@@ -1,6 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routers import user, auth, chat, classes, students  # Import modularized routers
+from starlette.concurrency import run_in_threadpool
+from routers import user, auth, chat, classes, students, students_async  # Import modularized routers
+from config import settings
+from services.db_metrics import db_metrics
+from services.query_counter import QueryCounterMiddleware
+from services.request_limits import BodySizeLimitMiddleware, MiB
+from services.email_outbox import email_outbox
 import models
 import database
 import logging
@@ -11,6 +18,14 @@ import os
 # ---- Application Initialization ----
 app = FastAPI()
 
+# Tamaño máximo de los audios del chat, comprobado mientras se suben (1 MB extra para el resto del formulario).
+# Se añade antes que CORS para que el 413 también lleve sus cabeceras.
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits={"/api/chat/audio": settings.AUDIO_MAX_UPLOAD_MB * MiB},
+    overhead=MiB,
+)
+
 # CORS Middleware
 app.add_middleware(
     CORSMiddleware,
@@ -21,13 +36,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Permitir todos los métodos HTTP (GET, POST, PUT, DELETE, etc.)
     allow_headers=["*"],  # Permitir todos los encabezados
+    expose_headers=["X-DB-Queries", "X-DB-Time"],
 )
 
+# Número de consultas y tiempo de base de datos por petición (y aviso de N+1 en el log)
+app.add_middleware(QueryCounterMiddleware, add_headers=settings.DB_QUERY_HEADERS)
+
 # Include Routers
 app.include_router(user.router, prefix="/users", tags=["users"])
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(chat.router, prefix="/api", tags=["chat"])
 app.include_router(classes.router, prefix="/classes", tags=["classes"])
+if settings.DB_ASYNC_ENABLED:
+    # Las variantes asíncronas se registran antes para que atiendan sus rutas
+    app.include_router(students_async.router, prefix="/students", tags=["students"])
 app.include_router(students.router, prefix="/students", tags=["students"])
 
 # Crear las tablas cuando la aplicación arranque
@@ -36,6 +58,15 @@ def startup():
     print("🔹 Creando tablas en la base de datos (si no existen)...")
     models.Base.metadata.create_all(bind=database.engine)
     print("✅ Tablas creadas.")
+    if settings.EMAIL_OUTBOX_ENABLED:
+        email_outbox.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    # stop() espera al hilo y cierra la conexión SMTP: fuera del event loop
+    await run_in_threadpool(email_outbox.stop)
+    if database.async_engine is not None:
+        await database.async_engine.dispose()
 
 
 logger = logging.getLogger('uvicorn.error')
@@ -46,6 +77,14 @@ def read_root():
     logger.debug("GET request to / endpoint")
     return {"message": "Welcome to the API!"}
 
+# ---- Metrics Endpoint ----
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(auth.require_metrics_token)])
+def metrics():
+    """
+    Métricas del pool de conexiones y de las consultas en formato Prometheus.
+    """
+    return PlainTextResponse(db_metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8080))  # Usa el puerto asignado por Railway
     uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
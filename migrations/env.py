@@ -43,6 +43,8 @@ def run_migrations_online():
         # Validar claves foráneas antes de migrar
         if connection.dialect.name == "sqlite":
             connection.exec_driver_sql("PRAGMA foreign_keys=ON")
+            # Cerrar la transacción implícita del PRAGMA para que Alembic confirme la migración
+            connection.commit()
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
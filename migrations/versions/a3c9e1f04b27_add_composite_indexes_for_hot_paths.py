@@ -0,0 +1,72 @@
+"""add composite indexes for hot paths
+
+Revision ID: a3c9e1f04b27
+Revises: 6de48f9f52d1
+Create Date: 2026-10-17 10:12:41.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c9e1f04b27'
+down_revision: Union[str, None] = '6de48f9f52d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def merge_duplicate_grades() -> None:
+    """
+    Fusiona las notas duplicadas (mismo estudiante y categoría) antes de crear
+    la restricción única: se conserva la de menor id con la suma de los puntos
+    y se le reasigna el historial de las demás.
+    """
+    connection = op.get_bind()
+    duplicates = connection.execute(sa.text(
+        "SELECT student_id, category_id FROM grades "
+        "GROUP BY student_id, category_id HAVING COUNT(*) > 1"
+    )).fetchall()
+
+    for student_id, category_id in duplicates:
+        rows = connection.execute(
+            sa.text(
+                "SELECT id, grade FROM grades "
+                "WHERE student_id = :student_id AND category_id = :category_id ORDER BY id"
+            ),
+            {"student_id": student_id, "category_id": category_id},
+        ).fetchall()
+        keep_id = rows[0][0]
+        total = sum(row[1] for row in rows)
+        for duplicate_id, _ in rows[1:]:
+            connection.execute(
+                sa.text("UPDATE grade_histories SET grade_id = :keep_id WHERE grade_id = :duplicate_id"),
+                {"keep_id": keep_id, "duplicate_id": duplicate_id},
+            )
+            connection.execute(sa.text("DELETE FROM grades WHERE id = :duplicate_id"), {"duplicate_id": duplicate_id})
+        connection.execute(
+            sa.text("UPDATE grades SET grade = :total WHERE id = :keep_id"),
+            {"total": total, "keep_id": keep_id},
+        )
+
+
+def upgrade() -> None:
+    merge_duplicate_grades()
+
+    # Índice único en lugar de restricción para no recrear `grades` en SQLite
+    # (con las claves foráneas activas, recrearla borraría el historial en cascada)
+    op.create_index('unique_grade_per_student_category', 'grades', ['student_id', 'category_id'], unique=True)
+    op.create_index('ix_categories_class_id_parent_id', 'categories', ['class_id', 'parent_id'], unique=False)
+    op.create_index('ix_categories_name', 'categories', ['name'], unique=False)
+    op.create_index('ix_class_members_class_user_role', 'class_members', ['class_id', 'user_id', 'role'], unique=False)
+    op.create_index('ix_grade_histories_grade_id_created_at', 'grade_histories', ['grade_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_grade_histories_grade_id_created_at', table_name='grade_histories')
+    op.drop_index('ix_class_members_class_user_role', table_name='class_members')
+    op.drop_index('ix_categories_name', table_name='categories')
+    op.drop_index('ix_categories_class_id_parent_id', table_name='categories')
+    op.drop_index('unique_grade_per_student_category', table_name='grades')
@@ -0,0 +1,28 @@
+"""add class scoped name indexes
+
+Revision ID: c71d2b9e5a13
+Revises: a3c9e1f04b27
+Create Date: 2026-10-17 16:40:08.271935
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c71d2b9e5a13'
+down_revision: Union[str, None] = 'a3c9e1f04b27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_categories_class_id_name', 'categories', ['class_id', 'name'], unique=False)
+    op.create_index('ix_students_class_id_name', 'students', ['class_id', 'name'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_students_class_id_name', table_name='students')
+    op.drop_index('ix_categories_class_id_name', table_name='categories')
@@ -0,0 +1,29 @@
+"""add data version to classes
+
+Revision ID: e4f28a6c9d10
+Revises: c71d2b9e5a13
+Create Date: 2026-10-17 22:40:12.508311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4f28a6c9d10'
+down_revision: Union[str, None] = 'c71d2b9e5a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('classes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    # DROP COLUMN directo (SQLite >= 3.35) en lugar de recrear `classes`: con las
+    # claves foráneas activas, recrearla borraría en cascada sus alumnos y notas
+    op.drop_column('classes', 'data_version')
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, Float, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
@@ -35,6 +35,8 @@ class Class(Base):
     isInvitationCodeEnabled = Column(Boolean, default=False)
     inviteLink = Column(String, nullable=True)
     inviteCode = Column(String, nullable=True)
+    # Se incrementa con cada escritura de la clase; sirve de ETag para las lecturas
+    data_version = Column(Integer, nullable=False, default=0, server_default="0")
     # Relación con `ClassMember`
     members = relationship("ClassMember", back_populates="class_ref", cascade="all, delete-orphan")
 
@@ -57,6 +59,7 @@ class ClassMember(Base):
     # Relaciones
     user = relationship("User", back_populates="class_memberships")
     class_ref = relationship("Class", back_populates="members")
+    __table_args__ = (Index("ix_class_members_class_user_role", "class_id", "user_id", "role"),)
 
 
 # Tabla de categorías de evaluación
@@ -80,6 +83,11 @@ class Category(Base):
     subcategories = relationship("Category", back_populates="parent_category", cascade="all, delete-orphan")
     # Relación con `Grade`
     grades = relationship("Grade", back_populates="category_ref", cascade="all, delete-orphan")
+    __table_args__ = (
+        Index("ix_categories_class_id_parent_id", "class_id", "parent_id"),
+        Index("ix_categories_name", "name"),
+        Index("ix_categories_class_id_name", "class_id", "name"),
+    )
 
 
 # Tabla de notas
@@ -105,46 +113,17 @@ class Grade(Base):
     student_ref = relationship("Student", back_populates="grades")
     category_ref = relationship("Category", back_populates="grades")
     history = relationship("GradeHistory", back_populates="grade_ref", cascade="all, delete-orphan")
+    # Una sola nota por estudiante y categoría (sirve también de índice para las búsquedas)
+    __table_args__ = (Index("unique_grade_per_student_category", "student_id", "category_id", unique=True),)
 
     @staticmethod
     def add_grade(session, student_id, category_id, grade_value, description=None):
         """
         Agrega una nueva nota para un estudiante y registra el cambio en el historial.
         """
-        # Buscar o crear la nota
-        grade = session.query(Grade).filter_by(student_id=student_id, category_id=category_id).first()
-        if not grade:
-            grade = Grade(
-                student_id=student_id,
-                category_id=category_id,
-                grade=0  # Inicialmente en 0, luego se sumarán los puntos
-            )
-            session.add(grade)
-            session.commit()
-
-        # Calcular el nuevo total
-        previous_grade = grade.grade
-        new_grade = previous_grade + grade_value
-        grade.grade = new_grade
-        grade.updated_at = func.now()
-
-        # Calcular el porcentaje de cambio
-        percentage_change = (
-            (grade_value / previous_grade) * 100 if previous_grade != 0 else 100
-        )
-
-        # Registrar el cambio en el historial
-        history_entry = GradeHistory(
-            grade_id=grade.id,
-            change_amount=grade_value,
-            current_grade=new_grade,
-            percentage_change=percentage_change,
-            description=description
-        )
-        session.add(history_entry)
-
-        session.commit()
-        return {"student_id": student_id, "category_id": category_id, "total_grade": new_grade, "percentage_change": percentage_change}
+        from services.grades import apply_grade_changes
+
+        return apply_grade_changes(session, category_id, [student_id], grade_value, description=description)[0]
 
 
 
@@ -191,7 +170,10 @@ class Student(Base):
     class_ref = relationship("Class", back_populates="students")
     grades = relationship("Grade", back_populates="student_ref", cascade="all, delete-orphan")
     is_active = Column(Boolean, default=False)  # Marcar si el estudiante completó el registro
-    __table_args__ = (UniqueConstraint("name", "class_id", name="unique_name_per_class"),)
+    __table_args__ = (
+        UniqueConstraint("name", "class_id", name="unique_name_per_class"),
+        Index("ix_students_class_id_name", "class_id", "name"),
+    )
 
 class GradeHistory(Base):
     __tablename__ = "grade_histories"
@@ -206,6 +188,25 @@ class GradeHistory(Base):
 
     # Relación con `Grade`
     grade_ref = relationship("Grade", back_populates="history")
+    __table_args__ = (Index("ix_grade_histories_grade_id_created_at", "grade_id", "created_at"),)
+
+
+# Cola de correos pendientes de enviar (services/email_outbox.py)
+class OutboxEmail(Base):
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    to_email = Column(String(255), nullable=False)
+    subject = Column(String(255), nullable=False)
+    html_body = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # "pending", "sent" o "failed"
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)  # UTC, como locked_until y sent_at
+    locked_until = Column(DateTime, nullable=True)  # Reservado por un worker hasta esta fecha
+    last_error = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    sent_at = Column(DateTime, nullable=True)
+    __table_args__ = (Index("ix_email_outbox_status_next_attempt_at", "status", "next_attempt_at"),)
 
 
 from database import engine, Base
@@ -1,27 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Header, status, BackgroundTasks
 from datetime import datetime, timedelta
 from typing import Union
 import jwt
 from fastapi import Depends, HTTPException, status, BackgroundTasks
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 from decouple import config
 import smtplib
 from email.mime.text import MIMEText
 import crud
-from database import get_db
+from database import get_db, run_db
 from models import User
 from pydantic import BaseModel
 from config import settings
+from services.user_cache import CurrentUser, user_cache
+from services.passwords import pwd_context, verify_password_async
+from services.passwords import verify_password as verify_password_in_pool
 
 router = APIRouter()
 
 
 
-# Encryption context for passwords
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # OAuth2PasswordBearer for token-based authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
@@ -32,15 +31,17 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verify if a plain password matches its hashed version.
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    return verify_password_in_pool(plain_password, hashed_password)
 
 
-def authenticate_user(db: Session, email: str, password: str):
+async def authenticate_user(db: Session, email: str, password: str):
     """
     Authenticate the user by email and verify the password.
+    The lookup runs in the threadpool and bcrypt in the password pool, so
+    logins don't block the event loop.
     """
-    user = crud.get_user_by_email(db, email)
-    if not user or not verify_password(password, user.hashed_password) or not user.is_email_confirmed:
+    user = await run_db(db, crud.get_user_by_email, email)
+    if not user or not await verify_password_async(password, user.hashed_password) or not user.is_email_confirmed:
         return None
     return user
 
@@ -52,17 +53,19 @@ def create_access_token(data: dict, expires_delta: timedelta) -> str:
     Generate a JWT access token with expiration.
     """
     to_encode = data.copy()
-    expire = datetime.utcnow() + expires_delta
-    to_encode.update({"exp": expire})
+    now = datetime.utcnow()
+    to_encode.update({"exp": now + expires_delta, "iat": now})
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
     
    
 # ---- Token Verification ----
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> CurrentUser:
     """
     Dependency to get the current user from a JWT token.
+    The user is served from the token claims or the user cache when possible,
+    so most requests never query the users table.
     """
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
@@ -74,6 +77,17 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
                 detail="Credenciales incorrectas",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+        if user_id is not None:
+            cached_user = user_cache.get(user_id)
+            if cached_user is not None and cached_user.email == email:
+                return cached_user
+            # Access tokens are only issued to confirmed users, so their claims can be
+            # trusted unless the user changed after the token was issued
+            claims_user = CurrentUser.from_claims(payload)
+            if claims_user is not None and not user_cache.invalidated_since(claims_user.id, payload.get("iat")):
+                user_cache.set(claims_user)
+                return claims_user
+
         user = crud.get_user_by_email(db, email)
         if user is None or not user.is_email_confirmed:
             raise HTTPException(
@@ -81,7 +95,9 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
                 detail="Usuario no encontrado o cuenta no activada",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        return user
+        current_user = CurrentUser.from_model(user)
+        user_cache.set(current_user)
+        return current_user
     except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -96,13 +112,27 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         )
 
 
+# ---- Metrics ----
+
+def require_metrics_token(authorization: str = Header(None)) -> None:
+    """
+    Dependency for the metrics endpoints: they require "Authorization: Bearer
+    <METRICS_TOKEN>". Without METRICS_TOKEN they are only open outside production.
+    """
+    if settings.METRICS_TOKEN:
+        if authorization != f"Bearer {settings.METRICS_TOKEN}":
+            raise HTTPException(status_code=401, detail="No autorizado")
+    elif settings.ENVIRONMENT == "production":
+        raise HTTPException(status_code=401, detail="No autorizado")
+
+
 # ---- Login for Access Token ----
 
 async def login_for_access_token(email: str, password: str, db: Session):
     """
     Validate user credentials and return an access token.
     """
-    user = authenticate_user(db, email, password)
+    user = await authenticate_user(db, email, password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
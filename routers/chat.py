@@ -1,83 +1,271 @@
 from fastapi import APIRouter, UploadFile, Form, File, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from routers.students import get_students_by_class  # Asegúrate de que esta ruta sea correcta
-from database import get_db  # Tu archivo de configuración de base de datos
-from services.google_api_v2 import create_chat_session_with_context, get_gemini_response, get_gemini_audio_response  # Importar funciones de google_api_v2
+from database import get_request_db, run_db, release_db  # Tu archivo de configuración de base de datos
+from services.google_api_v2 import create_chat_session_with_context, get_gemini_response, stream_gemini_response, get_gemini_audio_response, LLMTimeoutError  # Importar funciones de google_api_v2
+import asyncio
 import re
-from routers.students import update_grades  # Importa el endpoint directamente
+from contextlib import aclosing
+from routers.students import update_class_grades  # Importa el endpoint directamente
 from schemas import UpdateGradesRequest
 from typing import List, Union, Optional
 from routers.classes import get_user_classes
-from routers.auth import get_current_user
+from routers.auth import get_current_user, require_metrics_token
 from models import User
+from config import settings
+from services.chat_sessions import ChatSessionStore, create_session_backend
+from services.google_api_v2 import serialize_chat_session, restore_chat_session, append_exchange
+from services.response_cache import dashboard_answers, context_hash
+from services.class_context import build_class_context, load_class_context, build_dashboard_context, with_context_updates
+from services.command_parser import parse_local_command, StreamingCommandDetector
+from services.grade_events import format_sse
+from services.audio_upload import receive_audio, AudioTooLargeError, UnsupportedAudioError
+from services.name_index import get_name_index
+import logging
 router = APIRouter()
 
+# Las respuestas y órdenes del chat llevan nombres y notas de estudiantes: solo en el nivel debug
+logger = logging.getLogger('uvicorn.error')
+
 # Modelo para la solicitud de chat
 class ChatRequest(BaseModel):
     message: str
     state: str  # "in_class" o "in_dashboard"
     class_id: Optional[int]  # Puede ser un único `class_id`
 
-# Diccionario para almacenar sesiones de chat por clase
-chat_sessions_in_class = {}
-chat_sessions_in_dashboard = {}
+# Sesiones de chat por usuario y clase ("class:<user>:<class>") o por usuario en el dashboard ("dashboard:<user>")
+chat_sessions = ChatSessionStore(
+    max_sessions=settings.CHAT_SESSION_MAX_SESSIONS,
+    idle_ttl_seconds=settings.CHAT_SESSION_IDLE_TTL_SECONDS,
+    memory_budget_bytes=settings.CHAT_SESSION_MEMORY_BUDGET_MB * 1024 * 1024,
+    backend=create_session_backend(),
+    serialize=serialize_chat_session,
+    restore=restore_chat_session,
+)
 
 @router.post("/chat")
-async def chat_with_gemini(request: ChatRequest, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+async def chat_with_gemini(request: ChatRequest, db: Session = Depends(get_request_db), user: User = Depends(get_current_user)):
         is_teacher = user.is_teacher
         try:
             if not is_teacher:
                 return {"response": "El usuario no es un profesor."}
             elif is_teacher:
                     if request.state == "in_class":
-                        # Obtener los datos de la clase
-                        class_data = get_students_by_class(request.class_id, db, user)
-
-                        if (user.id, request.class_id) not in chat_sessions_in_class:
-                            chat_sessions_in_class[user.id, request.class_id] = create_chat_session_with_context(request.state,class_data)
+                        # Las órdenes sencillas de notas se ejecutan sin pasar por el modelo
+                        local_response = await run_db(db, lambda session: run_local_command(request.message, request.class_id, session, user))
+                        if local_response is not None:
+                            return {"response": local_response, "update_required": True}
 
-                        # Recuperar la sesión existente
-                        chat_session = chat_sessions_in_class[user.id, request.class_id]
+                        session_key, chat_session, message, context_version = await open_class_session(request, db, user)
 
-                        # Enviar el mensaje al modelo Gemini
-                        response = await get_gemini_response(chat_session, request.message)
-                        print("Respuesta completa:", response)
+                        # Enviar el mensaje al modelo Gemini sin retener la conexión mientras responde
+                        await release_db(db)
+                        response = await get_gemini_response(chat_session, message)
+                        chat_session.context_version = context_version
+                        await chat_sessions.put_async(session_key, chat_session)
+                        logger.debug("Respuesta completa: %s", response)
                         # Intentar analizar si la respuesta es un comando
                         command = parse_response_to_upgrade_command(response)
                         update_required = False
 
                         if command is not None:
-                            print("Comando detectado:", command)
+                            logger.debug("Comando detectado: %s", command)
                             try:
-                                dummy = execute_upgrade_grades_command(command, request.class_id, db)
-                                print("dummy", dummy)
+                                await run_db(db, lambda session: execute_upgrade_grades_command(command, request.class_id, session, user))
                                 update_required = True
                             except HTTPException as http_exc:
-                                print("Error al ejecutar el comando:", http_exc.detail)
+                                logger.debug("Error al ejecutar el comando: %s", http_exc.detail)
                                 # Continuar devolviendo el `response` al cliente incluso si falla el comando
                             except Exception as e:
-                                print("Error inesperado al ejecutar el comando:", str(e))
+                                log_unexpected_error("al ejecutar el comando", e)
                                 # Continuar devolviendo el `response` al cliente incluso si falla el comando
 
                         return {"response": response, "update_required": update_required}
                     elif request.state == "in_dashboard":
-                            user_data = get_user_classes(user, db)
-                            if user.id not in chat_sessions_in_dashboard:
-                                chat_sessions_in_dashboard[user.id] = create_chat_session_with_context(request.state, user_data)
-                            chat_session = chat_sessions_in_dashboard[user.id]
-                            # Enviar el mensaje al modelo Gemini
-                            response = await get_gemini_response(chat_session, request.message)
-                            print("Respuesta completa en dashboard:", response)
+                            session_key, chat_session, cache_key = await open_dashboard_session(request, db, user)
+                            await release_db(db)
+                            # Las preguntas repetidas sobre los mismos datos se responden desde la caché
+                            response = dashboard_answers.get(cache_key)
+                            if response is not None:
+                                append_exchange(chat_session, request.message, response)
+                            else:
+                                # Enviar el mensaje al modelo Gemini
+                                response = await get_gemini_response(chat_session, request.message)
+                                dashboard_answers.put(cache_key, response)
+                            await chat_sessions.put_async(session_key, chat_session)
+                            logger.debug("Respuesta completa en dashboard: %s", response)
                             return {"response": response}
 
 
 
 
+        except LLMTimeoutError as e:
+                logger.debug("Tiempo de espera agotado: %s", str(e))
+                raise HTTPException(status_code=504, detail="El asistente tardó demasiado en responder.")
         except Exception as e:
-                print("Error ocurrido:", str(e))
+                log_unexpected_error("en el chat", e)
                 raise HTTPException(status_code=500, detail="Error interno en el servidor.")
 
+def log_unexpected_error(action: str, error: Exception) -> None:
+    """
+    Los errores inesperados se registran siempre, pero su mensaje (que puede
+    incluir datos de estudiantes) solo en el nivel debug.
+    """
+    logger.error("Error inesperado %s (%s)", action, type(error).__name__)
+    logger.debug("Detalle del error %s", action, exc_info=error)
+
+async def open_class_session(request: ChatRequest, db, user: User):
+    """
+    Recupera la sesión de chat del usuario en la clase o la crea con los datos
+    de la clase. Devuelve la clave, la sesión, el mensaje a enviar, que
+    incluye los cambios de notas posteriores al último mensaje de la sesión, y
+    la versión de los datos que hay que guardar en la sesión cuando el modelo
+    responda.
+    """
+    session_key = f"class:{user.id}:{request.class_id}"
+    chat_session = await chat_sessions.get_async(session_key)
+    message = request.message
+    if chat_session is None:
+        context_version, class_data = await run_db(db, load_class_context, request.class_id)
+        chat_session = create_chat_session_with_context(request.state, class_data)
+        chat_session.context_version = context_version
+    else:
+        # Avisar a la sesión de los cambios de notas desde el último mensaje
+        context_version, message = await run_db(db, with_context_updates, chat_session, request.class_id, message)
+    return session_key, chat_session, message, context_version
+
+async def open_dashboard_session(request: ChatRequest, db, user: User):
+    """
+    Recupera la sesión de chat del usuario en el dashboard o la crea con la
+    lista de sus clases; si las clases han cambiado desde que se creó (o no se
+    sabe con qué datos se creó), la vuelve a crear. Devuelve la clave, la
+    sesión y la clave de la respuesta en la caché del dashboard, que incluye
+    los turnos anteriores de la conversación.
+    """
+    user_data = await run_db(db, lambda session: build_dashboard_context(get_user_classes(user, session)))
+    snapshot = context_hash(user_data)
+    session_key = f"dashboard:{user.id}"
+    chat_session = await chat_sessions.get_async(session_key)
+    if chat_session is None or getattr(chat_session, "context_hash", None) != snapshot:
+        chat_session = create_chat_session_with_context(request.state, user_data)
+        chat_session.context_hash = snapshot
+    # El primer turno es el contexto, ya incluido en la huella de los datos
+    previous_turns = serialize_chat_session(chat_session)["history"][1:]
+    return session_key, chat_session, dashboard_answers.key(user.id, request.message, user_data, previous_turns)
+
+@router.post("/chat/stream")
+async def stream_chat_with_gemini(request: ChatRequest, db: Session = Depends(get_request_db), user: User = Depends(get_current_user)):
+    """
+    Variante de /chat que envía la respuesta del modelo a medida que se genera,
+    como Server-Sent Events:
+    - "token": {"text": fragmento}
+    - "done": {"response": respuesta completa, "update_required": bool}
+    - "error": {"detail": mensaje, "update_required": bool (en una clase)}
+    Si la respuesta es una orden de notas, se ejecuta en cuanto llega su
+    primera línea completa, mientras el resto de la respuesta sigue llegando.
+    """
+    if not user.is_teacher:
+        return StreamingResponse(
+            iter([format_sse(None, "done", {"response": "El usuario no es un profesor."})]),
+            media_type="text/event-stream",
+        )
+
+    local_response = cached_response = None
+    if request.state == "in_class":
+        # Las órdenes sencillas de notas se ejecutan sin pasar por el modelo
+        local_response = await run_db(db, lambda session: run_local_command(request.message, request.class_id, session, user))
+        if local_response is None:
+            session_key, chat_session, message, context_version = await open_class_session(request, db, user)
+    elif request.state == "in_dashboard":
+        session_key, chat_session, cache_key = await open_dashboard_session(request, db, user)
+        message = request.message
+        cached_response = dashboard_answers.get(cache_key)
+        if cached_response is not None:
+            append_exchange(chat_session, message, cached_response)
+            await chat_sessions.put_async(session_key, chat_session)
+    else:
+        raise HTTPException(status_code=400, detail="Estado de chat no válido.")
+    await release_db(db)
+
+    async def events():
+        if local_response is not None:
+            yield format_sse(None, "token", {"text": local_response})
+            yield format_sse(None, "done", {"response": local_response, "update_required": True})
+            return
+        if cached_response is not None:
+            yield format_sse(None, "token", {"text": cached_response})
+            yield format_sse(None, "done", {"response": cached_response})
+            return
+
+        detector = StreamingCommandDetector(parse_response_to_upgrade_command) if request.state == "in_class" else None
+        command_task = None
+        response_parts = []
+        error = None
+        try:
+            async with aclosing(stream_gemini_response(chat_session, message)) as chunks:
+                async for chunk in chunks:
+                    response_parts.append(chunk)
+                    yield format_sse(None, "token", {"text": chunk})
+                    command = detector.feed(chunk) if detector else None
+                    if command is not None:
+                        command_task = asyncio.create_task(run_streamed_command(command, request.class_id, db, user))
+            command = detector.finish() if detector else None
+            if command is not None:
+                command_task = asyncio.create_task(run_streamed_command(command, request.class_id, db, user))
+            if request.state == "in_class":
+                chat_session.context_version = context_version
+        except LLMTimeoutError as e:
+            logger.debug("Tiempo de espera agotado: %s", str(e))
+            error = "El asistente tardó demasiado en responder."
+        except Exception as e:
+            log_unexpected_error("en el chat", e)
+            error = "Error interno en el servidor."
+        finally:
+            # Una orden ya detectada termina siempre antes de responder (y antes
+            # de que se cierre la sesión de base de datos de la petición), también
+            # si la respuesta falla después o el cliente se desconecta
+            update_required = await command_task if command_task is not None else False
+            await chat_sessions.put_async(session_key, chat_session)
+
+        if error is not None:
+            payload = {"detail": error}
+            if request.state == "in_class":
+                payload["update_required"] = update_required
+            yield format_sse(None, "error", payload)
+            return
+
+        response = "".join(response_parts)
+        logger.debug("Respuesta completa: %s", response)
+        if request.state == "in_dashboard":
+            dashboard_answers.put(cache_key, response)
+            yield format_sse(None, "done", {"response": response})
+            return
+        yield format_sse(None, "done", {"response": response, "update_required": update_required})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def run_streamed_command(command: dict, class_id: int, db, user: User) -> bool:
+    """
+    Ejecuta la orden detectada en una respuesta en streaming. Devuelve si se han modificado notas.
+    """
+    logger.debug("Comando detectado: %s", command)
+    try:
+        await run_db(db, lambda session: execute_upgrade_grades_command(command, class_id, session, user))
+        return True
+    except HTTPException as http_exc:
+        logger.debug("Error al ejecutar el comando: %s", http_exc.detail)
+    except Exception as e:
+        log_unexpected_error("al ejecutar el comando", e)
+    return False
+
+@router.get("/chat/metrics", dependencies=[Depends(require_metrics_token)])
+def chat_session_metrics():
+    """
+    Métricas del almacén de sesiones de chat y de la caché de respuestas del dashboard de este proceso.
+    """
+    return {**chat_sessions.metrics(), "dashboard_cache": dashboard_answers.metrics()}
+
 def parse_response_to_upgrade_command(response: str):
     """
     Convierte una respuesta en un comando para upgrade-grades.
@@ -109,17 +297,47 @@ def parse_response_to_upgrade_command(response: str):
         "category_name": category,
     }
 
-def execute_upgrade_grades_command(command: dict, class_id: int, db: Session):
+def run_local_command(message: str, class_id: int, db: Session, user: User) -> Optional[str]:
+    """
+    Intenta interpretar el mensaje como una orden de notas sin llamar al modelo
+    (p. ej. "Añade 10 puntos a Juan en comportamiento") y, si los nombres se
+    resuelven sin ambigüedad, la ejecuta. Devuelve la confirmación o None si
+    hay que preguntar al modelo.
+    """
+    command = parse_local_command(message, get_name_index(db, class_id))
+    if command is None:
+        return None
+    logger.debug("Comando local detectado: %s", command)
+    try:
+        execute_upgrade_grades_command(
+            {
+                "student_names": [student.name for student in command.students],
+                "points": command.points,
+                "category_name": command.category.name,
+            },
+            class_id,
+            db,
+            user,
+        )
+    except HTTPException as http_exc:
+        logger.debug("Error al ejecutar el comando local: %s", http_exc.detail)
+        return None
+    return command.describe()
+
+def execute_upgrade_grades_command(command: dict, class_id: int, db: Session, user: User):
     """
-    Llama directamente a la función update_grades con los datos procesados.
+    Llama directamente a update_class_grades con los datos procesados, así que
+    el comando solo puede tocar la clase abierta.
     """
-    response = update_grades(
+    response = update_class_grades(
+        class_id=class_id,
         request=UpdateGradesRequest(
             student_names=command["student_names"],
             category_name=command["category_name"],
             points=command["points"],
         ),
-        db=db
+        db=db,
+        user=user,
     )
     return response
 
@@ -129,44 +347,57 @@ async def chat_with_audio(
     file: UploadFile = File(...),
     state: str = Form(...),
     class_id: Optional[int] = Form(...),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_request_db),
     user: User = Depends(get_current_user)
 ):
     """
     Endpoint para procesar un archivo de audio con Gemini.
     """
+    # Tamaño y tipo real del audio, sin leerlo entero
+    try:
+        clip = receive_audio(file)
+    except AudioTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedAudioError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+
     try:
         is_teacher = user.is_teacher
         if not is_teacher:
                 return {"response": "El usuario no es un profesor."}
         elif is_teacher:
             if state == "in_class":
-                class_data = get_students_by_class(class_id, db, user)
+                class_data = await run_db(db, build_class_context, class_id)
+                await release_db(db)
                 # Enviar el archivo de audio a Gemini y obtener la transcripción
-                response = await get_gemini_audio_response(state,class_data,file)
-                print("Respuesta completa:", response)
+                response = await get_gemini_audio_response(state, class_data, clip)
+                logger.debug("Respuesta completa: %s", response)
                 # Intentar analizar si la respuesta es un comando
                 command = parse_response_to_upgrade_command(response)
                 update_required = False
 
                 if command is not None:
-                    print("Comando detectado:", command)
+                    logger.debug("Comando detectado: %s", command)
                     try:
-                        execute_upgrade_grades_command(command, class_id, db)
+                        await run_db(db, lambda session: execute_upgrade_grades_command(command, class_id, session, user))
                         update_required = True
                     except HTTPException as http_exc:
-                        print("Error al ejecutar el comando:", http_exc.detail)
+                        logger.debug("Error al ejecutar el comando: %s", http_exc.detail)
                     except Exception as e:
-                        print("Error inesperado al ejecutar el comando:", str(e))
+                        log_unexpected_error("al ejecutar el comando", e)
 
                 return {"response": response, "update_required": update_required}
             elif state == "in_dashboard":
-                user_data = get_user_classes(user, db)
+                user_data = await run_db(db, lambda session: build_dashboard_context(get_user_classes(user, session)))
+                await release_db(db)
                 # Enviar el archivo de audio a Gemini y obtener la transcripción
-                response = await get_gemini_audio_response(state,user_data,file)
-                print("Respuesta completa en dashboard:", response)
+                response = await get_gemini_audio_response(state, user_data, clip)
+                logger.debug("Respuesta completa en dashboard: %s", response)
                 return {"response": response}
+    except LLMTimeoutError as e:
+        logger.debug("Tiempo de espera agotado: %s", str(e))
+        raise HTTPException(status_code=504, detail="El asistente tardó demasiado en responder.")
     except Exception as e:
-        print("Error al procesar el archivo de audio:", str(e))
+        log_unexpected_error("al procesar el archivo de audio", e)
         raise HTTPException(status_code=500, detail="Error interno en el servidor.")
 # Compare this snippet from backend/routers/auth.py:   
\ No newline at end of file
@@ -1,4 +1,4 @@
-from fastapi import status, HTTPException, APIRouter, Depends
+from fastapi import status, HTTPException, APIRouter, Depends, Request, Response
 from sqlalchemy.orm import Session
 from models import Class
 from database import get_db
@@ -9,6 +9,12 @@ from schemas import ClassResponse
 from routers.auth import get_current_user
 from schemas import ClassSettingsRequest
 from sqlalchemy.exc import IntegrityError
+from services.class_context import invalidate_class_context
+from services.name_index import invalidate_name_index
+from services.class_details import load_class_details
+from services.class_sync import sync_class_settings
+from services.response_cache import invalidate_dashboard_answers
+from services.class_versions import bump_class_version, get_class_version, class_etag, not_modified
 import logging
 
 
@@ -66,6 +72,7 @@ def create_class(
     )
     db.add(class_member)
     db.commit()
+    invalidate_dashboard_answers(current_user.id)
 
     return {
         "id": new_class.id,
@@ -84,67 +91,27 @@ def get_user_classes(current_user: User = Depends(get_current_user), db: Session
     return user_classes
 
 @router.get("/{class_id}")
-def get_class_details(class_id: str, db: Session = Depends(get_db), user = Depends(get_current_user)):
-    # Fetch class details
+def get_class_details(class_id: str, request: Request, response: Response, db: Session = Depends(get_db), user = Depends(get_current_user)):
     if not user.is_teacher:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Solo los profesores pueden acceder a esta información."
         )
-    class_item = db.query(Class).filter(Class.id == int(class_id)).first()
 
-    if not class_item:
+    # Si el cliente ya tiene la versión actual basta con leer la fila de la clase
+    version = get_class_version(db, int(class_id))
+    if version is None:
         raise HTTPException(status_code=404, detail="Clase no encontrada")
+    cached = not_modified(request, response, class_etag("class", int(class_id), version))
+    if cached is not None:
+        return cached
 
-    # Fetch members in a single query
-    members = (
-        db.query(ClassMember, User.username, ClassMember.role)
-        .join(User, User.id == ClassMember.user_id)
-        .filter(ClassMember.class_id == class_id)
-        .all()
-    )
-    students = [
-        {"id": member.ClassMember.user_id, "name": member.username, "role": member.ClassMember.role}
-        for member in members
-    ]
-
-# Fetch categories and subcategories
-    categories = db.query(Category).filter(Category.class_id == class_id).all()
-    category_data = []
-    for category in categories:
-        if category.parent_id is None:  # Only include top-level categories
-            subcategories = db.query(Category).filter(Category.parent_id == category.id).all()
-            subcategories_data = [
-                {"id": sub.id, "name": sub.name, "weight": sub.weight}
-                for sub in subcategories
-            ]
-            category_data.append({
-                "id": category.id,
-                "name": category.name,
-                "weight": category.weight,
-                "subcategories": subcategories_data
-            })
-    challenges = db.query(Challenge).filter(Challenge.class_id == class_id).all()
-    challenges_data = [{"id": challenge.id, "name": challenge.name, "description": challenge.description, "icon_path": challenge.icon_path, "level": challenge.level} for challenge in challenges]
-
-    items = db.query(Item).filter(Item.class_id == class_id).all()
-    items_data = [{"id": item.id, "name": item.name, "description": item.description, "price": item.price, "expirationEnabled": item.expirationEnabled, "expirationTime": item.expirationTime, "usesEnabled": item.usesEnabled, "uses": item.uses, "icon": item.icon} for item in items]
+    # Clase, categorías, retos e items con un número fijo de consultas
+    class_details = load_class_details(db, int(class_id))
+    if class_details is None:
+        raise HTTPException(status_code=404, detail="Clase no encontrada")
 
-    
-    return {
-        "id": class_item.id,
-        "name": class_item.name,
-        "description": class_item.description,
-        "academic_year": class_item.academic_year,
-        "group": class_item.group,
-        "subject": class_item.subject,
-        "is_invitation_code_enabled": class_item.isInvitationCodeEnabled,
-        "invitation_link": class_item.inviteLink,
-        "invitation_code": class_item.inviteCode,
-        "categories": category_data,
-        "challenges": challenges_data,
-        "items": items_data,
-    } 
+    return class_details
 
 
 @router.delete("/user/delete_class/{class_id}")
@@ -181,6 +148,9 @@ def delete_class(
     db.query(ClassMember).filter(ClassMember.class_id == class_id).delete()
     db.delete(class_to_delete)
     db.commit()
+    invalidate_name_index(class_id)
+    invalidate_class_context(class_id)
+    invalidate_dashboard_answers(current_user.id)
 
     return {"message": "Clase eliminada correctamente"}
 
@@ -215,150 +185,17 @@ def update_class(
     class_to_update.inviteLink = class_data.invitation_link
     class_to_update.inviteCode = class_data.invitation_code
 
-    # Manejar categorías principales
-    existing_categories = db.query(Category).filter(
-        Category.class_id == class_to_update.id,  # Asegúrate de filtrar por la clase específica
-        Category.parent_id == None  # Solo categorías principales
-    ).all()
-    existing_category_ids = {category.id for category in existing_categories}
-
-    # IDs de las categorías principales que se están actualizando
-    updated_category_ids = set()
-
-
-    for category in class_data.categories:
-        if category.id and category.id in existing_category_ids:
-            # Actualizar categoría existente
-            existing_category = db.query(Category).filter(Category.id == category.id).first()
-            if existing_category:
-                existing_category.name = category.name
-                existing_category.weight = category.weight
-                updated_category_ids.add(category.id)
-
-                # Manejar subcategorías
-                existing_subcategory_ids = {sub.id for sub in existing_category.subcategories}
-                updated_subcategory_ids = set()
-
-                for subcategory in category.subcategories:
-                    if subcategory.id:  # Subcategoría existente
-                        if subcategory.id in existing_subcategory_ids:
-                            # Actualizar subcategoría existente
-                            existing_subcategory = db.query(Category).filter(Category.id == subcategory.id).first()
-                            if existing_subcategory:
-                                existing_subcategory.name = subcategory.name
-                                existing_subcategory.weight = subcategory.weight
-                                updated_subcategory_ids.add(subcategory.id)
-                    else:
-                        # Crear nueva subcategoría (id: null)
-                        new_subcategory = Category(
-                            class_id=class_id,
-                            name=subcategory.name,
-                            weight=subcategory.weight,
-                            parent_id=existing_category.id,
-                        )
-                        db.add(new_subcategory)
-                        db.flush()  # Obtener el ID recién creado
-                        updated_subcategory_ids.add(new_subcategory.id)
-
-                # Eliminar subcategorías no incluidas en la actualización
-                subcategories_to_delete = existing_subcategory_ids - updated_subcategory_ids
-                if subcategories_to_delete:
-                    db.query(Category).filter(Category.id.in_(subcategories_to_delete)).delete(synchronize_session=False)
-        else:
-            # Crear nueva categoría
-            new_category = Category(
-                class_id=class_id,
-                name=category.name,
-                weight=category.weight,
-            )
-            db.add(new_category)
-            db.flush()  # Obtener el ID recién creado
-            updated_category_ids.add(new_category.id)
-
-            # Manejar subcategorías para la nueva categoría
-            for subcategory in category.subcategories or []:
-                new_subcategory = Category(
-                    class_id=class_id,
-                    name=subcategory.name,
-                    weight=subcategory.weight,
-                    parent_id=new_category.id,
-                )
-                db.add(new_subcategory)
-                db.flush()
-
-    # Eliminar categorías no incluidas en la actualización
-    categories_to_delete = existing_category_ids - updated_category_ids
-    if categories_to_delete:
-        db.query(Category).filter(Category.id.in_(categories_to_delete)).delete(synchronize_session=False)        
-# Manejar challenges
-    existing_challenges_ids = {challenge.id for challenge in class_to_update.challenges}
-    updated_challenges_ids = set()
-
-    for challenge in class_data.challenges:
-        if "id" in challenge and challenge["id"] in existing_challenges_ids:
-            # Actualizar categoría existente
-            existing_challenge = db.query(Challenge).filter(Challenge.id == challenge.id).first()
-            if existing_challenge:
-                existing_challenge.name = challenge.name
-                existing_challenge.description = challenge.description
-                existing_challenge.icon_path = challenge.icon_path
-                existing_challenge.level = challenge.level
-                updated_challenges_ids.add(challenge.id)
-        else:
-            # Crear nueva categoría
-            new_challenge = Challenge(
-                class_id=class_id,
-                name=challenge.name,
-                description=challenge.description,
-                icon_path=challenge.icon_path,
-                level=challenge.level,
-            )
-            db.add(new_challenge)
-            db.flush()  # Obtener el ID recién creado
-            updated_challenges_ids.add(new_challenge.id)
-
-    # Eliminar challenges no incluidas en la actualización
-    challenges_to_delete = existing_challenges_ids - updated_challenges_ids
-    db.query(Challenge).filter(Challenge.id.in_(challenges_to_delete)).delete(synchronize_session=False)
-
-#manejar items
-    existing_items_ids = {item.id for item in class_to_update.items}
-    updated_items_ids = set()
-
-    for item in class_data.items:
-        if "id" in item and item["id"] in existing_items_ids:
-            existing_item = db.query(Item).filter(Item.id == item["id"]).first()
-            if existing_item:
-                existing_item.name = item.name
-                existing_item.description = item.description
-                existing_item.price = item.price
-                existing_item.expirationEnabled = item.expirationEnabled
-                existing_item.expirationTime = item.expirationTime
-                existing_item.usesEnabled = item.usesEnabled
-                existing_item.uses = item.uses
-                existing_item.icon = item.icon
-                updated_items_ids.add(item["id"])
-        else:
-            new_item = Item(
-                class_id=class_id,
-                name=item.name,
-                description=item.description,
-                price=item.price,
-                expirationEnabled=item.expirationEnabled,
-                expirationTime=item.expirationTime,
-                usesEnabled=item.usesEnabled,
-                uses=item.uses,
-                icon=item.icon,
-            )
-            db.add(new_item)
-            db.flush()
-            updated_items_ids.add(new_item.id)
-
-    items_to_delete = existing_items_ids - updated_items_ids
-    db.query(Item).filter(Item.id.in_(items_to_delete)).delete(synchronize_session=False)
+    # Categorías, retos e items: diferencia con el estado actual y
+    # sentencias masivas en la misma transacción
+    changes = sync_class_settings(db, class_id, class_data)
+    logger.debug("Clase %s sincronizada: %s", class_id, changes)
+    bump_class_version(db, class_id)
 
     # Confirmar cambios en la base de datos
     db.commit()
+    invalidate_name_index(class_id)
+    invalidate_class_context(class_id)
+    invalidate_dashboard_answers(current_user.id)
 
     # Refrescar la clase actualizada
     db.refresh(class_to_update)
@@ -1,10 +1,28 @@
-from fastapi import status, APIRouter, HTTPException, Depends
+from fastapi import status, APIRouter, HTTPException, Depends, UploadFile, File, Form, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from models import Student, Class, Grade, Category, GradeHistory, User
+from models import Student, Class, ClassMember, Grade, Category, GradeHistory, User
 from database import get_db
 from schemas import AddStudentRequest, GradeInput, UpdateGradesRequest, BulkAddStudentsRequest
 from sqlalchemy.sql import text
 from routers.auth import get_current_user
+from services.grades import apply_grade_changes
+from services.class_context import record_grade_changes, invalidate_class_context
+from services.name_index import get_name_index, reload_name_index, invalidate_name_index
+from services.grade_events import stream_grade_events
+from services.class_versions import bump_class_version, bump_class_version_once, get_class_version, class_etag, not_modified
+from services.student_import import import_class_ids, import_students, iter_upload_rows
+from services.roster import (
+    load_class_roster,
+    load_student_history,
+    HISTORY_MODES,
+    DEFAULT_HISTORY_LIMIT,
+    DEFAULT_PAGE_SIZE,
+)
+from typing import List, Optional
+import csv
+import zipfile
 
 router = APIRouter()
 @router.post("/students/add")
@@ -36,8 +54,11 @@ def add_student(student_data: AddStudentRequest, db: Session = Depends(get_db),
         is_active=False
     )
     db.add(new_student)
+    bump_class_version(db, student_data.class_id)
     db.commit()
     db.refresh(new_student)
+    invalidate_name_index(new_student.class_id)
+    invalidate_class_context(new_student.class_id)
     # Enviar email con el enlace de registro
     #send_invitation_email(new_student.email, new_student.class_id)
     # Retornar solo los datos esenciales
@@ -51,178 +72,300 @@ def add_student(student_data: AddStudentRequest, db: Session = Depends(get_db),
         },
     }
 @router.get("/{class_id}")
-def get_students_by_class(class_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+def get_students_by_class(
+    class_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+    history: str = "full",
+    history_limit: int = DEFAULT_HISTORY_LIMIT,
+):
     """
     Obtiene la lista de estudiantes matriculados en una clase específica con sus notas,
     incluyendo todas las categorías aunque no tengan notas asignadas,
     y el historial de cambios de sus notas ordenado por categoría.
+    `history` puede ser "full" (todo el historial), "last" (las últimas
+    `history_limit` entradas por categoría) o "none" (sin historial).
     """
     if not user.is_teacher:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Solo los profesores pueden acceder a esta información."
         )
+    if history not in HISTORY_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Modo de historial no válido. Use uno de: {', '.join(HISTORY_MODES)}."
+        )
 
-    # Obtener estudiantes y categorías de la clase
-    students = db.query(Student).filter(Student.class_id == class_id).all()
-    categories = db.query(Category).filter(Category.class_id == class_id).all()
-
-    if not students or not categories:
-        return {"students": []}
+    # Si el cliente ya tiene la versión actual basta con leer la fila de la clase
+    version = get_class_version(db, class_id)
+    if version is not None:
+        cached = not_modified(request, response, class_etag("roster", class_id, version, history, history_limit))
+        if cached is not None:
+            return cached
 
-    # Crear un mapeo de categorías
-    category_mapping = [
-        {"category": category.name, "grade": None, "subcategories": []}
-        for category in categories
-    ]
+    return load_class_roster(db, class_id, history=history, history_limit=history_limit)
 
-    # Construir la respuesta con las categorías completas para todos los estudiantes
-    student_data = []
-    for student in students:
-        # Inicializar las notas del estudiante con todas las categorías
-        grades = {category["category"]: category.copy() for category in category_mapping}
-
-        # Obtener las calificaciones del estudiante
-        student_grades = (
-            db.query(Grade, Category)
-            .join(Category, Grade.category_id == Category.id)
-            .filter(Grade.student_id == student.id)
-            .all()
+@router.get("/{class_id}/events")
+async def stream_class_events(
+    class_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """
+    Server-Sent Events con los cambios de notas de la clase, para aplicar los
+    cambios sobre el roster ya cargado en lugar de volver a pedirlo. Cada evento
+    "grades" lleva `category_id`, `points` y `grades` ([student_id, nota total]).
+    Un evento "resync" indica que hay que recargar el roster. Se reanuda con la
+    cabecera Last-Event-ID; la autenticación es la de siempre (Authorization),
+    así que el cliente debe usar fetch en lugar de EventSource.
+    """
+    if not user.is_teacher:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los profesores pueden acceder a esta información."
         )
+    await run_in_threadpool(ensure_class_teacher, db, class_id, user.id)
+    # La conexión dura mucho: no retener la sesión de la autenticación
+    await run_in_threadpool(db.close)
 
-        # Asignar las calificaciones existentes a las categorías
-        for grade, category in student_grades:
-            grades[category.name]["grade"] = grade.grade
-
-        # Obtener el historial de notas del estudiante
-        grade_history = (
-            db.query(GradeHistory, Category)
-            .join(Grade, GradeHistory.grade_id == Grade.id)
-            .join(Category, Grade.category_id == Category.id)
-            .filter(Grade.student_id == student.id)
-            .order_by(Category.name.asc(), GradeHistory.created_at.desc())
-            .all()
-        )
+    return StreamingResponse(
+        stream_grade_events(class_id, request.headers.get("last-event-id"), request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-        # Formatear el historial para el frontend
-        formatted_history = [
-            {
-                "category": category.name,
-                "change_amount": history.change_amount,
-                "current_grade": history.current_grade,
-                "percentage_change": history.percentage_change,
-                "timestamp": history.created_at,
-                "description": history.description,
-            }
-            for history, category in grade_history
-        ]
-
-        # Convertir el mapeo de categorías en una lista para el `frontend`
-        grades_list = list(grades.values())
-
-        student_data.append(
-            {
-                "id": student.id,
-                "name": student.name,
-                "email": student.email,
-                "grades": grades_list,
-                "grade_history": formatted_history,  # Agregar historial de notas ordenado
-            }
+@router.get("/{class_id}/history/{student_id}")
+def get_student_history(
+    class_id: int,
+    student_id: int,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """
+    Obtiene el historial de notas de un estudiante paginado por cursor.
+    Devuelve `next_cursor` para pedir la siguiente página, o null si no hay más.
+    """
+    if not user.is_teacher:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los profesores pueden acceder a esta información."
         )
 
-    return {"students": student_data}
+    ensure_class_teacher(db, class_id, user.id)
+
+    try:
+        return load_student_history(db, class_id, student_id, limit=limit, cursor=cursor, category_name=category)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/update_grades")
 def update_grades(
     request: UpdateGradesRequest,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
 ):
     """
     Añade o quita puntos a los estudiantes en una categoría o subcategoría específica.
+    Se mantiene por compatibilidad: la clase se deduce de la categoría con ese
+    nombre entre las clases del profesor. Use /students/{class_id}/update_grades.
+    """
+    if not user.is_teacher:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los profesores pueden modificar las notas."
+        )
+
+    # Verificar si la categoría o subcategoría existe en alguna de sus clases
+    class_ids = [
+        class_id for (class_id,) in
+        db.query(Category.class_id)
+        .join(ClassMember, ClassMember.class_id == Category.class_id)
+        .filter(
+            Category.name == request.category_name,
+            ClassMember.user_id == user.id,
+            ClassMember.role == "teacher",
+        )
+        .distinct()
+        .all()
+    ]
+    if not class_ids:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Categoría o subcategoría '{request.category_name}' no encontrada."
+        )
+    if len(class_ids) > 1:
+        raise HTTPException(
+            status_code=400,
+            detail=f"La categoría '{request.category_name}' existe en varias de tus clases. Use /students/{{class_id}}/update_grades."
+        )
+
+    return update_class_grades(class_ids[0], request, db, user)
+
+@router.post("/{class_id}/update_grades")
+def update_class_grades(
+    class_id: int,
+    request: UpdateGradesRequest,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """
+    Añade o quita puntos a los estudiantes de una clase en una categoría o subcategoría.
+    Solo los profesores de la clase pueden hacerlo.
     Prohíbe operaciones en categorías con subcategorías.
     Registra un historial de cambios.
     """
+    if not user.is_teacher:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los profesores pueden modificar las notas."
+        )
+    ensure_class_teacher(db, class_id, user.id)
+
+    return apply_named_grade_update(db, class_id, request)
+
+def ensure_class_teacher(db: Session, class_id: int, user_id: int) -> None:
+    """
+    Lanza 403 si el usuario no es profesor de la clase.
+    """
+    teacher_relation = (
+        db.query(ClassMember.id)
+        .filter(ClassMember.class_id == class_id, ClassMember.user_id == user_id, ClassMember.role == "teacher")
+        .first()
+    )
+    if not teacher_relation:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tienes permiso para acceder a esta clase."
+        )
+
+def apply_named_grade_update(db: Session, class_id: int, request: UpdateGradesRequest) -> dict:
+    """
+    Resuelve los nombres de la petición con el índice de la clase, de modo que
+    solo se tocan los datos de `class_id`, y aplica los puntos.
+    """
     student_names = request.student_names
     category_name = request.category_name
     points = request.points
+    try:
+        category, students = resolve_grade_targets(db, get_name_index(db, class_id), class_id, category_name, student_names)
+    except HTTPException as e:
+        if e.status_code != 404:
+            raise
+        # El índice puede ser anterior a un cambio hecho desde otro proceso: recargarlo una vez
+        category, students = resolve_grade_targets(db, reload_name_index(db, class_id), class_id, category_name, student_names)
+
+    # Añadir o quitar puntos a todos los estudiantes en una sola transacción
+    changes = apply_grade_changes(
+        db,
+        category.id,
+        [student.id for student in students],
+        points,
+        description=f"Actualización en la categoría '{category.name}'",
+        commit=False,
+        class_id=class_id,
+    )
+    # apply_grade_changes ya ha incrementado la versión de la clase en esta transacción
+    version = bump_class_version_once(db, class_id)
+    db.commit()
+    # Las sesiones de chat abiertas de la clase reciben el cambio en su siguiente mensaje
+    names_by_id = {student.id: student.name for student in students}
+    record_grade_changes(class_id, version, (
+        {"name": names_by_id[change["student_id"]], "category": category.name,
+         "total_grade": change["total_grade"], "points": points}
+        for change in changes
+    ))
+
+    return {
+        "message": "Puntos actualizados correctamente.",
+        "updated_students": [student.name for student in students],
+        "category": category.name,
+        "points_added": points
+    }
 
-    # Verificar si la categoría o subcategoría existe
-    category = db.query(Category).filter(Category.name == category_name).first()
+def resolve_grade_targets(db: Session, index, class_id: int, category_name: str, student_names: List[str]):
+    """
+    Categoría y estudiantes de una orden de notas. Solo se aceptan nombres
+    exactos o sin ambigüedad (por sus primeras palabras o por una de ellas);
+    las coincidencias aproximadas se devuelven como sugerencia en el error.
+    Los ids se comprueban en la transacción de la escritura, por si el índice
+    conserva estudiantes o categorías borrados desde otro proceso.
+    """
+    # Verificar si la categoría o subcategoría existe en la clase
+    category = index.resolve_category(category_name)
     if not category:
         raise HTTPException(
             status_code=404,
             detail=f"Categoría o subcategoría '{category_name}' no encontrada."
+                   + did_you_mean([candidate.name for candidate in index.suggest_categories(category_name)])
         )
 
     # Verificar si la categoría tiene subcategorías
-    subcategories = db.query(Category).filter(Category.parent_id == category.id).all()
-    if subcategories:
-        subcategory_names = [subcategory.name for subcategory in subcategories]
+    if category.subcategories:
         raise HTTPException(
             status_code=400,
             detail=(
-                f"La categoría '{category_name}' tiene subcategorías. "
-                f"Especifique una de las siguientes subcategorías: {', '.join(subcategory_names)}."
+                f"La categoría '{category.name}' tiene subcategorías. "
+                f"Especifique una de las siguientes subcategorías: {', '.join(category.subcategories)}."
             )
         )
 
-    # Verificar que los estudiantes existen
-    students = db.query(Student).filter(Student.name.in_(student_names)).all()
-    if len(students) != len(student_names):
-        found_names = [student.name for student in students]
-        missing_names = set(student_names) - set(found_names)
+    # Resolver los nombres (tolera tildes, mayúsculas y nombres incompletos)
+    students = []
+    missing_names = []
+    for student_name in student_names:
+        matches = index.find_students(student_name)
+        if len(matches) > 1:
+            raise HTTPException(
+                status_code=400,
+                detail=(
+                    f"El nombre '{student_name}' es ambiguo. "
+                    f"Especifique uno de los siguientes estudiantes: {', '.join(match.name for match in matches)}."
+                )
+            )
+        if not matches:
+            missing_names.append(
+                student_name + did_you_mean([candidate.name for candidate in index.suggest_students(student_name)], inline=True)
+            )
+        elif matches[0] not in students:
+            students.append(matches[0])
+    if missing_names:
         raise HTTPException(
             status_code=404,
             detail=f"Estudiantes no encontrados: {', '.join(missing_names)}."
         )
 
-    # Añadir o quitar puntos a cada estudiante en la categoría
-    for student in students:
-        grade = (
-            db.query(Grade)
-            .filter(Grade.student_id == student.id, Grade.category_id == category.id)
-            .first()
-        )
-        if grade:
-            previous_grade = grade.grade
-            grade.grade += points
-        else:
-            # Crear un nuevo registro de calificación si no existe
-            previous_grade = 0
-            grade = Grade(
-                student_id=student.id,
-                category_id=category.id,
-                grade=points
-            )
-            db.add(grade)
-            db.commit()  # Necesario para generar el `id` del nuevo `Grade`
-            db.refresh(grade)  # Asegurarse de obtener el ID generado
-
-        # Calcular el porcentaje de cambio
-        percentage_change = (
-            (points / previous_grade) * 100 if previous_grade != 0 else 100
-        )
-
-        # Registrar el cambio en el historial
-        history_entry = GradeHistory(
-            grade_id=grade.id,
-            change_amount=points,
-            current_grade=grade.grade,
-            percentage_change=percentage_change,
-            description=f"Actualización en la categoría '{category.name}'"
+    student_ids = {student.id for student in students}
+    existing_ids = {
+        student_id for (student_id,) in
+        db.query(Student.id).filter(Student.class_id == class_id, Student.id.in_(student_ids))
+    }
+    category_exists = db.query(Category.id).filter(Category.id == category.id, Category.class_id == class_id).first()
+    if not category_exists or existing_ids != student_ids:
+        stale = [student.name for student in students if student.id not in existing_ids]
+        raise HTTPException(
+            status_code=404,
+            detail=f"Estudiantes no encontrados: {', '.join(stale)}." if stale
+            else f"Categoría o subcategoría '{category_name}' no encontrada."
         )
-        db.add(history_entry)
+    return category, students
 
-# Guardar todos los cambios
-    # Guardar los cambios
-    db.commit()
+def did_you_mean(candidates: List[str], inline: bool = False) -> str:
+    """
+    Sugerencia para un nombre no encontrado: " ¿Quiso decir: María Pérez?".
+    """
+    if not candidates:
+        return ""
+    if inline:
+        return f" (¿quiso decir {' o '.join(candidates)}?)"
+    return f" ¿Quiso decir: {', '.join(candidates)}?"
 
-    return {
-        "message": "Puntos actualizados correctamente.",
-        "updated_students": [student.name for student in students],
-        "category": category.name,
-        "points_added": points
-    }
 @router.post("/students/bulk_add")
 def bulk_add_students(
     bulk_data: BulkAddStudentsRequest,
@@ -232,34 +375,54 @@ def bulk_add_students(
     if not user.is_teacher:
         raise HTTPException(status_code=403, detail="No tienes permiso para realizar esta acción.")
 
+    students = bulk_data.students or []
+    for class_id in sorted({student.class_id for student in students}):
+        ensure_class_teacher(db, class_id, user.id)
+
+    rows = enumerate((student.dict() for student in students), start=1)
     added_students = []
     errors = []
-
-    for student_data in bulk_data.students:
-        try:
-            # Comprueba si el estudiante ya existe en la clase
-            existing_student = db.query(Student).filter(
-                Student.email == student_data.email,
-                Student.class_id == student_data.class_id
-            ).first()
-            if existing_student:
-                errors.append(f"El estudiante con correo {student_data.email} ya está en la clase.")
-                continue
-
-            # Crea un nuevo estudiante
-            new_student = Student(
-                name=student_data.name,
-                email=student_data.email,
-                class_id=student_data.class_id
-            )
-            db.add(new_student)
-            added_students.append(new_student)
-        except Exception as e:
-            errors.append(f"Error al añadir {student_data.email}: {str(e)}")
-
-    db.commit()
+    for added, chunk_errors in import_students(db, rows):
+        added_students.extend(added)
+        errors.extend(error["error"] for error in chunk_errors)
 
     return {
-        "added_students": [student.email for student in added_students],
+        "added_students": added_students,
         "errors": errors,
-    }
\ No newline at end of file
+    }
+
+@router.post("/students/import")
+def import_students_file(
+    file: UploadFile = File(...),
+    class_id: Optional[int] = Form(None),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    """
+    Importa estudiantes desde un fichero CSV o XLSX con las columnas
+    nombre/name, email/correo y, opcionalmente, class_id/clase
+    (si no se indica, se usa `class_id`). El fichero se procesa por bloques,
+    así que la memoria no depende de su tamaño. Antes de importar se comprueba
+    que el usuario es profesor de todas las clases del fichero.
+    Devuelve el número de estudiantes añadidos y los errores por fila.
+    """
+    if not user.is_teacher:
+        raise HTTPException(status_code=403, detail="No tienes permiso para realizar esta acción.")
+
+    added_count = 0
+    errors = []
+    try:
+        # Primera pasada: solo las clases, para no importar nada sin permiso
+        for target_class_id in sorted(import_class_ids(iter_upload_rows(file), default_class_id=class_id)):
+            ensure_class_teacher(db, target_class_id, user.id)
+        file.file.seek(0)
+        for added, chunk_errors in import_students(db, iter_upload_rows(file), default_class_id=class_id):
+            added_count += len(added)
+            errors.extend(chunk_errors)
+    except (UnicodeDecodeError, csv.Error, zipfile.BadZipFile) as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"No se pudo leer el fichero ({added_count} estudiantes importados antes del error): {e}"
+        )
+
+    return {"added_count": added_count, "errors": errors}
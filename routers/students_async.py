@@ -0,0 +1,102 @@
+from fastapi import status, APIRouter, HTTPException, Depends, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from database import get_async_db
+from models import User
+from schemas import UpdateGradesRequest
+from routers.auth import get_current_user
+from routers.students import apply_named_grade_update, ensure_class_teacher
+from services.class_versions import get_class_version, class_etag, not_modified
+from services.roster import (
+    load_class_roster,
+    load_student_history,
+    HISTORY_MODES,
+    DEFAULT_HISTORY_LIMIT,
+    DEFAULT_PAGE_SIZE,
+)
+
+# Variantes asíncronas de los endpoints más usados de routers/students.py.
+# Reutilizan los mismos servicios mediante AsyncSession.run_sync, así que la
+# lógica y las respuestas son idénticas pero no ocupan hilos del threadpool.
+# main.py las registra delante de las síncronas cuando DB_ASYNC_ENABLED está activo.
+router = APIRouter()
+
+
+@router.get("/{class_id}")
+async def get_students_by_class(
+    class_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    user: User = Depends(get_current_user),
+    history: str = "full",
+    history_limit: int = DEFAULT_HISTORY_LIMIT,
+):
+    """
+    Versión asíncrona de routers.students.get_students_by_class.
+    """
+    if not user.is_teacher:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los profesores pueden acceder a esta información."
+        )
+    if history not in HISTORY_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Modo de historial no válido. Use uno de: {', '.join(HISTORY_MODES)}."
+        )
+
+    version = await db.run_sync(get_class_version, class_id)
+    if version is not None:
+        cached = not_modified(request, response, class_etag("roster", class_id, version, history, history_limit))
+        if cached is not None:
+            return cached
+
+    return await db.run_sync(load_class_roster, class_id, history, history_limit)
+
+
+@router.get("/{class_id}/history/{student_id}")
+async def get_student_history(
+    class_id: int,
+    student_id: int,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    user: User = Depends(get_current_user),
+):
+    """
+    Versión asíncrona de routers.students.get_student_history.
+    """
+    if not user.is_teacher:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los profesores pueden acceder a esta información."
+        )
+
+    await db.run_sync(ensure_class_teacher, class_id, user.id)
+
+    try:
+        return await db.run_sync(load_student_history, class_id, student_id, limit, cursor, category)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/{class_id}/update_grades")
+async def update_class_grades(
+    class_id: int,
+    request: UpdateGradesRequest,
+    db: AsyncSession = Depends(get_async_db),
+    user: User = Depends(get_current_user),
+):
+    """
+    Versión asíncrona de routers.students.update_class_grades.
+    """
+    if not user.is_teacher:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los profesores pueden modificar las notas."
+        )
+    await db.run_sync(ensure_class_teacher, class_id, user.id)
+
+    return await db.run_sync(apply_named_grade_update, class_id, request)
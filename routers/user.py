@@ -6,13 +6,14 @@ from config import settings
 from database import get_db
 from models import User, Class
 from routers.auth import get_current_user, create_access_token, verify_password, pwd_context
+from services.passwords import hash_password
 import jwt
-import smtplib
 from decouple import config
 from crud import create_user, verify_confirmation_code, activate_user
 import crud
 import random
 from email_utils import send_confirmation_email, send_recovery_email
+from services.user_cache import CurrentUser, invalidate_user
 router = APIRouter()
 
 # ---- Models ----
@@ -60,7 +61,7 @@ def is_password_strong(password: str) -> bool:
 # ---- Routes ----
 
 @router.get("/me")
-def read_users_me(current_user: User = Depends(get_current_user)):
+def read_users_me(current_user: CurrentUser = Depends(get_current_user)):
     """
     Retrieve the current user's profile.
     """
@@ -69,17 +70,19 @@ def read_users_me(current_user: User = Depends(get_current_user)):
 @router.put("/me")
 def update_user_profile(
     profile: ProfileUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """
     Update the profile of the current user.
     """
-    current_user.name = profile.name
-    current_user.bio = profile.bio
+    user = db.query(User).filter(User.id == current_user.id).first()
+    user.name = profile.name
+    user.bio = profile.bio
     db.commit()
-    db.refresh(current_user)
-    return {"message": "Profile updated", "user": {"name": current_user.name, "bio": current_user.bio}}
+    db.refresh(user)
+    invalidate_user(user.id)
+    return {"message": "Profile updated", "user": {"name": user.name, "bio": user.bio}}
 
 @router.post("/password-recovery")
 def password_recovery(
@@ -98,12 +101,9 @@ def password_recovery(
     # Generate a recovery token
     recovery_token_expires = timedelta(minutes=settings.PASSWORD_RESET_EXPIRE_MINUTES)
     recovery_token = create_access_token(data={"sub": user.email}, expires_delta=recovery_token_expires)
-    # Send the token via email
-    if not send_recovery_email(request.email, recovery_token):
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Error al enviar el correo de recuperación. Inténtalo de nuevo."
-        )
+    # Queue the email; the outbox worker sends it after the commit
+    send_recovery_email(db, request.email, recovery_token)
+    db.commit()
     return {"message": "Correo de recuperación enviado."}
 
 
@@ -148,9 +148,10 @@ def reset_password(data: PasswordReset, db: Session = Depends(get_db)):
         )
 
     # Update password
-    hashed_password = pwd_context.hash(data.new_password)
+    hashed_password = hash_password(data.new_password)
     user.hashed_password = hashed_password
     db.commit()
+    invalidate_user(user.id)
     return {"message": "Password updated successfully."}
 
 
@@ -180,15 +181,10 @@ def register_user(
     # Generate a confirmation code
     confirmation_code = random.randint(100000, 999999)
 
-    # Try to send the email first
-    if not send_confirmation_email(user_data.email,str(confirmation_code)):
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to send confirmation email. Please try again later."
-        )
-
-    # Only create user if email was sent successfully
+    # The confirmation email is queued in the same transaction as the user:
+    # both are stored or neither is, and the outbox worker sends it afterwards
     try:
+        send_confirmation_email(db, user_data.email, str(confirmation_code))
         create_user(
             db=db,
             username=user_data.username,
@@ -14,6 +14,7 @@ class ClassResponse(BaseModel):
 
 
 class ItemRequest(BaseModel):
+    id: Optional[int] = None
     name: str
     description: Optional[str]
     price: float
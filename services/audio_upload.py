@@ -0,0 +1,150 @@
+import io
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+from config import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+# Firmas de los formatos de audio que acepta Gemini (y el que graban los navegadores)
+AUDIO_SIGNATURES = (
+    (0, b"RIFF", 8, b"WAVE", "audio/wav"),
+    (0, b"FORM", 8, b"AIFF", "audio/aiff"),
+    (0, b"OggS", None, None, "audio/ogg"),
+    (0, b"fLaC", None, None, "audio/flac"),
+    (0, b"ID3", None, None, "audio/mp3"),
+    (0, b"\x1aE\xdf\xa3", None, None, "audio/webm"),
+    (4, b"ftyp", None, None, "audio/mp4"),
+)
+SNIFF_BYTES = 16
+
+
+class AudioTooLargeError(Exception):
+    """
+    El audio supera AUDIO_MAX_UPLOAD_MB.
+    """
+
+
+class UnsupportedAudioError(Exception):
+    """
+    El fichero no es un formato de audio reconocido.
+    """
+
+
+@dataclass
+class AudioClip:
+    """
+    Audio subido, sin cargar en memoria: `file` es el fichero temporal
+    (en memoria hasta 1 MB y en disco a partir de ahí) que crea Starlette.
+    """
+    file: object
+    size: int
+    mime_type: str
+
+
+def detect_audio_mime_type(header: bytes) -> Optional[str]:
+    """
+    Tipo MIME a partir de los primeros bytes del fichero.
+    """
+    for offset, magic, second_offset, second_magic, mime_type in AUDIO_SIGNATURES:
+        if header[offset:offset + len(magic)] != magic:
+            continue
+        if second_magic is not None and header[second_offset:second_offset + len(second_magic)] != second_magic:
+            continue
+        return mime_type
+    if len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0:
+        # Cabecera de trama MPEG: la capa 0 es AAC (ADTS), el resto MP3
+        return "audio/aac" if header[1] & 0x06 == 0 else "audio/mp3"
+    return None
+
+
+def receive_audio(upload) -> AudioClip:
+    """
+    Comprueba el tamaño y el tipo real de un audio subido (UploadFile) leyendo
+    solo su cabecera. Si el formato no se reconoce se acepta el Content-Type
+    del cliente cuando es de audio.
+    """
+    source = upload.file
+    size = upload.size
+    if size is None:
+        source.seek(0, os.SEEK_END)
+        size = source.tell()
+    if size > settings.AUDIO_MAX_UPLOAD_MB * 1024 * 1024:
+        raise AudioTooLargeError(f"El audio supera el máximo de {settings.AUDIO_MAX_UPLOAD_MB} MB.")
+
+    source.seek(0)
+    mime_type = detect_audio_mime_type(source.read(SNIFF_BYTES))
+    source.seek(0)
+    if mime_type is None and (upload.content_type or "").startswith("audio/"):
+        mime_type = upload.content_type
+    if mime_type is None:
+        raise UnsupportedAudioError("Formato de audio no reconocido.")
+    return AudioClip(file=source, size=size, mime_type=mime_type)
+
+
+def is_inline(clip: AudioClip) -> bool:
+    """
+    Los audios cortos van dentro de la petición; los largos, por la API de ficheros.
+    """
+    return clip.size <= settings.AUDIO_INLINE_MAX_MB * 1024 * 1024
+
+
+def copy_for_job(clip: AudioClip) -> AudioClip:
+    """
+    Copia del audio que pertenece al trabajo de Gemini y no a la petición: si
+    la llamada agota el tiempo, el hilo sigue leyéndola aunque FastAPI ya haya
+    cerrado el UploadFile. Los audios cortos se copian en memoria y los largos
+    en un fichero temporal que se borra al cerrarlo. Bloqueante (E/S de disco).
+    """
+    clip.file.seek(0)
+    if is_inline(clip):
+        return AudioClip(file=io.BytesIO(clip.file.read()), size=clip.size, mime_type=clip.mime_type)
+    copy = tempfile.NamedTemporaryFile(prefix="nextclass-audio-")
+    try:
+        shutil.copyfileobj(clip.file, copy)
+        copy.seek(0)
+    except Exception:
+        copy.close()
+        raise
+    return AudioClip(file=copy, size=clip.size, mime_type=clip.mime_type)
+
+
+def upload_audio(clip: AudioClip, genai, timeout: float):
+    """
+    Sube el audio con la API de ficheros de Gemini (por trozos, sin leerlo
+    entero) y espera a que esté listo para usarlo en generate_content.
+    El nombre remoto se fija antes de subir, así que si algo falla a medias
+    (subida, espera o procesado) el fichero se borra igualmente.
+    Bloqueante: se ejecuta en el pool de Gemini.
+    """
+    name = f"files/{uuid.uuid4().hex}"
+    try:
+        uploaded = genai.upload_file(clip.file, mime_type=clip.mime_type, name=name)
+        deadline = time.monotonic() + timeout
+        while uploaded.state.name == "PROCESSING":
+            if time.monotonic() > deadline:
+                raise TimeoutError("El audio subido no se procesó a tiempo.")
+            time.sleep(0.5)
+            uploaded = genai.get_file(uploaded.name)
+        if uploaded.state.name == "FAILED":
+            raise UnsupportedAudioError("Gemini no pudo procesar el audio.")
+        return uploaded
+    except Exception:
+        delete_uploaded_audio(genai, name)
+        raise
+
+
+def delete_uploaded_audio(genai, name: str) -> None:
+    """
+    Borra un audio de la API de ficheros. Si la subida no llegó a crearlo no
+    hay nada que borrar; el resto de errores solo se registran.
+    """
+    try:
+        genai.delete_file(name)
+    except Exception as error:
+        logger.debug("No se pudo borrar el audio subido %s: %r", name, error)
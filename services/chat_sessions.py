@@ -0,0 +1,203 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+from starlette.concurrency import run_in_threadpool
+from config import settings
+
+
+class InMemorySessionBackend:
+    """
+    Backend compartido nulo: cada proceso solo ve sus propias sesiones.
+    """
+
+    def load(self, key: str) -> Optional[dict]:
+        return None
+
+    def store(self, key: str, data: dict, ttl_seconds: int) -> None:
+        pass
+
+    def delete(self, key: str) -> None:
+        pass
+
+
+class RedisSessionBackend:
+    """
+    Guarda cada sesión serializada (historial y atributos) en Redis para que
+    cualquier worker de uvicorn pueda reconstruirla. Requiere el paquete `redis`.
+    """
+
+    def __init__(self, url: str, prefix: str = "nextclass:chat:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def load(self, key: str) -> Optional[dict]:
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    def store(self, key: str, data: dict, ttl_seconds: int) -> None:
+        self.client.set(self.prefix + key, json.dumps(data), ex=ttl_seconds)
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+
+class ChatSessionStore:
+    """
+    Sesiones de chat por proceso con expulsión LRU, caducidad por inactividad y
+    un presupuesto de memoria (estimado por el tamaño del historial). Si hay un
+    backend compartido, las sesiones que no están en memoria se reconstruyen a
+    partir de lo guardado allí.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int,
+        idle_ttl_seconds: int,
+        memory_budget_bytes: int,
+        backend=None,
+        serialize: Optional[Callable] = None,
+        restore: Optional[Callable] = None,
+    ):
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.memory_budget_bytes = memory_budget_bytes
+        self.backend = backend or InMemorySessionBackend()
+        self.serialize = serialize
+        self.restore = restore
+        self._sessions = OrderedDict()  # key -> (sesión, último uso, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.restores = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str):
+        """
+        Devuelve la sesión de `key` o None si no existe o ha caducado.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is not None:
+                session, last_used, size = entry
+                if now - last_used <= self.idle_ttl_seconds:
+                    self._sessions[key] = (session, now, size)
+                    self._sessions.move_to_end(key)
+                    self.hits += 1
+                    return session
+                self._remove(key)
+                self.expirations += 1
+
+        data = self.backend.load(key) if self.restore else None
+        if data is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        session = self.restore(data)
+        with self._lock:
+            self.restores += 1
+            self.hits += 1
+        self._put_local(key, session)
+        return session
+
+    def put(self, key: str, session) -> None:
+        """
+        Guarda (o actualiza tras un mensaje) la sesión de `key`.
+        """
+        self._put_local(key, session)
+        if self.serialize:
+            self.backend.store(key, self.serialize(session), self.idle_ttl_seconds)
+
+    async def get_async(self, key: str):
+        """
+        Como get(), para los endpoints async: con un backend compartido la
+        lectura (de red) se hace en el threadpool y no bloquea el event loop.
+        """
+        if isinstance(self.backend, InMemorySessionBackend):
+            return self.get(key)
+        return await run_in_threadpool(self.get, key)
+
+    async def put_async(self, key: str, session) -> None:
+        """
+        Como put(), para los endpoints async (ver get_async).
+        """
+        if isinstance(self.backend, InMemorySessionBackend):
+            self.put(key, session)
+        else:
+            await run_in_threadpool(self.put, key, session)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+        self.backend.delete(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+            self._bytes = 0
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._sessions),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "restores": self.restores,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "max_sessions": self.max_sessions,
+                "memory_budget_bytes": self.memory_budget_bytes,
+            }
+
+    def _put_local(self, key: str, session) -> None:
+        size = estimate_session_size(session)
+        now = time.monotonic()
+        with self._lock:
+            self._remove(key)
+            self._sessions[key] = (session, now, size)
+            self._bytes += size
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        # Primero las sesiones inactivas, después las menos usadas recientemente
+        for key in [key for key, (_, last_used, _) in self._sessions.items() if now - last_used > self.idle_ttl_seconds]:
+            self._remove(key)
+            self.expirations += 1
+        while self._sessions and (len(self._sessions) > self.max_sessions or self._bytes > self.memory_budget_bytes):
+            key = next(iter(self._sessions))
+            self._remove(key)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._sessions.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+
+def estimate_session_size(session) -> int:
+    """
+    Estima la memoria de una sesión por el tamaño del texto de su historial.
+    """
+    size = 0
+    for content in getattr(session, "history", []) or []:
+        parts = content.get("parts", []) if isinstance(content, dict) else getattr(content, "parts", [])
+        for part in parts:
+            text = part.get("text") if isinstance(part, dict) else getattr(part, "text", None)
+            size += len(text.encode()) if text else 0
+    return size
+
+
+def create_session_backend():
+    if settings.CHAT_SESSION_BACKEND == "redis":
+        return RedisSessionBackend(settings.CHAT_SESSION_REDIS_URL)
+    return InMemorySessionBackend()
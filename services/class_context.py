@@ -0,0 +1,224 @@
+import threading
+from collections import defaultdict, deque
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from config import settings
+from models import Student, Category, Grade
+from services.class_versions import get_class_version
+
+# Aproximación habitual para texto en español: ~4 caracteres por token
+CHARS_PER_TOKEN = 4
+
+
+def build_class_context(db: Session, class_id: int, max_tokens: Optional[int] = None) -> str:
+    """
+    Construye el contexto de una clase para el prompt del modelo: categorías,
+    estudiantes con sus puntos actuales y los nombres que hay que desambiguar.
+    Usa tres consultas ligeras (sin historial) y un formato tabular compacto.
+    Si el texto supera `max_tokens`, primero se quitan los puntos y después se
+    recorta la lista de estudiantes.
+    """
+    max_tokens = settings.CHAT_CONTEXT_MAX_TOKENS if max_tokens is None else max_tokens
+
+    students = (
+        db.query(Student.id, Student.name)
+        .filter(Student.class_id == class_id)
+        .order_by(Student.name)
+        .all()
+    )
+    categories = (
+        db.query(Category.id, Category.name, Category.parent_id)
+        .filter(Category.class_id == class_id)
+        .order_by(Category.id)
+        .all()
+    )
+    grade_rows = (
+        db.query(Grade.student_id, Grade.category_id, Grade.grade)
+        .join(Student, Grade.student_id == Student.id)
+        .filter(Student.class_id == class_id)
+        .all()
+    )
+    grades = {(student_id, category_id): grade for student_id, category_id, grade in grade_rows}
+
+    children = defaultdict(list)
+    for category in categories:
+        if category.parent_id is not None:
+            children[category.parent_id].append(category.name)
+    # Solo las categorías sin subcategorías pueden recibir puntos
+    leaves = [category for category in categories if category.id not in children]
+
+    category_line = "Categorías: " + " | ".join(
+        f"{category.name} > {', '.join(children[category.id])}" if category.id in children else category.name
+        for category in categories
+        if category.parent_id is None
+    )
+    ambiguous_line = _ambiguous_names_line(student.name for student in students)
+
+    def render(with_grades: bool, limit: int) -> str:
+        lines = [category_line]
+        if with_grades:
+            lines.append(f"Estudiantes (nombre: puntos en {', '.join(leaf.name for leaf in leaves)}):")
+            lines.extend(
+                f"{student.name}: {','.join(_format_points(grades.get((student.id, leaf.id))) for leaf in leaves)}"
+                for student in students[:limit]
+            )
+        else:
+            lines.append("Estudiantes:")
+            lines.extend(student.name for student in students[:limit])
+        if limit < len(students):
+            lines.append(f"... y {len(students) - limit} estudiantes más.")
+        if ambiguous_line:
+            lines.append(ambiguous_line)
+        return "\n".join(lines)
+
+    budget = max_tokens * CHARS_PER_TOKEN
+    context = render(True, len(students))
+    if len(context) <= budget:
+        return context
+    context = render(False, len(students))
+    if len(context) <= budget:
+        return context
+
+    # Recortar estudiantes hasta caber en el presupuesto (búsqueda binaria)
+    low, high = 0, len(students)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if len(render(False, middle)) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return render(False, low)
+
+
+def build_dashboard_context(classes: Iterable) -> str:
+    """
+    Contexto del dashboard: una línea por clase con su id y su nombre.
+    """
+    lines = ["Clases del profesor (id: nombre):"]
+    lines.extend(f"{class_item.id}: {class_item.name}" for class_item in classes)
+    return "\n".join(lines)
+
+
+def format_grade_changes(changes: Iterable[dict]) -> str:
+    """
+    Describe un cambio de notas de forma compacta para enviarlo a las sesiones
+    abiertas, p. ej. "Juan Pérez Comportamiento 20 (+10)".
+    Cada cambio lleva `name`, `category`, `total_grade` y `points`.
+    """
+    return "; ".join(
+        f"{change['name']} {change['category']} {_format_points(change['total_grade'])} "
+        f"({'+' if change['points'] >= 0 else ''}{_format_points(change['points'])})"
+        for change in changes
+    )
+
+
+class ContextUpdateLog:
+    """
+    Registro por clase de los últimos cambios de notas, indexado por la versión
+    de la clase en la base de datos (`Class.data_version`), que es la misma
+    para todos los workers. Cada sesión de chat recuerda la versión con la que
+    se construyó su contexto y, antes del siguiente mensaje, recibe solo los
+    cambios posteriores. Si falta alguna versión intermedia (un cambio hecho
+    desde otro proceso, o que no es de notas), hay que reconstruir el contexto.
+    """
+
+    def __init__(self, max_entries_per_class: int):
+        self.max_entries_per_class = max_entries_per_class
+        self._entries = defaultdict(lambda: deque(maxlen=self.max_entries_per_class))
+        self._lock = threading.Lock()
+
+    def record(self, class_id: int, version: int, text: str) -> None:
+        with self._lock:
+            self._entries[class_id].append((version, text))
+
+    def reset(self, class_id: int) -> None:
+        """
+        Olvida los cambios guardados para que las sesiones abiertas reciban el
+        contexto completo en su siguiente mensaje.
+        """
+        with self._lock:
+            self._entries.pop(class_id, None)
+
+    def changes_since(self, class_id: int, version: Optional[int], latest: Optional[int]) -> Optional[List[str]]:
+        """
+        Cambios entre `version` y `latest` (la versión actual de la clase), o
+        None si el registro de este proceso no los tiene todos.
+        """
+        if version is None or latest is None:
+            return None
+        if latest <= version:
+            return []
+        with self._lock:
+            texts = dict(self._entries.get(class_id, ()))
+        wanted = range(version + 1, latest + 1)
+        if any(entry_version not in texts for entry_version in wanted):
+            return None
+        return [texts[entry_version] for entry_version in wanted]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+context_updates = ContextUpdateLog(settings.CHAT_CONTEXT_MAX_UPDATES)
+
+
+def record_grade_changes(class_id: int, version: int, changes: Iterable[dict]) -> None:
+    """
+    Hook para llamar tras el commit de un cambio de notas de una clase, con la
+    versión de la clase que dejó ese cambio.
+    """
+    text = format_grade_changes(changes)
+    if text:
+        context_updates.record(class_id, version, text)
+
+
+def invalidate_class_context(class_id: int) -> None:
+    """
+    Hook para llamar cuando cambian los estudiantes o las categorías de una clase.
+    """
+    context_updates.reset(class_id)
+
+
+def load_class_context(db: Session, class_id: int) -> Tuple[Optional[int], str]:
+    """
+    Versión actual de la clase y su contexto completo. La versión se lee antes:
+    un cambio que llegue entre medias se volverá a enviar, pero no se pierde.
+    """
+    version = get_class_version(db, class_id)
+    return version, build_class_context(db, class_id)
+
+
+def with_context_updates(db: Session, chat_session, class_id: int, message: str) -> Tuple[Optional[int], str]:
+    """
+    Antepone al mensaje los cambios de notas que la sesión aún no conoce. Si
+    este proceso no los tiene todos (o la sesión se restauró sin versión),
+    antepone el contexto completo de la clase. Devuelve la versión que conocerá
+    la sesión y el mensaje; quien llama guarda la versión en la sesión solo si
+    el modelo responde, para que tras un error los cambios se vuelvan a enviar.
+    """
+    latest = get_class_version(db, class_id)
+    changes = context_updates.changes_since(class_id, getattr(chat_session, "context_version", None), latest)
+    if changes is None:
+        version, context = load_class_context(db, class_id)
+        return version, f"[Datos actualizados de la clase]\n{context}\n\n{message}"
+    if changes:
+        return latest, f"[Cambios de notas: {'; '.join(changes)}]\n{message}"
+    return latest, message
+
+
+def _ambiguous_names_line(names: Iterable[str]) -> str:
+    # Nombres de pila compartidos por varios estudiantes
+    by_first_name = defaultdict(list)
+    for name in names:
+        by_first_name[name.split()[0].lower() if name.split() else name].append(name)
+    groups = [group for group in by_first_name.values() if len(group) > 1]
+    if not groups:
+        return ""
+    return "Nombres repetidos (pregunta a quién se refiere): " + "; ".join(" / ".join(group) for group in groups)
+
+
+def _format_points(value) -> str:
+    if value is None:
+        return "0"
+    return str(int(value)) if float(value).is_integer() else f"{value:g}"
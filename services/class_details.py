@@ -0,0 +1,67 @@
+from collections import defaultdict
+from typing import Optional
+from sqlalchemy.orm import Session, selectinload
+from models import Class
+
+
+def load_class_details(db: Session, class_id: int) -> Optional[dict]:
+    """
+    Carga una clase con sus categorías, retos e items en un número constante de
+    consultas (la clase y un SELECT ... IN por cada relación, con selectinload)
+    y monta el árbol de categorías en memoria a partir de `parent_id`.
+    Devuelve None si la clase no existe.
+    """
+    class_item = (
+        db.query(Class)
+        .options(
+            selectinload(Class.categories),
+            selectinload(Class.challenges),
+            selectinload(Class.items),
+        )
+        .filter(Class.id == class_id)
+        .first()
+    )
+    if not class_item:
+        return None
+
+    categories = sorted(class_item.categories, key=lambda category: category.id)
+    subcategories_by_parent = defaultdict(list)
+    for category in categories:
+        if category.parent_id is not None:
+            subcategories_by_parent[category.parent_id].append(
+                {"id": category.id, "name": category.name, "weight": category.weight}
+            )
+    category_data = [
+        {
+            "id": category.id,
+            "name": category.name,
+            "weight": category.weight,
+            "subcategories": subcategories_by_parent.get(category.id, []),
+        }
+        for category in categories
+        if category.parent_id is None  # Solo las categorías principales
+    ]
+
+    challenges_data = [
+        {"id": challenge.id, "name": challenge.name, "description": challenge.description, "icon_path": challenge.icon_path, "level": challenge.level}
+        for challenge in sorted(class_item.challenges, key=lambda challenge: challenge.id)
+    ]
+    items_data = [
+        {"id": item.id, "name": item.name, "description": item.description, "price": item.price, "expirationEnabled": item.expirationEnabled, "expirationTime": item.expirationTime, "usesEnabled": item.usesEnabled, "uses": item.uses, "icon": item.icon}
+        for item in sorted(class_item.items, key=lambda item: item.id)
+    ]
+
+    return {
+        "id": class_item.id,
+        "name": class_item.name,
+        "description": class_item.description,
+        "academic_year": class_item.academic_year,
+        "group": class_item.group,
+        "subject": class_item.subject,
+        "is_invitation_code_enabled": class_item.isInvitationCodeEnabled,
+        "invitation_link": class_item.inviteLink,
+        "invitation_code": class_item.inviteCode,
+        "categories": category_data,
+        "challenges": challenges_data,
+        "items": items_data,
+    }
@@ -0,0 +1,151 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set
+from sqlalchemy import delete, insert, update
+from sqlalchemy.orm import Session
+from models import Category, Challenge, Item
+from schemas import ClassSettingsRequest
+
+CATEGORY_FIELDS = ("name", "weight")
+CHALLENGE_FIELDS = ("name", "description", "icon_path", "level")
+ITEM_FIELDS = ("name", "description", "price", "expirationEnabled", "expirationTime", "usesEnabled", "uses", "icon")
+
+
+@dataclass
+class RowDiff:
+    """
+    Cambios a aplicar sobre una tabla: filas nuevas (valores sin id), filas
+    existentes que cambian (valores con su id) e ids a borrar.
+    """
+    inserts: List[dict] = field(default_factory=list)
+    updates: List[dict] = field(default_factory=list)
+    deletes: Set[int] = field(default_factory=set)
+    # Para cada fila pedida, el id existente con el que se ha emparejado (o None si es nueva)
+    matched: List[Optional[int]] = field(default_factory=list)
+
+    def summary(self) -> dict:
+        return {"inserted": len(self.inserts), "updated": len(self.updates), "deleted": len(self.deletes)}
+
+
+def diff_rows(existing: Dict[int, object], requested: Iterable, fields: Iterable[str]) -> RowDiff:
+    """
+    Compara las filas actuales (por id) con las enviadas por el cliente.
+    Una fila enviada con un id que existe se actualiza solo si algún campo
+    cambia; sin id, o con un id desconocido o repetido, se crea; las filas
+    actuales que no aparecen se borran.
+    """
+    fields = tuple(fields)
+    diff = RowDiff()
+    claimed = set()
+    for row in requested:
+        values = {name: getattr(row, name) for name in fields}
+        row_id = getattr(row, "id", None)
+        current = existing.get(row_id) if row_id is not None else None
+        if current is None or row_id in claimed:
+            diff.inserts.append(values)
+            diff.matched.append(None)
+            continue
+        claimed.add(row_id)
+        diff.matched.append(row_id)
+        if any(getattr(current, name) != value for name, value in values.items()):
+            diff.updates.append({"id": row_id, **values})
+    diff.deletes = set(existing) - claimed
+    return diff
+
+
+def _apply(db: Session, model, class_id: int, diff: RowDiff) -> None:
+    """
+    Aplica un RowDiff con una sentencia por tipo de cambio: DELETE ... IN,
+    UPDATE por clave primaria (executemany) e INSERT (executemany).
+    """
+    if diff.deletes:
+        db.execute(delete(model).where(model.id.in_(diff.deletes)), execution_options={"synchronize_session": False})
+    if diff.updates:
+        db.execute(update(model), diff.updates)
+    if diff.inserts:
+        db.execute(insert(model), [{"class_id": class_id, **values} for values in diff.inserts])
+
+
+def _insert_returning_ids(db: Session, class_id: int, rows: List[dict]) -> List[int]:
+    """
+    Inserta categorías principales y devuelve sus ids en el mismo orden, que
+    hacen falta para colgar de ellas las subcategorías nuevas. Con SQLite,
+    PostgreSQL o MariaDB es un único INSERT ... RETURNING; MySQL no admite
+    RETURNING y se recurre a un flush del ORM (un INSERT por fila).
+    """
+    if not rows:
+        return []
+    rows = [{"class_id": class_id, **values} for values in rows]
+    if db.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+        statement = insert(Category).returning(Category.id, sort_by_parameter_order=True)
+        return list(db.scalars(statement, rows))
+    new_categories = [Category(**values) for values in rows]
+    db.add_all(new_categories)
+    db.flush()
+    return [category.id for category in new_categories]
+
+
+def sync_categories(db: Session, class_id: int, requested) -> dict:
+    """
+    Sincroniza las categorías y subcategorías de la clase con las enviadas.
+    Carga todas las categorías de la clase en una consulta y las subcategorías
+    se emparejan solo dentro de su categoría principal.
+    """
+    existing = db.query(Category).filter(Category.class_id == class_id).all()
+    top_level = {category.id: category for category in existing if category.parent_id is None}
+    subcategories_by_parent = defaultdict(dict)
+    for category in existing:
+        if category.parent_id is not None:
+            subcategories_by_parent[category.parent_id][category.id] = category
+
+    top_diff = diff_rows(top_level, requested, CATEGORY_FIELDS)
+
+    new_ids = iter(_insert_returning_ids(db, class_id, top_diff.inserts))
+
+    sub_diff = RowDiff()
+    for category, matched_id in zip(requested, top_diff.matched):
+        parent_id = matched_id if matched_id is not None else next(new_ids)
+        diff = diff_rows(subcategories_by_parent.get(matched_id, {}), category.subcategories or [], CATEGORY_FIELDS)
+        sub_diff.inserts.extend({"parent_id": parent_id, **values} for values in diff.inserts)
+        sub_diff.updates.extend(diff.updates)
+        sub_diff.deletes |= diff.deletes
+    # Las subcategorías de las categorías borradas se borran con ellas
+    for parent_id in top_diff.deletes:
+        sub_diff.deletes |= set(subcategories_by_parent.get(parent_id, {}))
+
+    _apply(db, Category, class_id, sub_diff)
+    _apply(db, Category, class_id, RowDiff(updates=top_diff.updates, deletes=top_diff.deletes))
+
+    return {
+        "categories": top_diff.summary(),
+        "subcategories": sub_diff.summary(),
+    }
+
+
+def sync_class_settings(db: Session, class_id: int, class_data: ClassSettingsRequest) -> dict:
+    """
+    Sincroniza categorías, retos e items de una clase con los datos de la
+    página de ajustes: una consulta por tabla para leer el estado actual y
+    sentencias masivas para aplicar la diferencia. No hace commit, así que
+    todo queda en la transacción de la sesión. Una lista a None deja esa
+    parte de la clase sin cambios. Devuelve el número de filas creadas,
+    actualizadas y borradas por tabla.
+    """
+    summary = {}
+
+    if class_data.categories is not None:
+        summary.update(sync_categories(db, class_id, class_data.categories))
+
+    if class_data.challenges is not None:
+        existing = {challenge.id: challenge for challenge in db.query(Challenge).filter(Challenge.class_id == class_id)}
+        diff = diff_rows(existing, class_data.challenges, CHALLENGE_FIELDS)
+        _apply(db, Challenge, class_id, diff)
+        summary["challenges"] = diff.summary()
+
+    if class_data.items is not None:
+        existing = {item.id: item for item in db.query(Item).filter(Item.class_id == class_id)}
+        diff = diff_rows(existing, class_data.items, ITEM_FIELDS)
+        _apply(db, Item, class_id, diff)
+        summary["items"] = diff.summary()
+
+    return summary
@@ -0,0 +1,92 @@
+import hashlib
+from typing import Iterable, Optional
+from fastapi import Request, Response
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+from models import Class
+
+BUMPED_KEY = "bumped_class_versions"
+
+
+def bump_class_versions(db: Session, class_ids: Iterable[int]) -> None:
+    """
+    Incrementa el contador de versión de las clases indicadas. Se llama en la
+    misma transacción que la escritura (antes del commit), de modo que una
+    lectura nunca ve datos nuevos con una versión antigua.
+    """
+    class_ids = set(class_ids)
+    if class_ids:
+        db.execute(
+            update(Class)
+            .where(Class.id.in_(class_ids))
+            .values(data_version=Class.data_version + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def bump_class_version(db: Session, class_id: int) -> None:
+    bump_class_versions(db, [class_id])
+
+
+def bump_class_version_once(db: Session, class_id: int) -> Optional[int]:
+    """
+    Incrementa la versión de la clase una sola vez por transacción y devuelve
+    la nueva versión. El UPDATE bloquea la fila de la clase hasta el commit, así
+    que las escrituras de notas de una misma clase se serializan: se acepta
+    porque las transacciones de notas son cortas y ya se disputan las mismas
+    filas de notas, y se limita a una vez por transacción (no por nota).
+    """
+    bumped = db.info.setdefault(BUMPED_KEY, {})
+    if class_id not in bumped:
+        bump_class_version(db, class_id)
+        # La fila está bloqueada por esta transacción: la versión leída es la nuestra
+        bumped[class_id] = get_class_version(db, class_id)
+    return bumped[class_id]
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _forget_bumped_versions(session) -> None:
+    session.info.pop(BUMPED_KEY, None)
+
+
+def get_class_version(db: Session, class_id: int) -> Optional[int]:
+    """
+    Versión actual de la clase (una consulta sobre su fila), o None si no existe.
+    """
+    return db.execute(select(Class.data_version).where(Class.id == class_id)).scalar_one_or_none()
+
+
+def class_etag(resource: str, class_id: int, version: int, *variant) -> str:
+    """
+    ETag débil de una lectura de la clase. `variant` recoge los parámetros que
+    cambian la respuesta (p. ej. el modo de historial del roster).
+    """
+    tag = f"{resource}-{class_id}-{version}"
+    if variant:
+        tag += "-" + hashlib.sha1(repr(variant).encode()).hexdigest()[:8]
+    return f'W/"{tag}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Comparación débil de If-None-Match (RFC 9110): admite "*" y listas de ETags.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    wanted = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == wanted for candidate in if_none_match.split(","))
+
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    Devuelve un 304 si el cliente ya tiene esta versión; si no, añade el ETag
+    a la respuesta normal. Cache-Control obliga al navegador a revalidar.
+    """
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
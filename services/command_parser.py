@@ -0,0 +1,129 @@
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+from services.name_index import ClassNameIndex, IndexedStudent, IndexedCategory, normalize_name
+
+# Verbos (ya normalizados, sin tildes) que suman o restan puntos. "Pon" y "da"
+# no están: "ponle un 5" fija la nota, no la suma, así que decide el modelo
+AWARD_VERBS = ("anade", "anadele", "anadir", "agrega", "agregale", "agregar", "suma", "sumale", "sumar",
+               "dale", "dar")
+DEDUCT_VERBS = ("quita", "quitale", "quitar", "resta", "restale", "restar", "descuenta", "descontar")
+
+_POINTS = r"(?P<sign>[+-])?\s*(?P<points>\d+(?:[.,]\d+)?)\s*(?:puntos?|ptos?\.?)?"
+
+# "Añade 10 puntos a Juan y María en comportamiento", "-5 a Juan en tareas"
+VERB_FIRST = re.compile(
+    rf"^(?:(?P<verb>{'|'.join(AWARD_VERBS + DEDUCT_VERBS)})\s+)?{_POINTS}\s+(?:a|al|para)\s+(?P<names>.+?)\s+en\s+(?P<category>.+)$"
+)
+# "Juan +10 en comportamiento", "Juan y María -5 puntos en tareas"
+NAMES_FIRST = re.compile(rf"^(?P<names>.+?)\s+{_POINTS}\s+en\s+(?P<category>.+)$")
+
+_NAME_SEPARATORS = re.compile(r"\s*,\s*|\s+y\s+|\s+e\s+")
+
+
+@dataclass(frozen=True)
+class LocalCommand:
+    """
+    Comando de notas reconocido y resuelto sin pasar por el modelo.
+    """
+    students: List[IndexedStudent]
+    category: IndexedCategory
+    points: float
+
+    def describe(self) -> str:
+        """
+        Confirmación con el mismo formato que las respuestas del modelo.
+        """
+        names = [student.name for student in self.students]
+        joined = names[0] if len(names) == 1 else f"{', '.join(names[:-1])} y {names[-1]}"
+        points = int(self.points) if float(self.points).is_integer() else self.points
+        return f"Ok. {joined} {'+' if self.points >= 0 else ''}{points} puntos en {self.category.name}"
+
+
+def parse_local_command(message: str, index: ClassNameIndex) -> Optional[LocalCommand]:
+    """
+    Interpreta las órdenes habituales para sumar o quitar puntos y resuelve los
+    nombres con el índice de la clase. Devuelve None si la frase no sigue la
+    gramática conocida o si algún nombre o categoría no se resuelve sin dudas;
+    en ese caso la decisión es del modelo.
+    """
+    text = normalize_name(message).rstrip(".!¡¿? ")
+    match = VERB_FIRST.match(text) or NAMES_FIRST.match(text)
+    if not match:
+        return None
+
+    points = float(match.group("points").replace(",", "."))
+    verb = match.groupdict().get("verb")
+    sign = match.group("sign")
+    if verb in DEDUCT_VERBS:
+        if sign == "-":
+            return None  # "quita -5" no está claro
+        points = -points
+    elif sign == "-":
+        if verb:
+            return None  # "añade -5" no está claro
+        points = -points
+    elif verb is None and match.re is NAMES_FIRST and sign is None:
+        return None  # "Juan 10 en tareas" sin signo ni verbo: que decida el modelo
+    if points == 0:
+        return None
+
+    category = index.resolve_category(match.group("category"))
+    if category is None or category.subcategories:
+        return None
+
+    students = []
+    for name in _NAME_SEPARATORS.split(match.group("names")):
+        if not name:
+            return None
+        student = index.resolve_student(name)
+        if student is None:
+            return None
+        if student not in students:
+            students.append(student)
+
+    return LocalCommand(students=students, category=category, points=points)
+
+
+# Prefijo con el que el modelo confirma una orden de notas
+COMMAND_PREFIX = "Ok."
+
+
+class StreamingCommandDetector:
+    """
+    Detecta una orden de notas en una respuesta del modelo que llega por
+    fragmentos. En cuanto el texto deja de poder empezar por "Ok." se descarta;
+    si empieza así, la orden se analiza (con `parse`) al completarse la primera
+    línea, sin esperar al resto de la respuesta.
+    """
+
+    def __init__(self, parse):
+        self.parse = parse
+        self.text = ""
+        self.done = False
+
+    def feed(self, chunk: str) -> Optional[dict]:
+        """
+        Añade un fragmento y devuelve la orden si acaba de completarse.
+        """
+        self.text += chunk
+        if self.done:
+            return None
+        if not COMMAND_PREFIX.startswith(self.text[:len(COMMAND_PREFIX)]):
+            self.done = True
+            return None
+        if "\n" in self.text:
+            return self._parse(self.text.split("\n", 1)[0])
+        return None
+
+    def finish(self) -> Optional[dict]:
+        """
+        Fin de la respuesta: analiza la línea pendiente, si la hay.
+        """
+        if self.done:
+            return None
+        return self._parse(self.text)
+
+    def _parse(self, line: str) -> Optional[dict]:
+        self.done = True
+        return self.parse(line)
@@ -0,0 +1,180 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from config import settings
+from services.query_counter import record_query
+
+logger = logging.getLogger("uvicorn.error")
+
+# Límites (en segundos) del histograma de espera al pedir una conexión al pool
+CHECKOUT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+
+class DatabaseMetrics:
+    """
+    Contadores del pool de conexiones y de las consultas, por motor ("sync" o
+    "async"). Se alimentan de los eventos de SQLAlchemy y se exponen en /metrics
+    en el formato de texto de Prometheus.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engines = {}
+        self.checkouts = defaultdict(int)
+        self.checkout_timeouts = defaultdict(int)
+        self.checkout_seconds_sum = defaultdict(float)
+        self.checkout_buckets = defaultdict(lambda: [0] * len(CHECKOUT_BUCKETS))
+        self.in_use = defaultdict(int)
+        self.connections_created = defaultdict(int)
+        self.invalidations = defaultdict(int)
+        self.queries = defaultdict(int)
+        self.query_seconds_sum = defaultdict(float)
+        self.slow_queries = defaultdict(int)
+
+    def register_engine(self, label: str, engine) -> None:
+        self._engines[label] = engine
+
+    def observe_checkout(self, label: str, seconds: float) -> None:
+        with self._lock:
+            self.checkouts[label] += 1
+            self.checkout_seconds_sum[label] += seconds
+            buckets = self.checkout_buckets[label]
+            for position, bound in enumerate(CHECKOUT_BUCKETS):
+                if seconds <= bound:
+                    buckets[position] += 1
+
+    def observe_query(self, label: str, seconds: float, statement: str) -> None:
+        with self._lock:
+            self.queries[label] += 1
+            self.query_seconds_sum[label] += seconds
+            slow = seconds * 1000 >= settings.DB_SLOW_QUERY_MS
+            if slow:
+                self.slow_queries[label] += 1
+        if slow:
+            logger.warning("Consulta lenta (%.0f ms): %s", seconds * 1000, " ".join(statement.split())[:500])
+
+    def increment(self, counter: dict, label: str, amount: int = 1) -> None:
+        with self._lock:
+            counter[label] += amount
+
+    def render_prometheus(self) -> str:
+        """
+        Devuelve las métricas en el formato de texto de Prometheus (versión 0.0.4).
+        """
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                rendered = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{name}{{{rendered}}} {value}")
+
+        with self._lock:
+            labels = sorted(set(self._engines) | set(self.checkouts) | set(self.queries))
+            pools = {label: self._engines[label].pool for label in labels if label in self._engines}
+
+            metric("db_pool_size", "gauge", "Conexiones permanentes configuradas en el pool.",
+                   [({"engine": label}, pool.size()) for label, pool in pools.items() if hasattr(pool, "size")])
+            metric("db_pool_checked_in", "gauge", "Conexiones libres en el pool.",
+                   [({"engine": label}, pool.checkedin()) for label, pool in pools.items() if hasattr(pool, "checkedin")])
+            metric("db_pool_overflow", "gauge", "Conexiones abiertas por encima de pool_size (negativo si aún no se han abierto todas).",
+                   [({"engine": label}, pool.overflow()) for label, pool in pools.items() if hasattr(pool, "overflow")])
+            metric("db_pool_connections_in_use", "gauge", "Conexiones prestadas a peticiones en este momento.",
+                   [({"engine": label}, self.in_use[label]) for label in labels])
+            metric("db_pool_connections_created_total", "counter", "Conexiones nuevas abiertas con la base de datos.",
+                   [({"engine": label}, self.connections_created[label]) for label in labels])
+            metric("db_pool_invalidations_total", "counter", "Conexiones descartadas por error o por pre-ping.",
+                   [({"engine": label}, self.invalidations[label]) for label in labels])
+            metric("db_pool_checkout_timeouts_total", "counter", "Peticiones que agotaron pool_timeout esperando una conexión.",
+                   [({"engine": label}, self.checkout_timeouts[label]) for label in labels])
+
+            lines.append("# HELP db_pool_checkout_seconds Espera hasta obtener una conexión del pool.")
+            lines.append("# TYPE db_pool_checkout_seconds histogram")
+            for label in labels:
+                for bound, count in zip(CHECKOUT_BUCKETS, self.checkout_buckets[label]):
+                    lines.append(f'db_pool_checkout_seconds_bucket{{engine="{label}",le="{bound}"}} {count}')
+                lines.append(f'db_pool_checkout_seconds_bucket{{engine="{label}",le="+Inf"}} {self.checkouts[label]}')
+                lines.append(f'db_pool_checkout_seconds_sum{{engine="{label}"}} {self.checkout_seconds_sum[label]}')
+                lines.append(f'db_pool_checkout_seconds_count{{engine="{label}"}} {self.checkouts[label]}')
+
+            metric("db_queries_total", "counter", "Consultas ejecutadas.",
+                   [({"engine": label}, self.queries[label]) for label in labels])
+            metric("db_query_seconds_total", "counter", "Tiempo total en consultas.",
+                   [({"engine": label}, self.query_seconds_sum[label]) for label in labels])
+            metric("db_slow_queries_total", "counter", f"Consultas de al menos {settings.DB_SLOW_QUERY_MS} ms.",
+                   [({"engine": label}, self.slow_queries[label]) for label in labels])
+
+        return "\n".join(lines) + "\n"
+
+
+db_metrics = DatabaseMetrics()
+
+
+class CheckoutTimingMixin:
+    """
+    Mide cuánto se espera al pedir una conexión al pool y cuántas esperas
+    agotan `pool_timeout`.
+    """
+    metrics_label = "sync"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            db_metrics.increment(db_metrics.checkout_timeouts, self.metrics_label)
+            raise
+        finally:
+            db_metrics.observe_checkout(self.metrics_label, time.perf_counter() - start)
+
+
+class InstrumentedQueuePool(CheckoutTimingMixin, QueuePool):
+    metrics_label = "sync"
+
+
+class InstrumentedAsyncAdaptedQueuePool(CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    metrics_label = "async"
+
+
+def instrument_engine(engine, label: str) -> None:
+    """
+    Registra los eventos del pool y de las consultas de un motor. Para un
+    AsyncEngine hay que pasar `async_engine.sync_engine`.
+    """
+    db_metrics.register_engine(label, engine)
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        db_metrics.increment(db_metrics.connections_created, label)
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        db_metrics.increment(db_metrics.in_use, label)
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        db_metrics.increment(db_metrics.in_use, label, -1)
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        db_metrics.increment(db_metrics.invalidations, label)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        db_metrics.observe_query(label, elapsed, statement)
+        record_query(statement, elapsed)
+
+    @event.listens_for(engine, "handle_error")
+    def on_error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
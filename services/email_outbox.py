@@ -0,0 +1,362 @@
+import logging
+import random
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import List, Optional
+from sqlalchemy import event, or_, select, update
+from sqlalchemy.orm import Session
+from config import settings
+from models import OutboxEmail
+
+logger = logging.getLogger("uvicorn.error")
+
+PENDING_KEY = "pending_outbox_emails"
+# Tiempo mínimo que un worker se reserva un correo; si el proceso muere, otro
+# lo retoma. La reserva de lo que queda del lote se renueva tras cada mensaje,
+# así que solo tiene que cubrir el peor caso de un mensaje
+LEASE_SECONDS = 300
+# Un mensaje puede encadenar varias órdenes SMTP, cada una con su timeout
+# (NOOP, conexión, EHLO, STARTTLS, login, MAIL, RCPT, DATA)
+SMTP_COMMANDS_PER_MESSAGE = 8
+# Errores de la conexión y no del mensaje: se reintenta el lote entero más tarde
+CONNECTION_ERRORS = (
+    smtplib.SMTPServerDisconnected,
+    smtplib.SMTPConnectError,
+    smtplib.SMTPHeloError,
+    smtplib.SMTPAuthenticationError,
+)
+
+
+def is_connection_error(error: Exception) -> bool:
+    # SMTPException hereda de OSError: solo cuentan los errores de red "puros"
+    if isinstance(error, CONNECTION_ERRORS):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+def queue_email(db: Session, to_email: str, subject: str, html_body: str) -> OutboxEmail:
+    """
+    Guarda el correo en la cola de salida dentro de la transacción de la
+    petición. No se envía nada hasta el commit: si la petición falla y hace
+    rollback, el correo desaparece con el resto de cambios.
+    """
+    email = OutboxEmail(
+        to_email=to_email,
+        subject=subject,
+        html_body=html_body,
+        status="pending",
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+    )
+    db.add(email)
+    db.info[PENDING_KEY] = True
+    return email
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_outbox_worker(session) -> None:
+    if session.info.pop(PENDING_KEY, False):
+        email_outbox.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_outbox_wakeup(session) -> None:
+    session.info.pop(PENDING_KEY, None)
+
+
+class SMTPConnection:
+    """
+    Conexión SMTP reutilizable: se abre (STARTTLS y login incluidos) la primera
+    vez que hace falta y se mantiene entre lotes. Antes de reutilizarla se
+    comprueba con NOOP, y se cierra si lleva más de SMTP_IDLE_SECONDS sin uso
+    (los servidores cortan las conexiones ociosas de todos modos).
+    """
+
+    def __init__(self, host: str, port: int, user: str = "", password: str = "",
+                 starttls: bool = True, timeout: float = 30, idle_seconds: float = 60):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_seconds = idle_seconds
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self.connections_opened = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self.connections_opened += 1
+        return smtp
+
+    def ensure(self) -> smtplib.SMTP:
+        """
+        Conexión lista para enviar, abriendo una nueva si la anterior caducó o
+        el servidor la cerró.
+        """
+        if self._smtp is not None and time.monotonic() - self._last_used > self.idle_seconds:
+            self.close()
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] != 250:
+                    self.close()
+            except OSError:
+                self.close()
+        if self._smtp is None:
+            self._smtp = self._connect()
+        self._last_used = time.monotonic()
+        return self._smtp
+
+    def send(self, from_addr: str, to_addr: str, message: str) -> None:
+        smtp = self.ensure()
+        try:
+            smtp.sendmail(from_addr, [to_addr], message)
+        except Exception as error:
+            if is_connection_error(error):
+                self.close()
+            raise
+        self._last_used = time.monotonic()
+
+    def close(self) -> None:
+        smtp, self._smtp = self._smtp, None
+        if smtp is None:
+            return
+        try:
+            smtp.quit()
+        except Exception:
+            smtp.close()
+
+
+def is_permanent_failure(error: Exception) -> bool:
+    """
+    Rechazos 5xx del servidor para este mensaje (destinatario inexistente,
+    remitente no permitido...): reintentarlos no sirve de nada. Los fallos de
+    autenticación son de configuración, no del mensaje, y se reintentan. Un
+    destinatario rechazado con 4xx (p. ej. greylisting, 450/451) es temporal.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return bool(error.recipients) and all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def build_message(from_addr: str, email: OutboxEmail) -> str:
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = email.subject
+    msg["From"] = from_addr
+    msg["To"] = email.to_email
+    msg.attach(MIMEText(email.html_body, "html"))
+    return msg.as_string()
+
+
+class EmailOutboxWorker:
+    """
+    Hilo que envía la cola de salida. Cada vuelta reserva hasta
+    EMAIL_BATCH_SIZE correos pendientes (con un UPDATE por fila, para que
+    varios procesos puedan compartir la tabla sin enviar dos veces el mismo),
+    los envía por una sola conexión SMTP y registra el resultado. Los fallos
+    temporales se reintentan con backoff exponencial y jitter hasta
+    EMAIL_MAX_ATTEMPTS; los rechazos permanentes quedan como "failed".
+    """
+
+    def __init__(self, session_factory, connection: SMTPConnection, from_addr: str,
+                 batch_size: int = 20, max_attempts: int = 6,
+                 retry_base_seconds: float = 30, poll_seconds: float = 10,
+                 lease_seconds: float = LEASE_SECONDS):
+        self.session_factory = session_factory
+        self.connection = connection
+        self.from_addr = from_addr
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.connection.close()
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                # Lote completo: puede haber más pendientes, seguir sin esperar
+                if self.run_once() == self.batch_size:
+                    continue
+            except Exception:
+                logger.exception("Error en el worker de la cola de correo")
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+
+    def run_once(self) -> int:
+        """
+        Procesa un lote y devuelve cuántos correos llegaron a entregarse al
+        servidor (enviados o rechazados); 0 si no había nada o el servidor no
+        responde, y entonces el worker espera a la siguiente vuelta.
+        """
+        with self.session_factory(expire_on_commit=False) as db:
+            emails = self._claim(db)
+            if not emails:
+                return 0
+            return self._send_batch(db, emails)
+
+    def _claim(self, db: Session) -> List[OutboxEmail]:
+        now = datetime.utcnow()
+        available = or_(OutboxEmail.locked_until.is_(None), OutboxEmail.locked_until < now)
+        candidate_ids = db.execute(
+            select(OutboxEmail.id)
+            .where(OutboxEmail.status == "pending", OutboxEmail.next_attempt_at <= now, available)
+            .order_by(OutboxEmail.next_attempt_at, OutboxEmail.id)
+            .limit(self.batch_size)
+        ).scalars().all()
+
+        claimed = []
+        lease = now + timedelta(seconds=self.lease_seconds)
+        for email_id in candidate_ids:
+            result = db.execute(
+                update(OutboxEmail)
+                .where(OutboxEmail.id == email_id, OutboxEmail.status == "pending", available)
+                .values(locked_until=lease)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                claimed.append(email_id)
+        db.commit()
+        if not claimed:
+            return []
+        return db.execute(
+            select(OutboxEmail).where(OutboxEmail.id.in_(claimed)).order_by(OutboxEmail.id)
+        ).scalars().all()
+
+    def _send_batch(self, db: Session, emails: List[OutboxEmail]) -> int:
+        for index, email in enumerate(emails):
+            try:
+                self.connection.send(self.from_addr, email.to_email, build_message(self.from_addr, email))
+            except Exception as error:
+                if is_connection_error(error):
+                    # Servidor caído o credenciales mal: el resto del lote correría la misma suerte
+                    for pending in emails[index:]:
+                        self._schedule_retry(pending, error)
+                    db.commit()
+                    return index
+                if is_permanent_failure(error):
+                    email.attempts += 1
+                    self._mark_failed(email, error)
+                else:
+                    self._schedule_retry(email, error)
+            else:
+                email.status = "sent"
+                email.attempts += 1
+                email.sent_at = datetime.utcnow()
+                email.locked_until = None
+                email.last_error = None
+                self.sent += 1
+            # Guardar cada resultado: si el proceso muere a mitad de lote no se
+            # reenvía lo ya enviado. Lo que queda del lote sigue reservado
+            self._renew_lease(db, emails[index + 1:])
+            db.commit()
+        return len(emails)
+
+    def _renew_lease(self, db: Session, emails: List[OutboxEmail]) -> None:
+        if not emails:
+            return
+        db.execute(
+            update(OutboxEmail)
+            .where(OutboxEmail.id.in_([email.id for email in emails]))
+            .values(locked_until=datetime.utcnow() + timedelta(seconds=self.lease_seconds))
+            .execution_options(synchronize_session=False)
+        )
+
+    def retry_delay(self, attempts: int) -> float:
+        """
+        Backoff exponencial con jitter: entre la mitad y el total de
+        base * 2^(intentos - 1).
+        """
+        delay = self.retry_base_seconds * 2 ** (attempts - 1)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _schedule_retry(self, email: OutboxEmail, error: Exception) -> None:
+        email.attempts += 1
+        if email.attempts >= self.max_attempts:
+            self._mark_failed(email, error)
+            return
+        email.next_attempt_at = datetime.utcnow() + timedelta(seconds=self.retry_delay(email.attempts))
+        email.locked_until = None
+        email.last_error = repr(error)[:255]
+        self.retried += 1
+        logger.warning("Correo %s a %s no enviado (intento %s): %r", email.id, email.to_email, email.attempts, error)
+
+    def _mark_failed(self, email: OutboxEmail, error: Exception) -> None:
+        email.status = "failed"
+        email.locked_until = None
+        email.last_error = repr(error)[:255]
+        self.failed += 1
+        logger.error("Correo %s a %s descartado: %r", email.id, email.to_email, error)
+
+    def metrics(self) -> dict:
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "smtp_connections": self.connection.connections_opened,
+        }
+
+
+def _create_worker() -> EmailOutboxWorker:
+    from database import SessionLocal
+
+    connection = SMTPConnection(
+        settings.SMTP_SERVER,
+        settings.SMTP_PORT,
+        user=settings.EMAIL_USER,
+        password=settings.EMAIL_PASS,
+        starttls=settings.SMTP_STARTTLS,
+        timeout=settings.SMTP_TIMEOUT_SECONDS,
+        idle_seconds=settings.SMTP_IDLE_SECONDS,
+    )
+    return EmailOutboxWorker(
+        SessionLocal,
+        connection,
+        from_addr=settings.EMAIL_FROM or settings.EMAIL_USER,
+        batch_size=settings.EMAIL_BATCH_SIZE,
+        max_attempts=settings.EMAIL_MAX_ATTEMPTS,
+        retry_base_seconds=settings.EMAIL_RETRY_BASE_SECONDS,
+        poll_seconds=settings.EMAIL_POLL_SECONDS,
+        lease_seconds=max(LEASE_SECONDS, SMTP_COMMANDS_PER_MESSAGE * settings.SMTP_TIMEOUT_SECONDS),
+    )
+
+
+email_outbox = _create_worker()
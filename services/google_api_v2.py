@@ -1,5 +1,12 @@
 from decouple import config
 import google.generativeai as genai
+import asyncio
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from config import settings
+from starlette.concurrency import run_in_threadpool
+from services.audio_upload import AudioClip, copy_for_job, delete_uploaded_audio, is_inline, upload_audio
 
 # Configuración del modelo Gemini
 genai.configure(api_key=config("GOOGLE_API_KEY"))
@@ -16,16 +23,115 @@ model = genai.GenerativeModel(
     model_name="gemini-2.0-flash-exp",
     generation_config=generation_config,
 )
-def prepare_prompt(state:str,class_data: dict):
+
+class LLMTimeoutError(Exception):
+    """
+    El modelo no respondió dentro de `LLM_TIMEOUT_SECONDS`.
+    """
+
+
+class LLMCallLimiter:
+    """
+    El SDK de Gemini es bloqueante: las llamadas se ejecutan en un pool de hilos
+    propio para no congelar el event loop, con un número fijo de huecos. Un
+    hueco se ocupa desde que empieza la llamada hasta que su hilo termina de
+    verdad, aunque quien la pidió haya dejado de esperar por un timeout, así
+    que el pool nunca acumula trabajo en cola: las llamadas que no consiguen
+    hueco a tiempo fallan con LLMTimeoutError. Además las llamadas sobre una
+    misma sesión de chat (que no es thread-safe) se hacen de una en una.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="gemini")
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._session_locks = weakref.WeakKeyDictionary()
+        self.running = 0
+
+    async def start(self, func, *args, timeout: float, session=None) -> asyncio.Future:
+        """
+        Espera como mucho `timeout` segundos a tener hueco (y el turno de la
+        sesión) y lanza `func` en el pool. Devuelve un future que termina con
+        el hilo; el hueco se libera entonces.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        session_lock = None
+        try:
+            if session is not None:
+                session_lock = self._session_locks.setdefault(session, asyncio.Lock())
+                await asyncio.wait_for(session_lock.acquire(), timeout)
+            try:
+                await asyncio.wait_for(self._slots.acquire(), max(deadline - loop.time(), 0))
+            except BaseException:
+                if session_lock is not None:
+                    session_lock.release()
+                raise
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError(f"El modelo no respondió en {timeout} segundos")
+
+        def release():
+            self.running -= 1
+            self._slots.release()
+            if session_lock is not None:
+                session_lock.release()
+
+        def on_done(_):
+            # Se ejecuta en el hilo del pool: liberar en el event loop
+            try:
+                loop.call_soon_threadsafe(release)
+            except RuntimeError:
+                pass  # el event loop ya se cerró
+
+        self.running += 1
+        try:
+            future = self.executor.submit(func, *args)
+        except BaseException:
+            release()
+            raise
+        future.add_done_callback(on_done)
+        return asyncio.wrap_future(future)
+
+    async def run(self, func, *args, timeout: float, session=None):
+        """
+        Ejecuta `func` en el pool y espera su resultado como mucho `timeout`
+        segundos en total (incluida la espera por un hueco).
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        future = await self.start(func, *args, timeout=timeout, session=session)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError(f"El modelo no respondió en {timeout} segundos")
+
+    def metrics(self) -> dict:
+        return {"running": self.running, "max_concurrency": self.max_concurrency}
+
+
+llm_limiter = LLMCallLimiter(settings.LLM_MAX_CONCURRENCY)
+
+
+async def run_llm_call(func, *args, timeout: float = None, session=None):
+    """
+    Ejecuta una llamada bloqueante al modelo en el pool de Gemini sin bloquear
+    el event loop. Con `session`, la llamada espera su turno en esa sesión de chat.
+    """
+    timeout = settings.LLM_TIMEOUT_SECONDS if timeout is None else timeout
+    return await llm_limiter.run(func, *args, timeout=timeout, session=session)
+
+def prepare_prompt(state:str,class_data: str):
     """
     Prepara el prompt inicial para una sesión de chat con el modelo Gemini.
+    `class_data` es el contexto compacto de services.class_context.
     """
     prompt1 = f"""
     Eres un asistente que puede interpretar comandos y 
     decidir si tiene la información para ejecutarlos. Puedes completar la 
     información basándote en la lista de datos que tienes.
 
-    Base de datos: {class_data}.
+    Base de datos:
+    {class_data}
 
     Ejemplo de comandos, (los nombres que apercen aquí son ficticios no tienen
      por que estar en la base de datos):
@@ -46,7 +152,8 @@ def prepare_prompt(state:str,class_data: dict):
     """
     promp2 = f"""
     Eres un asistente que conoce la base de datos de un usuario, profesor, que tiene varias clases.
-    Base de datos {class_data}
+    Base de datos:
+    {class_data}
     """
     if state == "in_dashboard":
         return promp2
@@ -56,7 +163,7 @@ def prepare_prompt(state:str,class_data: dict):
         return "Error: State not found"
 
 # Contexto inicial
-def create_chat_session_with_context(state:str,class_data: dict):
+def create_chat_session_with_context(state:str,class_data: str):
     
     # Crear la sesión de chat con el contexto inicial
     return model.start_chat(
@@ -72,26 +179,137 @@ def create_chat_session_with_context(state:str,class_data: dict):
         ]
     )
 
+# Atributos propios que se guardan junto al historial (huella del contexto del
+# dashboard y versión de la clase con la que se sincronizó la sesión); una
+# sesión restaurada sin ellos se trata como desactualizada
+SESSION_ATTRIBUTES = ("context_hash", "context_version")
+
+def serialize_chat_session(chat_session) -> dict:
+    """
+    Convierte una sesión de chat (historial y atributos propios) en un dict JSON serializable.
+    """
+    data = {
+        "history": [
+            {"role": content.role, "parts": [{"text": part.text} for part in content.parts if part.text]}
+            for content in chat_session.history
+        ]
+    }
+    for name in SESSION_ATTRIBUTES:
+        if getattr(chat_session, name, None) is not None:
+            data[name] = getattr(chat_session, name)
+    return data
+
+def restore_chat_session(data):
+    """
+    Reconstruye una sesión de chat a partir de su forma serializada. Acepta
+    también el formato anterior (solo la lista del historial).
+    """
+    if isinstance(data, list):
+        data = {"history": data}
+    chat_session = model.start_chat(history=data["history"])
+    for name in SESSION_ATTRIBUTES:
+        if name in data:
+            setattr(chat_session, name, data[name])
+    return chat_session
+
+def append_exchange(chat_session, message: str, response: str) -> None:
+    """
+    Añade una pregunta y su respuesta al historial sin llamar al modelo (p. ej.
+    una respuesta servida desde la caché), para que la conversación siga teniendo sentido.
+    """
+    chat_session.history = [
+        *chat_session.history,
+        genai.protos.Content(role="user", parts=[genai.protos.Part(text=message)]),
+        genai.protos.Content(role="model", parts=[genai.protos.Part(text=response)]),
+    ]
+
 async def get_gemini_response(chat_session, message: str) -> str:
     """
     Envía un mensaje al modelo Gemini dentro de una sesión de chat.
     """
-    response = chat_session.send_message(message)
+    response = await run_llm_call(chat_session.send_message, message, session=chat_session)
     return response.text
 
-async def get_gemini_audio_response(state: str, class_data: dict, file) -> bytes:
+async def stream_gemini_response(chat_session, message: str, timeout: float = None):
     """
-    Envía un mensaje al modelo Gemini dentro de una sesión de chat y obtiene la respuesta en formato de audio.
+    Igual que get_gemini_response, pero devuelve los fragmentos de texto a
+    medida que los genera el modelo (generador asíncrono). El SDK itera la
+    respuesta de forma bloqueante en el pool de Gemini y pasa cada fragmento
+    al event loop. `timeout` limita la duración total de la respuesta. Al
+    cerrar el generador (fin, error, timeout o desconexión del cliente) el
+    hilo deja de leer la respuesta en el siguiente fragmento.
     """
+    timeout = settings.LLM_TIMEOUT_SECONDS if timeout is None else timeout
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+    finished = object()
+    stop = threading.Event()
 
-    file_data = await file.read()
+    def emit(item):
+        if stop.is_set():
+            return
+        try:
+            loop.call_soon_threadsafe(chunks.put_nowait, item)
+        except RuntimeError:
+            stop.set()  # el event loop ya se cerró
 
-    response = model.generate_content([
-    prepare_prompt(state,class_data),
-    {
-        "mime_type": "audio/mp3",
-        "data": file_data,
-    }
-])
+    def produce():
+        try:
+            for chunk in chat_session.send_message(message, stream=True):
+                if stop.is_set():
+                    return
+                text = chunk.text if chunk.parts else ""
+                if text:
+                    emit(text)
+        except Exception as e:
+            emit(e)
+        else:
+            emit(finished)
+
+    deadline = loop.time() + timeout
+    future = await llm_limiter.start(produce, timeout=timeout, session=chat_session)
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(chunks.get(), timeout=max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                raise LLMTimeoutError(f"El modelo no respondió en {timeout} segundos")
+            if item is finished:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # Esperar al hilo sin pasar del plazo de la respuesta; si sigue
+        # bloqueado en el SDK ya no escribe en la cola y el limitador
+        # mantiene su hueco ocupado hasta que termine
+        await asyncio.wait({future}, timeout=max(deadline - loop.time(), 0))
 
-    return response.text
\ No newline at end of file
+async def get_gemini_audio_response(state: str, class_data: str, clip: AudioClip) -> str:
+    """
+    Envía un audio (ya validado con services.audio_upload.receive_audio) junto
+    con el contexto y devuelve la respuesta del modelo. Los audios cortos van
+    dentro de la petición; los largos se suben por trozos con la API de
+    ficheros y se borran después, así que nunca se cargan enteros en memoria.
+    El trabajo usa su propia copia del audio (ver copy_for_job), que sigue
+    siendo válida si la llamada agota el tiempo y la petición termina antes.
+    """
+    prompt = prepare_prompt(state, class_data)
+    job_clip = await run_in_threadpool(copy_for_job, clip)
+
+    def generate():
+        try:
+            if is_inline(job_clip):
+                return model.generate_content([prompt, {"mime_type": job_clip.mime_type, "data": job_clip.file.getvalue()}])
+            uploaded = upload_audio(job_clip, genai, settings.AUDIO_UPLOAD_TIMEOUT_SECONDS)
+            try:
+                return model.generate_content([prompt, uploaded])
+            finally:
+                delete_uploaded_audio(genai, uploaded.name)
+        finally:
+            job_clip.file.close()
+
+    timeout = settings.LLM_TIMEOUT_SECONDS if is_inline(clip) else settings.LLM_TIMEOUT_SECONDS + settings.AUDIO_UPLOAD_TIMEOUT_SECONDS
+    response = await run_llm_call(generate, timeout=timeout)
+    return response.text
@@ -0,0 +1,263 @@
+import asyncio
+import json
+import logging
+import threading
+import uuid
+from collections import defaultdict, deque
+from typing import Callable, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from config import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+PENDING_KEY = "pending_grade_events"
+
+
+class InMemoryEventBackend:
+    """
+    Backend de un solo proceso: los eventos se entregan directamente a los
+    suscriptores de este worker.
+    """
+
+    def start(self, deliver: Callable[[int, dict], None]) -> None:
+        self.deliver = deliver
+
+    def publish(self, class_id: int, payload: dict) -> None:
+        self.deliver(class_id, payload)
+
+
+class RedisEventBackend:
+    """
+    Reparte los eventos entre todos los workers de uvicorn con el pub/sub de
+    Redis: cada worker publica en el canal de la clase y un hilo escucha todos
+    los canales y entrega los eventos a sus suscriptores. Requiere el paquete `redis`.
+    """
+
+    def __init__(self, url: str, prefix: str = "nextclass:grades:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def start(self, deliver: Callable[[int, dict], None]) -> None:
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(self.prefix + "*")
+
+        def listen():
+            for message in pubsub.listen():
+                try:
+                    class_id = int(message["channel"].decode().removeprefix(self.prefix))
+                    deliver(class_id, json.loads(message["data"]))
+                except Exception:
+                    logger.exception("Evento de notas no válido en Redis: %r", message)
+
+        threading.Thread(target=listen, name="grade-events-redis", daemon=True).start()
+
+    def publish(self, class_id: int, payload: dict) -> None:
+        self.client.publish(f"{self.prefix}{class_id}", json.dumps(payload))
+
+
+class Subscriber:
+    """
+    Cola de eventos de un cliente conectado. Se llena desde cualquier hilo y se
+    consume en el event loop de la petición. Si el cliente no consume a tiempo
+    y la cola se llena, se marca como desbordada para que recargue los datos.
+    """
+
+    def __init__(self, class_id: int, max_queue: int):
+        self.class_id = class_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.overflowed = False
+        self.start_sequence = 0
+
+    def offer(self, item: Tuple[int, str, dict]) -> None:
+        self.loop.call_soon_threadsafe(self._put, item)
+
+    def _put(self, item) -> None:
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class GradeEventBroker:
+    """
+    Pub/sub en proceso de los cambios de notas por clase. Cada evento recibe un
+    número de secuencia por clase y se guarda en un histórico corto, de modo
+    que un cliente que se reconecta con Last-Event-ID recibe lo que se perdió
+    (o un aviso para recargar si el histórico ya no lo conserva). El reparto
+    entre procesos lo hace el backend.
+    """
+
+    def __init__(self, backend=None, history_size: int = 100, max_queue: int = 100):
+        self.history_size = history_size
+        self.max_queue = max_queue
+        # Los ids de evento solo valen para este proceso: tras un reinicio hay que recargar
+        self.boot_id = uuid.uuid4().hex[:8]
+        self._history = defaultdict(lambda: deque(maxlen=self.history_size))
+        self._sequences = defaultdict(int)
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self.backend = backend or InMemoryEventBackend()
+        self.backend.start(self._deliver)
+
+    def publish(self, class_id: int, payload: dict) -> None:
+        try:
+            self.backend.publish(class_id, payload)
+        except Exception:
+            # Los eventos son una optimización: si fallan, los clientes recargan como antes
+            logger.exception("No se pudo publicar el evento de notas de la clase %s", class_id)
+
+    def _deliver(self, class_id: int, payload: dict) -> None:
+        with self._lock:
+            self._sequences[class_id] += 1
+            sequence = self._sequences[class_id]
+            event_id = f"{self.boot_id}.{sequence}"
+            self._history[class_id].append((sequence, event_id, payload))
+            subscribers = list(self._subscribers.get(class_id, ()))
+        for subscriber in subscribers:
+            subscriber.offer((sequence, event_id, payload))
+
+    def subscribe(self, class_id: int) -> Subscriber:
+        """
+        Registra un suscriptor; hay que llamarlo desde el event loop de la petición.
+        """
+        subscriber = Subscriber(class_id, self.max_queue)
+        with self._lock:
+            self._subscribers[class_id].add(subscriber)
+            # Los eventos posteriores a esta secuencia llegarán por la cola
+            subscriber.start_sequence = self._sequences.get(class_id, 0)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.class_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.class_id]
+
+    def events_since(self, class_id: int, last_event_id: Optional[str]) -> Optional[List[Tuple[int, str, dict]]]:
+        """
+        Eventos de la clase posteriores a `last_event_id`, o None si no se
+        pueden reconstruir (id de otro proceso o histórico insuficiente).
+        """
+        boot_id, _, sequence = (last_event_id or "").partition(".")
+        if boot_id != self.boot_id or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        with self._lock:
+            latest = self._sequences.get(class_id, 0)
+            entries = list(self._history.get(class_id, ()))
+        if sequence > latest:
+            return None
+        if latest == sequence:
+            return []
+        if not entries or entries[0][0] > sequence + 1:
+            return None
+        return [entry for entry in entries if entry[0] > sequence]
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "classes": len(self._subscribers),
+                "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            }
+
+
+def create_event_backend():
+    if settings.GRADE_EVENTS_BACKEND == "redis":
+        return RedisEventBackend(settings.GRADE_EVENTS_REDIS_URL or settings.CHAT_SESSION_REDIS_URL)
+    return InMemoryEventBackend()
+
+
+grade_events = GradeEventBroker(
+    create_event_backend(),
+    history_size=settings.GRADE_EVENTS_HISTORY_SIZE,
+    max_queue=settings.GRADE_EVENTS_QUEUE_SIZE,
+)
+
+
+def queue_grade_event(db: Session, class_id: int, category_id: int, points: float, changes: List[dict]) -> None:
+    """
+    Prepara el evento compacto de un cambio de notas. Se publica cuando la
+    sesión hace commit y se descarta si hace rollback, así que los clientes
+    nunca ven cambios que no han llegado a la base de datos.
+    """
+    db.info.setdefault(PENDING_KEY, []).append((class_id, {
+        "category_id": category_id,
+        "points": points,
+        "grades": [[change["student_id"], change["total_grade"]] for change in changes],
+    }))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending_events(session) -> None:
+    for class_id, payload in session.info.pop(PENDING_KEY, ()):
+        grade_events.publish(class_id, payload)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_events(session) -> None:
+    session.info.pop(PENDING_KEY, None)
+
+
+def format_sse(event_id: Optional[str], event_type: str, payload: dict) -> str:
+    """
+    Un mensaje de Server-Sent Events.
+    """
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(payload, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def stream_grade_events(class_id: int, last_event_id: Optional[str], is_disconnected=None):
+    """
+    Generador de la respuesta SSE de una clase. Empieza con un evento "ready"
+    (o "resync" si el cliente vuelve de una desconexión y se ha perdido
+    eventos), envía cada cambio de notas como evento "grades" y un comentario
+    cada GRADE_EVENTS_HEARTBEAT_SECONDS para mantener viva la conexión.
+    """
+    subscriber = grade_events.subscribe(class_id)
+    try:
+        last_sequence = subscriber.start_sequence
+        if last_event_id:
+            missed = grade_events.events_since(class_id, last_event_id)
+            if missed is None:
+                yield format_sse(None, "resync", {"class_id": class_id})
+            else:
+                for sequence, event_id, payload in missed:
+                    yield format_sse(event_id, "grades", payload)
+                    last_sequence = sequence
+        else:
+            yield format_sse(None, "ready", {"class_id": class_id})
+
+        while True:
+            try:
+                sequence, event_id, payload = await asyncio.wait_for(
+                    subscriber.queue.get(), timeout=settings.GRADE_EVENTS_HEARTBEAT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                if is_disconnected is not None and await is_disconnected():
+                    return
+                yield ": ping\n\n"
+                continue
+            if subscriber.overflowed:
+                # El cliente se quedó atrás: descartar la cola y pedirle que recargue
+                while not subscriber.queue.empty():
+                    sequence, event_id, payload = subscriber.queue.get_nowait()
+                subscriber.overflowed = False
+                last_sequence = sequence
+                yield format_sse(event_id, "resync", {"class_id": class_id})
+                continue
+            if sequence <= last_sequence:
+                continue  # ya enviado al reproducir el histórico
+            last_sequence = sequence
+            yield format_sse(event_id, "grades", payload)
+    finally:
+        grade_events.unsubscribe(subscriber)
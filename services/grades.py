@@ -0,0 +1,144 @@
+from typing import Iterable, List, Optional
+from sqlalchemy import insert, update, func
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session
+from models import Category, Grade, GradeHistory
+from services.grade_events import queue_grade_event
+from services.class_versions import bump_class_version_once
+
+# Dialectos con upsert nativo sobre la restricción única (student_id, category_id)
+ON_CONFLICT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def apply_grade_changes(
+    db: Session,
+    category_id: int,
+    student_ids: Iterable[int],
+    points: float,
+    description: Optional[str] = None,
+    commit: bool = True,
+    class_id: Optional[int] = None,
+) -> List[dict]:
+    """
+    Suma (o resta) `points` a la nota de cada estudiante en una categoría y
+    registra el cambio en el historial, todo en una sola transacción.
+    El incremento se aplica en la base de datos con un upsert atómico
+    (ON DUPLICATE KEY UPDATE en MySQL, ON CONFLICT en SQLite/PostgreSQL),
+    así que las actualizaciones concurrentes no se pisan.
+    El cambio se publica a los clientes conectados de la clase
+    (services/grade_events.py) al hacer commit y la versión de la clase se
+    incrementa en la misma transacción (una vez aunque haya varias llamadas),
+    para que los ETags de sus lecturas caduquen; si no se pasa `class_id`, se
+    obtiene de la categoría.
+    """
+    student_ids = list(dict.fromkeys(student_ids))  # sin duplicados, conservando el orden
+    if not student_ids:
+        return []
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        grades = _upsert_mysql(db, category_id, student_ids, points)
+    elif dialect in ON_CONFLICT_INSERTS:
+        grades = _upsert_on_conflict(db, ON_CONFLICT_INSERTS[dialect], category_id, student_ids, points)
+    else:
+        grades = _read_modify_write(db, category_id, student_ids, points)
+
+    results = []
+    history_rows = []
+    for student_id in student_ids:
+        grade_id, new_grade = grades[student_id]
+        previous_grade = new_grade - points
+
+        # Calcular el porcentaje de cambio
+        percentage_change = (
+            (points / previous_grade) * 100 if previous_grade != 0 else 100
+        )
+
+        history_rows.append({
+            "grade_id": grade_id,
+            "change_amount": points,
+            "current_grade": new_grade,
+            "percentage_change": percentage_change,
+            "description": description,
+        })
+        results.append({
+            "student_id": student_id,
+            "category_id": category_id,
+            "total_grade": new_grade,
+            "percentage_change": percentage_change,
+        })
+
+    db.execute(insert(GradeHistory), history_rows)
+
+    if class_id is None:
+        class_id = db.query(Category.class_id).filter(Category.id == category_id).scalar()
+    queue_grade_event(db, class_id, category_id, points, results)
+    bump_class_version_once(db, class_id)
+
+    if commit:
+        db.commit()
+    return results
+
+
+def _upsert_mysql(db: Session, category_id: int, student_ids: List[int], points: float) -> dict:
+    """
+    INSERT ... ON DUPLICATE KEY UPDATE grade = grade + VALUES(grade).
+    """
+    statement = mysql.insert(Grade).values(_grade_rows(category_id, student_ids, points))
+    statement = statement.on_duplicate_key_update(
+        grade=Grade.grade + statement.inserted.grade,
+        updated_at=func.now(),
+    )
+    db.execute(statement)
+    return _load_grades(db, category_id, student_ids, for_update=True)
+
+
+def _upsert_on_conflict(db: Session, dialect_insert, category_id: int, student_ids: List[int], points: float) -> dict:
+    """
+    INSERT ... ON CONFLICT (student_id, category_id) DO UPDATE SET grade = grade + excluded.grade.
+    """
+    statement = dialect_insert(Grade).values(_grade_rows(category_id, student_ids, points))
+    statement = statement.on_conflict_do_update(
+        index_elements=[Grade.student_id, Grade.category_id],
+        set_={"grade": Grade.grade + statement.excluded.grade, "updated_at": func.now()},
+    )
+    db.execute(statement)
+    return _load_grades(db, category_id, student_ids, for_update=True)
+
+
+def _read_modify_write(db: Session, category_id: int, student_ids: List[int], points: float) -> dict:
+    """
+    Alternativa para dialectos sin upsert: bloquea las notas existentes, crea
+    las que faltan y actualiza los totales por lotes.
+    """
+    grades = _load_grades(db, category_id, student_ids, for_update=True)
+    missing_ids = [student_id for student_id in student_ids if student_id not in grades]
+    if missing_ids:
+        db.execute(insert(Grade), _grade_rows(category_id, missing_ids, 0))
+        grades.update(_load_grades(db, category_id, missing_ids, for_update=True))
+
+    new_grades = {
+        student_id: (grade_id, grade + points)
+        for student_id, (grade_id, grade) in grades.items()
+    }
+    db.execute(update(Grade), [{"id": grade_id, "grade": grade} for grade_id, grade in new_grades.values()])
+    return new_grades
+
+
+def _grade_rows(category_id: int, student_ids: List[int], grade: float) -> List[dict]:
+    return [{"student_id": student_id, "category_id": category_id, "grade": grade} for student_id in student_ids]
+
+
+def _load_grades(db: Session, category_id: int, student_ids: List[int], for_update: bool = False) -> dict:
+    """
+    Devuelve {student_id: (grade_id, grade)} de las notas existentes en la categoría.
+    Con `for_update` la lectura es bloqueante, así que en MySQL ve el valor
+    recién escrito aunque la transacción ya tuviera una instantánea anterior.
+    """
+    query = (
+        db.query(Grade.student_id, Grade.id, Grade.grade)
+        .filter(Grade.category_id == category_id, Grade.student_id.in_(student_ids))
+    )
+    if for_update:
+        query = query.with_for_update()
+    return {student_id: (grade_id, grade) for student_id, grade_id, grade in query.all()}
@@ -0,0 +1,275 @@
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set
+from sqlalchemy.orm import Session
+from config import settings
+from models import Student, Category
+
+# Similitud mínima de trigramas para considerar un candidato aproximado
+MIN_TRIGRAM_SIMILARITY = 0.3
+
+
+def normalize_name(name: str) -> str:
+    """
+    Minúsculas, sin tildes y con los espacios normalizados: "  José  Álvarez" -> "jose alvarez".
+    """
+    decomposed = unicodedata.normalize("NFKD", name.casefold())
+    return " ".join("".join(char for char in decomposed if not unicodedata.combining(char)).split())
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[position:position + 3] for position in range(len(padded) - 2)}
+
+
+def edit_distance(first: str, second: str, limit: int) -> int:
+    """
+    Distancia de Levenshtein entre dos textos; deja de calcular en cuanto
+    supera `limit` y devuelve `limit + 1`.
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous = list(range(len(second) + 1))
+    for row, char in enumerate(first, start=1):
+        current = [row]
+        for column, other in enumerate(second, start=1):
+            current.append(min(previous[column] + 1, current[column - 1] + 1, previous[column - 1] + (char != other)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def max_edit_distance(text: str) -> int:
+    # Errores tolerados según la longitud: "ana" 1, "maria" 1, "alejandro" 2...
+    return 1 if len(text) <= 5 else 2 if len(text) <= 10 else 3
+
+
+class FuzzyLookup:
+    """
+    Búsqueda aproximada sobre un conjunto de claves normalizadas. Los trigramas
+    preseleccionan candidatos y la distancia de edición decide; si varios
+    candidatos empatan, se devuelven todos para que el llamante pregunte.
+    """
+
+    def __init__(self, keys: Iterable[str]):
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._postings = defaultdict(set)
+        for key in keys:
+            key_trigrams = trigrams(key)
+            self._trigrams[key] = key_trigrams
+            for trigram in key_trigrams:
+                self._postings[trigram].add(key)
+
+    def search(self, text: str) -> List[str]:
+        text_trigrams = trigrams(text)
+        shared = defaultdict(int)
+        for trigram in text_trigrams:
+            for key in self._postings.get(trigram, ()):
+                shared[key] += 1
+
+        limit = max_edit_distance(text)
+        scored = []
+        for key, count in shared.items():
+            similarity = count / len(text_trigrams | self._trigrams[key])
+            if similarity < MIN_TRIGRAM_SIMILARITY:
+                continue
+            # Comparar con el nombre completo y, con un punto de penalización, con
+            # sus primeras palabras ("jose alvares" / "jose albarez" -> "jose alvarez lopez")
+            words = key.split()
+            prefix = " ".join(words[:len(text.split())])
+            distance = edit_distance(text, key, limit)
+            if prefix != key:
+                distance = min(distance, edit_distance(text, prefix, limit) + 1)
+            if distance <= limit:
+                scored.append((distance, -similarity, key))
+        if not scored:
+            return []
+        scored.sort()
+        best_distance, best_similarity, _ = scored[0]
+        return [key for distance, similarity, key in scored if (distance, similarity) == (best_distance, best_similarity)]
+
+
+@dataclass(frozen=True)
+class IndexedStudent:
+    id: int
+    name: str
+
+
+@dataclass(frozen=True)
+class IndexedCategory:
+    id: int
+    name: str
+    subcategories: tuple = ()
+
+
+class ClassNameIndex:
+    """
+    Índice en memoria de los nombres de estudiantes y categorías de una clase.
+    Un nombre se resuelve por coincidencia exacta (sin tildes ni mayúsculas),
+    por las palabras con que empieza ("juan" -> "Juan Pérez") o por palabras
+    sueltas ("alvarez" -> "José Álvarez"). La búsqueda aproximada ("jose
+    albarez") solo sirve para sugerir candidatos: "Mario" está a una letra de
+    "María", así que nunca se escriben notas a partir de ella.
+    """
+
+    def __init__(self, class_id: int, students: List[IndexedStudent], categories: List[IndexedCategory]):
+        self.class_id = class_id
+        self.students = students
+        self.categories = categories
+        self._students_by_name = defaultdict(list)
+        for student in students:
+            self._students_by_name[normalize_name(student.name)].append(student)
+        self._categories_by_name = {normalize_name(category.name): category for category in categories}
+        self._student_lookup = FuzzyLookup(self._students_by_name)
+        self._category_lookup = FuzzyLookup(self._categories_by_name)
+
+    def find_students(self, name: str) -> List[IndexedStudent]:
+        """
+        Devuelve los estudiantes que encajan con `name`: uno si no hay duda,
+        varios si es ambiguo y ninguno si no existe.
+        """
+        normalized = normalize_name(name)
+        if not normalized:
+            return []
+        exact = self._students_by_name.get(normalized)
+        if exact:
+            return list(exact)
+        words = normalized.split()
+        for matches_words in (
+            lambda key_words: key_words[:len(words)] == words,
+            lambda key_words: set(words) <= set(key_words),
+        ):
+            matches = [
+                student
+                for key, students in self._students_by_name.items()
+                if matches_words(key.split())
+                for student in students
+            ]
+            if matches:
+                return matches
+        return []
+
+    def suggest_students(self, name: str) -> List[IndexedStudent]:
+        """
+        Candidatos aproximados para un nombre que no se encuentra (erratas de
+        voz o del modelo), para proponérselos al usuario.
+        """
+        normalized = normalize_name(name)
+        if not normalized:
+            return []
+        return [student for key in self._student_lookup.search(normalized) for student in self._students_by_name[key]]
+
+    def resolve_student(self, name: str) -> Optional[IndexedStudent]:
+        matches = self.find_students(name)
+        return matches[0] if len(matches) == 1 else None
+
+    def resolve_category(self, name: str) -> Optional[IndexedCategory]:
+        return self._categories_by_name.get(normalize_name(name))
+
+    def suggest_categories(self, name: str) -> List[IndexedCategory]:
+        normalized = normalize_name(name)
+        if not normalized:
+            return []
+        return [self._categories_by_name[key] for key in self._category_lookup.search(normalized)]
+
+
+def load_name_index(db: Session, class_id: int) -> ClassNameIndex:
+    """
+    Construye el índice de una clase con dos consultas (estudiantes y categorías).
+    """
+    students = [
+        IndexedStudent(id=student_id, name=name)
+        for student_id, name in (
+            db.query(Student.id, Student.name).filter(Student.class_id == class_id).order_by(Student.id)
+        )
+    ]
+    rows = (
+        db.query(Category.id, Category.name, Category.parent_id)
+        .filter(Category.class_id == class_id)
+        .order_by(Category.id)
+        .all()
+    )
+    children = defaultdict(list)
+    for _, name, parent_id in rows:
+        if parent_id is not None:
+            children[parent_id].append(name)
+    categories = [
+        IndexedCategory(id=category_id, name=name, subcategories=tuple(children[category_id]))
+        for category_id, name, _ in rows
+    ]
+    return ClassNameIndex(class_id, students, categories)
+
+
+class NameIndexCache:
+    """
+    Índices de nombres por clase, con expulsión LRU y caducidad (TTL) como red
+    de seguridad para cambios hechos desde otros procesos. Un índice puede ir
+    por detrás de la base de datos: quien escribe a partir de él recarga el
+    índice si un nombre no aparece y comprueba los ids en su transacción.
+    """
+
+    def __init__(self, ttl_seconds: int, max_classes: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_classes = max_classes
+        self._indexes = OrderedDict()
+        self._invalidations = 0
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, class_id: int) -> ClassNameIndex:
+        with self._lock:
+            entry = self._indexes.get(class_id)
+            if entry is not None and entry[1] >= time.monotonic():
+                self._indexes.move_to_end(class_id)
+                return entry[0]
+            invalidations = self._invalidations
+
+        index = load_name_index(db, class_id)
+        with self._lock:
+            if invalidations != self._invalidations:
+                return index  # Se invalidó mientras se cargaba: no guardarlo
+            self._indexes[class_id] = (index, time.monotonic() + self.ttl_seconds)
+            self._indexes.move_to_end(class_id)
+            while len(self._indexes) > self.max_classes:
+                self._indexes.popitem(last=False)
+        return index
+
+    def reload(self, db: Session, class_id: int) -> ClassNameIndex:
+        """
+        Descarta el índice de la clase y lo vuelve a cargar.
+        """
+        self.invalidate(class_id)
+        return self.get(db, class_id)
+
+    def invalidate(self, class_id: int) -> None:
+        with self._lock:
+            self._indexes.pop(class_id, None)
+            self._invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._indexes.clear()
+
+
+name_indexes = NameIndexCache(
+    ttl_seconds=settings.NAME_INDEX_TTL_SECONDS,
+    max_classes=settings.NAME_INDEX_MAX_CLASSES,
+)
+
+
+def get_name_index(db: Session, class_id: int) -> ClassNameIndex:
+    return name_indexes.get(db, class_id)
+
+
+def reload_name_index(db: Session, class_id: int) -> ClassNameIndex:
+    return name_indexes.reload(db, class_id)
+
+
+def invalidate_name_index(class_id: int) -> None:
+    """
+    Hook para llamar cuando cambian los estudiantes o las categorías de una clase.
+    """
+    name_indexes.invalidate(class_id)
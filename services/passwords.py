@@ -0,0 +1,71 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+from config import settings
+
+# Encryption context for passwords
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# bcrypt libera el GIL mientras calcula el hash, así que un pool de hilos basta
+# para sacar el trabajo del event loop y limitar cuántos hashes corren a la vez.
+_executor = None
+_executor_lock = threading.Lock()
+_workers = settings.PASSWORD_HASH_WORKERS
+
+
+def configure_password_pool(workers: int) -> None:
+    """
+    Cambia el número de hilos dedicados a bcrypt. Con 0 el hash se calcula en
+    el hilo que lo pide (comportamiento anterior, útil para comparar).
+    """
+    global _executor, _workers
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+        _executor = None
+        _workers = workers
+
+
+def _get_executor():
+    global _executor
+    if _workers <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_workers, thread_name_prefix="bcrypt")
+        return _executor
+
+
+def hash_password(password: str) -> str:
+    """
+    Calcula el hash de una contraseña en el pool de bcrypt (bloquea al llamante).
+    """
+    executor = _get_executor()
+    if executor is None:
+        return pwd_context.hash(password)
+    return executor.submit(pwd_context.hash, password).result()
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """
+    Verifica una contraseña en el pool de bcrypt (bloquea al llamante).
+    """
+    executor = _get_executor()
+    if executor is None:
+        return pwd_context.verify(plain_password, hashed_password)
+    return executor.submit(pwd_context.verify, plain_password, hashed_password).result()
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    Verifica una contraseña en el pool de bcrypt sin bloquear el event loop.
+    Con el pool desactivado (0 hilos) se calcula en el hilo que lo pide, es
+    decir, en el propio event loop: solo sirve como referencia en los benchmarks.
+    """
+    executor = _get_executor()
+    if executor is None:
+        return pwd_context.verify(plain_password, hashed_password)
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, pwd_context.verify, plain_password, hashed_password
+    )
@@ -0,0 +1,130 @@
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import List, Optional
+from config import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+
+@dataclass
+class QueryStats:
+    """
+    Consultas ejecutadas dentro de una petición (o de un bloque `track_queries`).
+    """
+    count: int = 0
+    seconds: float = 0.0
+    statements: Counter = field(default_factory=Counter)
+    parent: Optional["QueryStats"] = None
+
+    def add(self, statement: str, seconds: float) -> None:
+        stats = self
+        while stats is not None:
+            stats.count += 1
+            stats.seconds += seconds
+            stats.statements[statement] += 1
+            stats = stats.parent
+
+    def repeated(self, threshold: int) -> List[tuple]:
+        """
+        Sentencias repetidas al menos `threshold` veces: la huella de un N+1.
+        """
+        return [(statement, times) for statement, times in self.statements.most_common() if times >= threshold]
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def record_query(statement: str, seconds: float) -> None:
+    """
+    Lo llaman los eventos de SQLAlchemy (services/db_metrics.py) tras cada consulta.
+    Las peticiones síncronas se ejecutan en el threadpool con una copia del
+    contexto, que comparte el mismo QueryStats.
+    """
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.add(statement, seconds)
+
+
+@contextmanager
+def track_queries():
+    """
+    Cuenta las consultas ejecutadas dentro del bloque (se puede anidar).
+    """
+    stats = QueryStats(parent=_current_stats.get())
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+@contextmanager
+def assert_num_queries(expected: int, exact: bool = True):
+    """
+    Ayuda para pruebas: falla si el bloque ejecuta un número de consultas
+    distinto de `expected` (o mayor, con exact=False). Funciona con llamadas
+    directas y con httpx.AsyncClient + ASGITransport; con TestClient, que
+    ejecuta la app en otro hilo, use assert_response_queries.
+    """
+    with track_queries() as stats:
+        yield stats
+    if (stats.count != expected) if exact else (stats.count > expected):
+        raise AssertionError(_describe_mismatch(expected, stats.count, exact, stats.statements))
+
+
+def assert_response_queries(response, expected: int, exact: bool = True) -> None:
+    """
+    Igual que assert_num_queries, pero leyendo la cabecera X-DB-Queries de una respuesta.
+    """
+    count = int(response.headers["X-DB-Queries"])
+    if (count != expected) if exact else (count > expected):
+        raise AssertionError(_describe_mismatch(expected, count, exact))
+
+
+def _describe_mismatch(expected: int, count: int, exact: bool, statements: Counter = None) -> str:
+    message = f"Se esperaban {'' if exact else 'como máximo '}{expected} consultas y se ejecutaron {count}."
+    if statements:
+        message += "\n" + "\n".join(f"  {times}x {' '.join(statement.split())[:200]}" for statement, times in statements.most_common())
+    return message
+
+
+class QueryCounterMiddleware:
+    """
+    Middleware ASGI que cuenta las consultas y el tiempo de base de datos de
+    cada petición y los devuelve en las cabeceras X-DB-Queries y X-DB-Time (ms).
+    Avisa en el log de las peticiones que repiten una misma sentencia muchas
+    veces (N+1) o que superan DB_QUERY_WARN_THRESHOLD consultas.
+    """
+
+    def __init__(self, app, add_headers: bool = True):
+        self.app = app
+        self.add_headers = add_headers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+            async def send_with_headers(message):
+                if message["type"] == "http.response.start" and self.add_headers:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-db-queries", str(stats.count).encode()))
+                    headers.append((b"x-db-time", f"{stats.seconds * 1000:.1f}".encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_headers)
+            finally:
+                self._warn_if_suspicious(scope, stats)
+
+    def _warn_if_suspicious(self, scope, stats: QueryStats) -> None:
+        path = f"{scope.get('method', '')} {scope.get('path', '')}"
+        if stats.count >= settings.DB_QUERY_WARN_THRESHOLD:
+            logger.warning("%s ejecutó %d consultas (%.1f ms)", path, stats.count, stats.seconds * 1000)
+        for statement, times in stats.repeated(settings.DB_N_PLUS_ONE_THRESHOLD):
+            logger.warning("Posible N+1 en %s: %dx %s", path, times, " ".join(statement.split())[:200])
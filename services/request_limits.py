@@ -0,0 +1,81 @@
+import json
+from typing import Dict, Optional
+
+MiB = 1024 * 1024
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class BodySizeLimitMiddleware:
+    """
+    Middleware ASGI que limita el tamaño del cuerpo de las peticiones a ciertas
+    rutas (por prefijo). Rechaza con 413 a partir de Content-Length y, si no lo
+    hay o miente, corta la subida en cuanto se supera el límite, antes de que
+    Starlette termine de leer el formulario. `limits` es el tamaño máximo del
+    fichero por ruta; al cuerpo se le permite además `overhead` bytes para el
+    resto del formulario, pero el mensaje de error indica el máximo configurado.
+    """
+
+    def __init__(self, app, limits: Dict[str, int], overhead: int = 0):
+        self.app = app
+        self.limits = limits
+        self.overhead = overhead
+
+    def _limit_for(self, path: str) -> Optional[int]:
+        for prefix, limit in self.limits.items():
+            if path.startswith(prefix):
+                return limit
+        return None
+
+    async def __call__(self, scope, receive, send):
+        max_file_size = self._limit_for(scope.get("path", "")) if scope["type"] == "http" else None
+        if max_file_size is None:
+            await self.app(scope, receive, send)
+            return
+        limit = max_file_size + self.overhead
+
+        content_length = dict(scope.get("headers", [])).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await self._reject(send, max_file_size)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if exceeded:
+                return  # la respuesta de error la envía el middleware
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not response_started:
+            await self._reject(send, max_file_size)
+
+    async def _reject(self, send, max_file_size: int) -> None:
+        body = json.dumps({"detail": f"El fichero supera el máximo de {max_file_size / MiB:g} MB."}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Optional, Tuple
+from config import settings
+from services.name_index import normalize_name
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_question(message: str) -> str:
+    """
+    "¿Cuántas clases tengo?" y "cuantas clases tengo" son la misma pregunta.
+    """
+    return _SPACES.sub(" ", _PUNCTUATION.sub(" ", normalize_name(message))).strip()
+
+
+def context_hash(context: str) -> str:
+    return hashlib.sha1(context.encode()).hexdigest()[:16]
+
+
+def history_hash(history: list) -> str:
+    """
+    Huella de los turnos previos de la conversación (historial serializado):
+    "¿y la segunda?" o "sí" dependen de lo que se dijo antes.
+    """
+    return hashlib.sha1(json.dumps(history, ensure_ascii=False, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    Respuestas del modelo por usuario, pregunta normalizada, huella del
+    contexto con el que se respondieron y huella de los turnos anteriores de
+    la conversación. Si los datos cambian, la huella cambia y la respuesta
+    antigua deja de encontrarse; además se puede
+    invalidar todo lo de un usuario. Expulsión LRU por número de entradas y
+    caducidad (TTL).
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._keys_by_user = defaultdict(set)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(user_id: int, message: str, context: str, history: list = ()) -> Tuple[int, str, str, str]:
+        return user_id, normalize_question(message), context_hash(context), history_hash(list(history))
+
+    def get(self, key) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, response: str) -> None:
+        with self._lock:
+            self._entries[key] = (response, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            self._keys_by_user[key[0]].add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def _remove(self, key) -> None:
+        self._entries.pop(key, None)
+        keys = self._keys_by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[key[0]]
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+dashboard_answers = ResponseCache(
+    ttl_seconds=settings.DASHBOARD_CACHE_TTL_SECONDS,
+    max_entries=settings.DASHBOARD_CACHE_MAX_ENTRIES,
+)
+
+
+def invalidate_dashboard_answers(user_id: int) -> None:
+    """
+    Hook para llamar cuando cambian las clases de un usuario.
+    """
+    dashboard_answers.invalidate_user(user_id)
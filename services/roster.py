@@ -0,0 +1,218 @@
+import base64
+from collections import defaultdict
+from typing import Optional
+from sqlalchemy import func, or_, and_
+from sqlalchemy.orm import Session
+from models import Student, Grade, Category, GradeHistory
+
+# Modos de historial del roster:
+# "full" -> todo el historial (comportamiento original)
+# "last" -> las últimas N entradas por categoría
+# "none" -> sin historial (se carga aparte con load_student_history)
+HISTORY_MODES = ("full", "last", "none")
+DEFAULT_HISTORY_LIMIT = 5
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def load_class_roster(
+    db: Session,
+    class_id: int,
+    history: str = "full",
+    history_limit: int = DEFAULT_HISTORY_LIMIT,
+) -> dict:
+    """
+    Carga los estudiantes de una clase con sus notas e historial en un número
+    constante de consultas (estudiantes, categorías, notas e historial) y
+    construye la respuesta en memoria.
+    """
+    if history not in HISTORY_MODES:
+        raise ValueError(f"Modo de historial no válido: {history}")
+
+    students = (
+        db.query(Student)
+        .filter(Student.class_id == class_id)
+        .order_by(Student.id)
+        .all()
+    )
+    categories = db.query(Category).filter(Category.class_id == class_id).all()
+
+    if not students or not categories:
+        return {"students": []}
+
+    # Crear un mapeo de categorías
+    category_mapping = [
+        {"category": category.name, "grade": None, "subcategories": []}
+        for category in categories
+    ]
+
+    # Todas las notas de la clase en una sola consulta
+    grade_rows = (
+        db.query(Grade.student_id, Grade.grade, Category.name)
+        .join(Category, Grade.category_id == Category.id)
+        .join(Student, Grade.student_id == Student.id)
+        .filter(Student.class_id == class_id)
+        .all()
+    )
+    grades_by_student = defaultdict(list)
+    for student_id, grade_value, category_name in grade_rows:
+        grades_by_student[student_id].append((category_name, grade_value))
+
+    history_by_student = defaultdict(list)
+    if history != "none":
+        # Todo el historial de la clase en una sola consulta
+        history_query = (
+            db.query(Grade.student_id, GradeHistory, Category.name)
+            .join(Grade, GradeHistory.grade_id == Grade.id)
+            .join(Category, Grade.category_id == Category.id)
+            .join(Student, Grade.student_id == Student.id)
+            .filter(Student.class_id == class_id)
+        )
+        if history == "last":
+            # Ventana: últimas N entradas por nota (estudiante + categoría)
+            ranked = (
+                db.query(
+                    GradeHistory.id.label("id"),
+                    func.row_number().over(
+                        partition_by=GradeHistory.grade_id,
+                        order_by=(GradeHistory.created_at.desc(), GradeHistory.id.desc()),
+                    ).label("position"),
+                )
+                .join(Grade, GradeHistory.grade_id == Grade.id)
+                .join(Student, Grade.student_id == Student.id)
+                .filter(Student.class_id == class_id)
+                .subquery()
+            )
+            history_query = (
+                history_query
+                .join(ranked, ranked.c.id == GradeHistory.id)
+                .filter(ranked.c.position <= max(history_limit, 1))
+            )
+        history_rows = history_query.order_by(
+            Grade.student_id,
+            Category.name.asc(),
+            GradeHistory.created_at.desc(),
+            GradeHistory.id.desc(),
+        ).all()
+        for student_id, entry, category_name in history_rows:
+            history_by_student[student_id].append(format_history_entry(entry, category_name))
+
+    student_data = []
+    for student in students:
+        # Inicializar las notas del estudiante con todas las categorías
+        grades = {category["category"]: category.copy() for category in category_mapping}
+        for category_name, grade_value in grades_by_student.get(student.id, []):
+            grades[category_name]["grade"] = grade_value
+
+        student_data.append(
+            {
+                "id": student.id,
+                "name": student.name,
+                "email": student.email,
+                "grades": list(grades.values()),
+                "grade_history": history_by_student.get(student.id, []),
+            }
+        )
+
+    return {"students": student_data}
+
+
+def format_history_entry(history: GradeHistory, category_name: str) -> dict:
+    """
+    Formatea una entrada del historial de notas para el frontend.
+    """
+    return {
+        "category": category_name,
+        "change_amount": history.change_amount,
+        "current_grade": history.current_grade,
+        "percentage_change": history.percentage_change,
+        "timestamp": history.created_at,
+        "description": history.description,
+    }
+
+
+def load_student_history(
+    db: Session,
+    class_id: int,
+    student_id: int,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    category_name: Optional[str] = None,
+) -> dict:
+    """
+    Devuelve una página del historial de notas de un estudiante, de la más
+    reciente a la más antigua, paginada por cursor (keyset sobre created_at, id).
+    Lanza ValueError si el cursor no es válido o no es de este estudiante.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    query = (
+        db.query(GradeHistory, Category.name)
+        .join(Grade, GradeHistory.grade_id == Grade.id)
+        .join(Category, Grade.category_id == Category.id)
+        .join(Student, Grade.student_id == Student.id)
+        .filter(Student.id == student_id, Student.class_id == class_id)
+    )
+    if category_name:
+        query = query.filter(Category.name == category_name)
+    if cursor:
+        history_id = decode_history_cursor(cursor)
+        cursor_belongs_to_student = (
+            db.query(GradeHistory.id)
+            .join(Grade, GradeHistory.grade_id == Grade.id)
+            .filter(GradeHistory.id == history_id, Grade.student_id == student_id)
+            .first()
+        )
+        if not cursor_belongs_to_student:
+            raise ValueError("Cursor de historial no válido")
+        # created_at se compara contra la fila del cursor en la propia base de datos
+        # para no depender del formato con el que cada dialecto guarda las fechas
+        cursor_created_at = (
+            db.query(GradeHistory.created_at)
+            .filter(GradeHistory.id == history_id)
+            .scalar_subquery()
+        )
+        query = query.filter(
+            or_(
+                GradeHistory.created_at < cursor_created_at,
+                and_(GradeHistory.created_at == cursor_created_at, GradeHistory.id < history_id),
+            )
+        )
+
+    # Se pide una fila de más para saber si hay página siguiente
+    rows = (
+        query.order_by(GradeHistory.created_at.desc(), GradeHistory.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last_entry = page[-1][0]
+        next_cursor = encode_history_cursor(last_entry.id)
+
+    return {
+        "student_id": student_id,
+        "grade_history": [format_history_entry(entry, name) for entry, name in page],
+        "next_cursor": next_cursor,
+    }
+
+
+def encode_history_cursor(history_id: int) -> str:
+    """
+    Codifica la última entrada de una página como cursor opaco.
+    """
+    return base64.urlsafe_b64encode(f"h:{history_id}".encode()).decode()
+
+
+def decode_history_cursor(cursor: str) -> int:
+    """
+    Decodifica un cursor generado por encode_history_cursor.
+    """
+    try:
+        prefix, history_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":", 1)
+        if prefix != "h":
+            raise ValueError
+        return int(history_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Cursor de historial no válido")
@@ -0,0 +1,223 @@
+import codecs
+import csv
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+from pydantic import ValidationError
+from sqlalchemy import insert, or_, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import Student, Class
+from schemas import AddStudentRequest
+from services.class_context import invalidate_class_context
+from services.name_index import invalidate_name_index
+from services.class_versions import bump_class_versions
+
+CHUNK_SIZE = 500
+
+# Cabeceras aceptadas en los ficheros de importación
+COLUMN_ALIASES = {
+    "name": "name",
+    "nombre": "name",
+    "email": "email",
+    "correo": "email",
+    "class_id": "class_id",
+    "clase": "class_id",
+}
+
+
+def iter_upload_rows(upload) -> Iterator[Tuple[int, dict]]:
+    """
+    Lee un fichero subido (CSV o XLSX) fila a fila, sin cargarlo entero en memoria.
+    Devuelve (número de fila, datos) con las cabeceras normalizadas.
+    """
+    filename = (upload.filename or "").lower()
+    if filename.endswith(".xlsx") or upload.content_type == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet":
+        return iter_xlsx_rows(upload.file)
+    return iter_csv_rows(upload.file)
+
+
+def iter_csv_rows(binary_file) -> Iterator[Tuple[int, dict]]:
+    dialect = _sniff_dialect(binary_file)
+    reader = csv.reader(codecs.getreader("utf-8-sig")(binary_file), dialect)
+    header = _normalize_header(next(reader, []))
+    for row_number, values in enumerate(reader, start=2):
+        if any(value.strip() for value in values):
+            yield row_number, dict(zip(header, values))
+
+
+def iter_xlsx_rows(binary_file) -> Iterator[Tuple[int, dict]]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(binary_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = _normalize_header(["" if value is None else str(value) for value in next(rows, ())])
+        for row_number, values in enumerate(rows, start=2):
+            values = ["" if value is None else str(value) for value in values]
+            if any(value.strip() for value in values):
+                yield row_number, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def import_class_ids(rows: Iterable[Tuple[int, dict]], default_class_id: Optional[int] = None) -> Set[int]:
+    """
+    Clases distintas a las que va dirigido un fichero, para comprobar los permisos
+    antes de importar nada. Los valores no numéricos se ignoran: se informan luego
+    como errores de fila.
+    """
+    class_ids = set()
+    for _, data in rows:
+        class_id = _clean(data.get("class_id")) or default_class_id
+        try:
+            class_ids.add(int(class_id))
+        except (TypeError, ValueError):
+            continue
+    return class_ids
+
+
+def import_students(
+    db: Session,
+    rows: Iterable[Tuple[int, dict]],
+    default_class_id: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[Tuple[List[str], List[dict]]]:
+    """
+    Importa estudiantes por bloques. Para cada bloque comprueba los duplicados con
+    una sola consulta, inserta las filas válidas con un único executemany y
+    confirma la transacción. Devuelve, bloque a bloque, los emails añadidos y los
+    errores por fila, así que la memoria no depende del tamaño del fichero.
+    """
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        yield _import_chunk(db, chunk, default_class_id)
+
+
+def _import_chunk(db: Session, chunk: List[Tuple[int, dict]], default_class_id: Optional[int]):
+    errors = []
+    candidates = []
+    seen_emails = set()
+    seen_names = set()
+
+    # Validar cada fila y descartar duplicados dentro del propio bloque
+    for row_number, data in chunk:
+        email = _clean(data.get("email")) or ""
+        try:
+            student = AddStudentRequest(
+                name=_clean(data.get("name")) or "",
+                email=email,
+                class_id=_clean(data.get("class_id")) or default_class_id,
+            )
+        except ValidationError as e:
+            field = ".".join(str(part) for part in e.errors()[0]["loc"])
+            errors.append(_row_error(row_number, email, f"Valor no válido en '{field}'."))
+            continue
+        if not student.name:
+            errors.append(_row_error(row_number, email, "El nombre es obligatorio."))
+            continue
+        if student.email in seen_emails:
+            errors.append(_row_error(row_number, email, "Email repetido en el fichero."))
+            continue
+        if (student.name, student.class_id) in seen_names:
+            errors.append(_row_error(row_number, email, "Nombre repetido en la clase dentro del fichero."))
+            continue
+        seen_emails.add(student.email)
+        seen_names.add((student.name, student.class_id))
+        candidates.append((row_number, student))
+
+    if not candidates:
+        return [], errors
+
+    # Una consulta para las clases y otra para los duplicados ya guardados
+    class_ids = {student.class_id for _, student in candidates}
+    existing_classes = {class_id for (class_id,) in db.query(Class.id).filter(Class.id.in_(class_ids))}
+    existing = (
+        db.query(Student.email, Student.name, Student.class_id)
+        .filter(
+            or_(
+                Student.email.in_(seen_emails),
+                tuple_(Student.name, Student.class_id).in_(seen_names),
+            )
+        )
+        .all()
+    )
+    existing_emails = {(email, class_id) for email, _, class_id in existing}
+    existing_any_email = {email for email, _, _ in existing}
+    existing_names = {(name, class_id) for _, name, class_id in existing}
+
+    to_insert = []
+    for row_number, student in candidates:
+        if student.class_id not in existing_classes:
+            errors.append(_row_error(row_number, student.email, "Clase no encontrada."))
+        elif (student.email, student.class_id) in existing_emails:
+            errors.append(_row_error(row_number, student.email, f"El estudiante con correo {student.email} ya está en la clase."))
+        elif student.email in existing_any_email:
+            errors.append(_row_error(row_number, student.email, "El estudiante ya está registrado en otra clase."))
+        elif (student.name, student.class_id) in existing_names:
+            errors.append(_row_error(row_number, student.email, f"Ya existe un estudiante llamado {student.name} en la clase."))
+        else:
+            to_insert.append((row_number, student))
+
+    if not to_insert:
+        return [], errors
+
+    try:
+        db.execute(insert(Student), [_student_row(student) for _, student in to_insert])
+        bump_class_versions(db, {student.class_id for _, student in to_insert})
+        db.commit()
+        _roster_changed(student for _, student in to_insert)
+        return [student.email for _, student in to_insert], errors
+    except IntegrityError:
+        # Otra petición insertó alguno de los estudiantes a la vez: reintentar fila a fila
+        db.rollback()
+
+    added = []
+    for row_number, student in to_insert:
+        try:
+            with db.begin_nested():
+                db.execute(insert(Student), [_student_row(student)])
+            added.append(student)
+        except IntegrityError:
+            errors.append(_row_error(row_number, student.email, "El estudiante ya existe."))
+    bump_class_versions(db, {student.class_id for student in added})
+    db.commit()
+    _roster_changed(added)
+    return [student.email for student in added], errors
+
+
+def _roster_changed(students: Iterable[AddStudentRequest]) -> None:
+    for class_id in {student.class_id for student in students}:
+        invalidate_name_index(class_id)
+        invalidate_class_context(class_id)
+
+
+def _clean(value):
+    return value.strip() if isinstance(value, str) else value
+
+
+def _student_row(student: AddStudentRequest) -> dict:
+    return {"name": student.name, "email": student.email, "class_id": student.class_id, "is_active": False}
+
+
+def _row_error(row_number: int, email: str, message: str) -> dict:
+    return {"row": row_number, "email": email, "error": message}
+
+
+def _normalize_header(header: List[str]) -> List[str]:
+    return [COLUMN_ALIASES.get(column.strip().lower(), column.strip().lower()) for column in header]
+
+
+def _sniff_dialect(binary_file):
+    """
+    Detecta el separador (coma o punto y coma, habitual en Excel en español)
+    mirando solo el principio del fichero.
+    """
+    sample = binary_file.read(4096).decode("utf-8-sig", errors="ignore")
+    binary_file.seek(0)
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        return csv.excel
@@ -0,0 +1,191 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from sqlalchemy import event
+from config import settings
+from models import User
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """
+    Datos del usuario autenticado que necesitan los endpoints. Es inmutable y no
+    está ligado a ninguna sesión, así que se puede compartir entre peticiones.
+    """
+    id: int
+    username: str
+    email: str
+    is_teacher: bool
+    is_email_confirmed: bool = True
+
+    @classmethod
+    def from_model(cls, user) -> "CurrentUser":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            is_teacher=bool(user.is_teacher),
+            is_email_confirmed=bool(user.is_email_confirmed),
+        )
+
+    @classmethod
+    def from_claims(cls, payload: dict) -> Optional["CurrentUser"]:
+        """
+        Construye el usuario a partir de los claims de un token de acceso. Solo se
+        emiten tokens de acceso a usuarios confirmados, así que basta con que estén
+        todos los claims; si falta alguno (tokens de recuperación o antiguos)
+        devuelve None y hay que consultar la base de datos.
+        """
+        if any(payload.get(claim) is None for claim in ("sub", "user_id", "username", "is_teacher")):
+            return None
+        return cls(
+            id=int(payload["user_id"]),
+            username=payload["username"],
+            email=payload["sub"],
+            is_teacher=bool(payload["is_teacher"]),
+        )
+
+
+class InMemoryInvalidationBackend:
+    """
+    Marcas de invalidación de este proceso. Solo sirve con un único worker: los
+    demás no se enteran de un cambio de contraseña y seguirían confiando en
+    los claims de los tokens anteriores.
+    """
+
+    def __init__(self):
+        self._marks = {}
+        self._lock = threading.Lock()
+
+    def mark(self, user_id: int, invalidated_at: float, ttl_seconds: int) -> None:
+        with self._lock:
+            self._marks[user_id] = (invalidated_at, invalidated_at + ttl_seconds)
+            # Pasada la vida de un token, la marca ya no protege de nada
+            for stale_id in [key for key, (_, expires_at) in self._marks.items() if expires_at < invalidated_at]:
+                del self._marks[stale_id]
+
+    def get(self, user_id: int) -> Optional[float]:
+        with self._lock:
+            entry = self._marks.get(user_id)
+        return entry[0] if entry is not None and entry[1] >= time.time() else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._marks.clear()
+
+
+class RedisInvalidationBackend:
+    """
+    Marcas de invalidación en Redis, compartidas por todos los workers de
+    uvicorn; caducan solas con la vida de los tokens. Requiere el paquete `redis`.
+    """
+
+    def __init__(self, url: str, prefix: str = "nextclass:user-invalidated:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def mark(self, user_id: int, invalidated_at: float, ttl_seconds: int) -> None:
+        self.client.set(f"{self.prefix}{user_id}", repr(invalidated_at), ex=ttl_seconds)
+
+    def get(self, user_id: int) -> Optional[float]:
+        raw = self.client.get(f"{self.prefix}{user_id}")
+        return float(raw) if raw else None
+
+    def clear(self) -> None:
+        pass
+
+
+class UserCache:
+    """
+    Caché LRU con caducidad (TTL) de usuarios autenticados, indexada por `user_id`.
+    Guarda además, en un backend compartido, cuándo se invalidó cada usuario
+    para no confiar en los claims de tokens emitidos antes de un cambio de
+    contraseña o de confirmación, ni en usuarios cacheados antes del cambio
+    por cualquier worker.
+    """
+
+    def __init__(self, ttl_seconds: int, max_size: int, invalidations=None):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.invalidations = invalidations or InMemoryInvalidationBackend()
+        self._users = OrderedDict()  # user_id -> (usuario, caducidad, cuándo se guardó)
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[CurrentUser]:
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            user, expires_at, cached_at = entry
+            if expires_at < time.monotonic():
+                del self._users[user_id]
+                return None
+        if self.invalidated_since(user_id, cached_at):
+            with self._lock:
+                self._users.pop(user_id, None)
+            return None
+        with self._lock:
+            if user_id in self._users:
+                self._users.move_to_end(user_id)
+        return user
+
+    def set(self, user: CurrentUser) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._users[user.id] = (user, time.monotonic() + self.ttl_seconds, time.time())
+            self._users.move_to_end(user.id)
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        """
+        Saca al usuario de la caché y marca como no fiables los claims de los
+        tokens emitidos hasta ahora (y los usuarios cacheados en otros workers).
+        """
+        with self._lock:
+            self._users.pop(user_id, None)
+        # Los tokens más antiguos que su caducidad ya no son válidos
+        self.invalidations.mark(user_id, time.time(), settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+    def invalidated_since(self, user_id: int, issued_at: Optional[float]) -> bool:
+        invalidated_at = self.invalidations.get(user_id)
+        if invalidated_at is None:
+            return False
+        return issued_at is None or issued_at < invalidated_at
+
+    def clear(self) -> None:
+        with self._lock:
+            self._users.clear()
+        self.invalidations.clear()
+
+
+def create_invalidation_backend():
+    if settings.USER_CACHE_BACKEND == "redis":
+        return RedisInvalidationBackend(settings.USER_CACHE_REDIS_URL or settings.CHAT_SESSION_REDIS_URL)
+    return InMemoryInvalidationBackend()
+
+
+user_cache = UserCache(
+    ttl_seconds=settings.USER_CACHE_TTL_SECONDS,
+    max_size=settings.USER_CACHE_MAX_SIZE,
+    invalidations=create_invalidation_backend(),
+)
+
+
+def invalidate_user(user_id: int) -> None:
+    """
+    Hook para llamar cuando cambian la contraseña o el estado de confirmación
+    de un usuario, o cuando se desactiva o se borra.
+    """
+    user_cache.invalidate(user_id)
+
+
+@event.listens_for(User, "after_delete")
+def _invalidate_deleted_user(mapper, connection, target) -> None:
+    # Un usuario borrado no puede seguir entrando con los claims de sus tokens
+    invalidate_user(target.id)
@@ -0,0 +1,229 @@
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+# La configuración se lee al importar los módulos de la aplicación: fijarla antes
+_TEST_DIR = tempfile.mkdtemp(prefix="nextclass-tests-")
+os.environ.update({
+    "ENVIRONMENT": "test",
+    "SECRET_KEY": "test-secret-key-for-the-test-suite-only",
+    "FRONTEND_URL": "http://frontend.test",
+    "LOGO_URL": "http://frontend.test/logo.png",
+    "MYSQLDATABASE_URL": f"sqlite:///{_TEST_DIR}/test.db",
+    "GOOGLE_API_KEY": "test",
+    "EMAIL_OUTBOX_ENABLED": "false",
+    "PASSWORD_HASH_WORKERS": "0",
+})
+
+import pytest
+import database
+import models
+from models import User, Class, ClassMember, Category, Student
+
+
+def clear_caches():
+    from routers.chat import chat_sessions
+    from services.class_context import context_updates
+    from services.name_index import name_indexes
+    from services.response_cache import dashboard_answers
+    from services.user_cache import user_cache
+
+    chat_sessions.clear()
+    context_updates.clear()
+    name_indexes.clear()
+    dashboard_answers.clear()
+    user_cache.clear()
+
+
+@pytest.fixture
+def db():
+    """
+    Sesión sobre una base de datos SQLite vacía, creada para cada test.
+    """
+    models.User.metadata.create_all(database.engine)
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        models.User.metadata.drop_all(database.engine)
+        clear_caches()
+
+
+def make_user(db, username: str, is_teacher: bool = True) -> User:
+    user = User(
+        username=username,
+        email=f"{username}@example.com",
+        hashed_password="x",
+        is_email_confirmed=True,
+        is_teacher=is_teacher,
+    )
+    db.add(user)
+    db.flush()
+    return user
+
+
+def make_class(db, owner: User, name: str = "1º A", students=("María Pérez", "Juan López", "José Álvarez")):
+    """
+    Clase con su profesor, categorías (Comportamiento, Participación y Tareas
+    con la subcategoría Lectura) y estudiantes.
+    """
+    class_obj = Class(name=name)
+    db.add(class_obj)
+    db.flush()
+    db.add(ClassMember(class_id=class_obj.id, user_id=owner.id, role="teacher"))
+    categories = {name: Category(class_id=class_obj.id, name=name) for name in ("Comportamiento", "Participación", "Tareas")}
+    db.add_all(categories.values())
+    db.flush()
+    categories["Lectura"] = Category(class_id=class_obj.id, name="Lectura", parent_id=categories["Tareas"].id)
+    db.add(categories["Lectura"])
+    student_rows = [
+        Student(name=student_name, email=f"{class_obj.id}-{position}@example.com", class_id=class_obj.id)
+        for position, student_name in enumerate(students)
+    ]
+    db.add_all(student_rows)
+    db.commit()
+    return SimpleNamespace(
+        id=class_obj.id,
+        categories={name: category.id for name, category in categories.items()},
+        students={student.name: student.id for student in student_rows},
+    )
+
+
+@pytest.fixture
+def teacher(db) -> User:
+    user = make_user(db, "profe")
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def school(db, teacher):
+    return make_class(db, teacher)
+
+
+def auth_headers(user: User) -> dict:
+    from routers.auth import create_access_token
+
+    token = create_access_token(
+        data={"sub": user.email, "user_id": user.id, "username": user.username, "is_teacher": user.is_teacher},
+        expires_delta=timedelta(minutes=30),
+    )
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def client(db):
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+class FakeChat:
+    """
+    Sesión de chat local con la interfaz de ChatSession de Gemini: responde
+    `reply` tras `delay` segundos y registra cuántas llamadas hay en curso.
+    """
+
+    def __init__(self, model, history=None):
+        import google.generativeai as genai
+
+        self.model = model
+        self.history = [
+            genai.protos.Content(**content) if isinstance(content, dict) else content
+            for content in history or []
+        ]
+
+    def send_message(self, message, stream=False):
+        import google.generativeai as genai
+
+        self.model.enter()
+        try:
+            time.sleep(self.model.delay)
+        finally:
+            self.model.leave()
+        self.history = [
+            *self.history,
+            genai.protos.Content(role="user", parts=[genai.protos.Part(text=message)]),
+            genai.protos.Content(role="model", parts=[genai.protos.Part(text=self.model.reply)]),
+        ]
+        if stream:
+            return self.model.stream(re.findall(r"\S+\s*|\n", self.model.reply))
+        return SimpleNamespace(text=self.model.reply)
+
+
+class FakeModel:
+    def __init__(self, delay: float = 0, reply: str = "Respuesta de prueba"):
+        self.delay = delay
+        self.reply = reply
+        # Respuestas en streaming: pausa entre fragmentos y error tras `fail_after` fragmentos
+        self.chunk_delay = 0
+        self.fail_after = None
+        self.streamed = 0
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        with self._lock:
+            self.calls += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+
+    def leave(self):
+        with self._lock:
+            self.running -= 1
+
+    def stream(self, pieces):
+        for position, piece in enumerate(pieces):
+            if self.fail_after is not None and position >= self.fail_after:
+                raise RuntimeError("La respuesta se cortó")
+            time.sleep(self.chunk_delay)
+            self.streamed += 1
+            yield SimpleNamespace(parts=[piece], text=piece)
+
+    def start_chat(self, history=None):
+        return FakeChat(self, history)
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    from services import google_api_v2
+
+    model = FakeModel()
+    monkeypatch.setattr(google_api_v2, "model", model)
+    return model
+
+
+class DictSessionBackend:
+    """
+    Backend compartido en memoria: hace de Redis entre "workers" en los tests.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    def load(self, key):
+        return self.data.get(key)
+
+    def store(self, key, data, ttl_seconds):
+        self.data[key] = data
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+@pytest.fixture
+def shared_backend(monkeypatch):
+    from routers.chat import chat_sessions
+
+    backend = DictSessionBackend()
+    monkeypatch.setattr(chat_sessions, "backend", backend)
+    return backend
@@ -0,0 +1,112 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from conftest import auth_headers, make_class
+import database
+from config import settings
+from routers import students, students_async
+from services import google_api_v2
+from services.google_api_v2 import LLMCallLimiter
+from services.grades import apply_grade_changes
+
+
+@pytest.fixture
+def async_client(db, monkeypatch):
+    """
+    Rutas de estudiantes con DB_ASYNC_ENABLED: las variantes asíncronas
+    (aiosqlite sobre la misma base de datos) por delante de las síncronas,
+    como las registra main.py.
+    """
+    monkeypatch.setattr(settings, "DB_ASYNC_ENABLED", True)
+    app = FastAPI()
+    app.include_router(students_async.router, prefix="/students")
+    app.include_router(students.router, prefix="/students")
+
+    @app.on_event("shutdown")
+    async def dispose():
+        await database.async_engine.dispose()
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def graded(db, school):
+    for category, points in (("Comportamiento", 5), ("Participación", -2), ("Lectura", 3)):
+        apply_grade_changes(db, school.categories[category], school.students.values(), points)
+    return school
+
+
+def update_grades(client, teacher, school, names, points):
+    return client.post(
+        f"/students/{school.id}/update_grades",
+        json={"student_names": names, "category_name": "Comportamiento", "points": points},
+        headers=auth_headers(teacher),
+    )
+
+
+def test_async_engine_uses_aiosqlite(async_client, teacher, graded):
+    async_client.get(f"/students/{graded.id}", headers=auth_headers(teacher))
+
+    assert database.async_engine.dialect.driver == "aiosqlite"
+
+
+@pytest.mark.parametrize("path", ["/students/{}?history=full", "/students/{}?history=last&history_limit=1", "/students/{}?history=none"])
+def test_roster_matches_the_sync_route(client, async_client, teacher, graded, path):
+    headers = auth_headers(teacher)
+
+    sync_response = client.get(path.format(graded.id), headers=headers)
+    async_response = async_client.get(path.format(graded.id), headers=headers)
+
+    assert async_response.status_code == sync_response.status_code == 200
+    assert async_response.json() == sync_response.json()
+    assert async_response.headers["ETag"] == sync_response.headers["ETag"]
+
+
+def test_history_matches_the_sync_route(client, async_client, teacher, graded):
+    path = f"/students/{graded.id}/history/{graded.students['María Pérez']}?limit=2"
+    headers = auth_headers(teacher)
+
+    sync_page = client.get(path, headers=headers).json()
+    async_page = async_client.get(path, headers=headers).json()
+    assert async_page == sync_page
+
+    cursor = sync_page["next_cursor"]
+    assert async_client.get(f"{path}&cursor={cursor}", headers=headers).json() == (
+        client.get(f"{path}&cursor={cursor}", headers=headers).json()
+    )
+
+
+def test_update_grades_matches_the_sync_route(client, async_client, db, teacher):
+    sync_class = make_class(db, teacher, name="1º A")
+    async_class = make_class(db, teacher, name="2º B")
+    names = ["María Pérez", "Juan López"]
+
+    for points in (5, -2):
+        sync_response = update_grades(client, teacher, sync_class, names, points)
+        async_response = update_grades(async_client, teacher, async_class, names, points)
+        assert async_response.status_code == sync_response.status_code == 200
+        assert async_response.json() == sync_response.json()
+
+    # Lo escrito por la sesión asíncrona se lee igual desde la síncrona
+    def grades(school):
+        roster = client.get(f"/students/{school.id}?history=none", headers=auth_headers(teacher)).json()
+        return {student["name"]: student["grades"] for student in roster["students"]}
+
+    assert grades(async_class) == grades(sync_class)
+
+
+def test_chat_command_with_the_async_session(client, db, teacher, school, fake_model, monkeypatch):
+    monkeypatch.setattr(google_api_v2, "llm_limiter", LLMCallLimiter(2))
+    message = {"message": "Añade 5 puntos a María en comportamiento", "state": "in_class", "class_id": school.id}
+
+    monkeypatch.setattr(settings, "DB_ASYNC_ENABLED", True)
+    async_response = client.post("/api/chat", json=message, headers=auth_headers(teacher))
+    monkeypatch.setattr(settings, "DB_ASYNC_ENABLED", False)
+    sync_response = client.post("/api/chat", json=message, headers=auth_headers(teacher))
+
+    assert async_response.json() == sync_response.json()
+    assert async_response.json()["update_required"] is True
+    roster = client.get(f"/students/{school.id}?history=none", headers=auth_headers(teacher)).json()
+    [maria] = [student for student in roster["students"] if student["name"] == "María Pérez"]
+    assert {grade["category"]: grade["grade"] for grade in maria["grades"]}["Comportamiento"] == 10
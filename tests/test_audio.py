@@ -0,0 +1,119 @@
+import asyncio
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+import pytest
+from conftest import auth_headers
+from config import settings
+from services import google_api_v2
+from services.audio_upload import AudioClip, upload_audio
+from services.google_api_v2 import LLMCallLimiter, LLMTimeoutError, get_gemini_audio_response
+
+AUDIO = b"RIFF\x00\x00\x00\x00WAVE" + b"\x01" * 4096
+
+
+class FakeFiles:
+    """
+    API de ficheros de Gemini: guarda lo que se sube y lo que se borra.
+    `fail_upload` corta la subida después de crear el fichero remoto.
+    """
+
+    def __init__(self, delay: float = 0, fail_upload: bool = False, state: str = "ACTIVE"):
+        self.delay = delay
+        self.fail_upload = fail_upload
+        self.state = state
+        self.uploaded = {}
+        self.deleted = []
+        self.local_paths = []
+
+    def upload_file(self, file, mime_type=None, name=None):
+        self.local_paths.append(file.name)
+        time.sleep(self.delay)
+        self.uploaded[name] = file.read()
+        if self.fail_upload:
+            raise ConnectionError("La subida se cortó")
+        return self.get_file(name)
+
+    def get_file(self, name):
+        return SimpleNamespace(name=name, state=SimpleNamespace(name=self.state))
+
+    def delete_file(self, name):
+        self.deleted.append(name)
+
+
+class FakeAudioModel:
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.received = []
+
+    def generate_content(self, parts):
+        time.sleep(self.delay)
+        audio = parts[1]
+        self.received.append(audio["data"] if isinstance(audio, dict) else audio.name)
+        return SimpleNamespace(text="Respuesta de prueba")
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = LLMCallLimiter(2)
+    monkeypatch.setattr(google_api_v2, "llm_limiter", limiter)
+    return limiter
+
+
+def request_clip() -> AudioClip:
+    upload = tempfile.SpooledTemporaryFile(max_size=1024)
+    upload.write(AUDIO)
+    upload.seek(0)
+    return AudioClip(file=upload, size=len(AUDIO), mime_type="audio/wav")
+
+
+def test_too_large_audio_reports_the_configured_limit(client, teacher):
+    response = client.post(
+        "/api/chat/audio",
+        data={"state": "in_class", "class_id": "1"},
+        files={"file": ("audio.wav", b"\x00" * (settings.AUDIO_MAX_UPLOAD_MB + 1) * 1024 * 1024, "audio/wav")},
+        headers=auth_headers(teacher),
+    )
+
+    assert response.status_code == 413
+    assert response.json()["detail"] == f"El fichero supera el máximo de {settings.AUDIO_MAX_UPLOAD_MB} MB."
+
+
+@pytest.mark.parametrize("inline", [True, False])
+def test_timed_out_job_keeps_its_own_copy(monkeypatch, limiter, inline):
+    # La subida (que lee el fichero) empieza cuando la petición ya ha terminado
+    model = FakeAudioModel(delay=0.2)
+    files = FakeFiles(delay=0.2)
+    monkeypatch.setattr(google_api_v2, "model", model)
+    monkeypatch.setattr(google_api_v2, "genai", files)
+    monkeypatch.setattr(settings, "LLM_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(settings, "AUDIO_UPLOAD_TIMEOUT_SECONDS", 0)
+    if not inline:
+        monkeypatch.setattr(settings, "AUDIO_INLINE_MAX_MB", 0)
+    clip = request_clip()
+
+    with pytest.raises(LLMTimeoutError):
+        asyncio.run(get_gemini_audio_response("in_class", "Clase", clip))
+    clip.file.close()  # FastAPI cierra el UploadFile al terminar la petición
+    limiter.executor.shutdown(wait=True)  # el hilo termina después de la petición
+
+    if inline:
+        assert model.received == [AUDIO]
+    else:
+        [(name, content)] = files.uploaded.items()
+        assert content == AUDIO
+        assert model.received == [name]
+        assert files.deleted == [name]
+        assert not os.path.exists(files.local_paths[0])  # la copia temporal se borra
+
+
+@pytest.mark.parametrize("files", [FakeFiles(fail_upload=True), FakeFiles(state="FAILED")], ids=["upload", "processing"])
+def test_failed_upload_deletes_the_remote_file(files):
+    clip = request_clip()
+
+    with pytest.raises(Exception):
+        upload_audio(clip, files, timeout=1)
+
+    assert list(files.uploaded) == files.deleted
+    assert files.deleted[0].startswith("files/")
@@ -0,0 +1,27 @@
+import asyncio
+import crud
+from services.passwords import hash_password
+
+
+def test_login_looks_the_user_up_off_the_event_loop(client, db, teacher, monkeypatch):
+    teacher.hashed_password = hash_password("Secreta1!")
+    db.commit()
+    lookups = []
+
+    def get_user_by_email(session, email):
+        try:
+            asyncio.get_running_loop()
+            lookups.append("event loop")
+        except RuntimeError:
+            lookups.append("thread")
+        return original(session, email)
+
+    original = crud.get_user_by_email
+    monkeypatch.setattr(crud, "get_user_by_email", get_user_by_email)
+
+    response = client.post("/auth/token", json={"email": teacher.email, "password": "Secreta1!"})
+    assert response.status_code == 200
+    assert response.json()["token_type"] == "bearer"
+
+    assert client.post("/auth/token", json={"email": teacher.email, "password": "otra"}).status_code == 401
+    assert lookups == ["thread", "thread"]
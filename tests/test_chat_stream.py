@@ -0,0 +1,69 @@
+import asyncio
+import json
+import pytest
+from conftest import auth_headers
+from models import Grade
+from routers.chat import chat_sessions
+from services import google_api_v2
+from services.google_api_v2 import LLMCallLimiter, stream_gemini_response
+
+
+@pytest.fixture(autouse=True)
+def limiter(monkeypatch):
+    limiter = LLMCallLimiter(2)
+    monkeypatch.setattr(google_api_v2, "llm_limiter", limiter)
+    return limiter
+
+
+def read_events(response) -> list:
+    events = []
+    for block in response.text.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if "event" in fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def stream_chat(client, teacher, school, message="¿Cómo va María?"):
+    return client.post(
+        "/api/chat/stream",
+        json={"message": message, "state": "in_class", "class_id": school.id},
+        headers=auth_headers(teacher),
+    )
+
+
+def test_stream_runs_the_detected_command(client, db, teacher, school, fake_model):
+    fake_model.reply = "Ok. María Pérez +5 puntos en Comportamiento\nHecho."
+
+    events = read_events(stream_chat(client, teacher, school))
+
+    assert [event for event, _ in events if event != "token"] == ["done"]
+    assert events[-1][1] == {"response": fake_model.reply, "update_required": True}
+    assert db.query(Grade).one().grade == 5
+    assert chat_sessions.get(f"class:{teacher.id}:{school.id}") is not None
+
+
+def test_error_after_the_command_settles_it_and_keeps_the_session(client, db, teacher, school, fake_model):
+    fake_model.reply = "Ok. María Pérez +5 puntos en Comportamiento\nY algo más que no llega"
+    fake_model.fail_after = 7  # la primera línea completa y después un error
+
+    events = read_events(stream_chat(client, teacher, school))
+
+    assert events[-1] == ("error", {"detail": "Error interno en el servidor.", "update_required": True})
+    assert db.query(Grade).one().grade == 5
+    assert chat_sessions.get(f"class:{teacher.id}:{school.id}") is not None
+
+
+def test_closing_the_stream_stops_the_producer(fake_model, limiter):
+    fake_model.reply = " ".join(f"palabra{number}" for number in range(50))
+    fake_model.chunk_delay = 0.02
+
+    async def main():
+        chunks = stream_gemini_response(fake_model.start_chat(), "hola", timeout=5)
+        first = await chunks.__anext__()
+        await chunks.aclose()
+        return first
+
+    assert asyncio.run(main()) == "palabra0 "
+    assert limiter.running == 0  # el hilo terminó antes de cerrar el generador
+    assert fake_model.streamed < 50
@@ -0,0 +1,103 @@
+import pytest
+from conftest import auth_headers
+from services import google_api_v2
+from services.google_api_v2 import LLMCallLimiter
+from services.grades import apply_grade_changes
+
+
+@pytest.fixture(autouse=True)
+def limiter(monkeypatch):
+    monkeypatch.setattr(google_api_v2, "llm_limiter", LLMCallLimiter(2))
+
+
+def ask(client, user, school, message):
+    response = client.post(
+        "/api/chat",
+        json={"message": message, "state": "in_class", "class_id": school.id},
+        headers=auth_headers(user),
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def update_grades(client, user, school, names, points=5):
+    response = client.post(
+        f"/students/{school.id}/update_grades",
+        json={"student_names": names, "category_name": "Comportamiento", "points": points},
+        headers=auth_headers(user),
+    )
+    assert response.status_code == 200
+
+
+def last_message(teacher, school):
+    from routers.chat import chat_sessions
+
+    return chat_sessions.get(f"class:{teacher.id}:{school.id}").history[-2].parts[0].text
+
+
+def test_session_receives_only_the_new_changes(client, teacher, school, fake_model):
+    ask(client, teacher, school, "¿Quién va primero?")
+    update_grades(client, teacher, school, ["María Pérez"])
+    update_grades(client, teacher, school, ["Juan López"], points=-2)
+
+    ask(client, teacher, school, "¿Y ahora?")
+
+    assert last_message(teacher, school) == (
+        "[Cambios de notas: María Pérez Comportamiento 5 (+5); Juan López Comportamiento -2 (-2)]\n¿Y ahora?"
+    )
+
+
+def test_change_from_another_worker_rebuilds_the_context(client, db, teacher, school, fake_model):
+    ask(client, teacher, school, "¿Quién va primero?")
+    # Otro proceso: cambia las notas (y la versión), pero este registro no lo sabe
+    apply_grade_changes(db, school.categories["Comportamiento"], [school.students["María Pérez"]], 5)
+    update_grades(client, teacher, school, ["Juan López"])
+
+    ask(client, teacher, school, "¿Y ahora?")
+
+    message = last_message(teacher, school)
+    assert message.startswith("[Datos actualizados de la clase]\n")
+    assert message.endswith("\n\n¿Y ahora?")
+
+
+def test_restored_session_keeps_its_context_version(client, teacher, school, fake_model, shared_backend):
+    from routers.chat import chat_sessions
+
+    ask(client, teacher, school, "¿Quién va primero?")
+    assert shared_backend.data[f"class:{teacher.id}:{school.id}"]["context_version"] is not None
+    chat_sessions.clear()  # la sesión solo queda en el backend compartido
+    update_grades(client, teacher, school, ["María Pérez"])
+
+    ask(client, teacher, school, "¿Y ahora?")
+
+    assert last_message(teacher, school) == "[Cambios de notas: María Pérez Comportamiento 5 (+5)]\n¿Y ahora?"
+
+
+@pytest.mark.parametrize("path", ["/api/chat", "/api/chat/stream"])
+def test_changes_are_resent_after_a_failed_call(client, teacher, school, fake_model, monkeypatch, path):
+    import routers.chat
+    from services.google_api_v2 import LLMTimeoutError
+
+    ask(client, teacher, school, "¿Quién va primero?")
+    update_grades(client, teacher, school, ["María Pérez"])
+
+    async def timeout(*args):
+        raise LLMTimeoutError("sin respuesta")
+
+    async def stream_timeout(*args):
+        raise LLMTimeoutError("sin respuesta")
+        yield
+
+    with monkeypatch.context() as patch:
+        patch.setattr(routers.chat, "get_gemini_response", timeout)
+        patch.setattr(routers.chat, "stream_gemini_response", stream_timeout)
+        response = client.post(
+            path,
+            json={"message": "¿Y ahora?", "state": "in_class", "class_id": school.id},
+            headers=auth_headers(teacher),
+        )
+        assert response.status_code == 504 or "event: error" in response.text
+
+    ask(client, teacher, school, "¿Y ahora?")
+
+    assert last_message(teacher, school) == "[Cambios de notas: María Pérez Comportamiento 5 (+5)]\n¿Y ahora?"
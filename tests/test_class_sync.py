@@ -0,0 +1,138 @@
+from types import SimpleNamespace
+from conftest import auth_headers
+from models import Category, Challenge, Item
+from schemas import ClassSettingsRequest
+from services.class_sync import diff_rows, sync_class_settings
+
+
+def row(id=None, **values):
+    return SimpleNamespace(id=id, **values)
+
+
+def settings_payload(class_id: int, **lists) -> dict:
+    return {
+        "id": class_id,
+        "name": "1º A",
+        "academic_year": 2026,
+        "description": None,
+        "group": "A",
+        "subject": "Lengua",
+        "is_invitation_code_enabled": False,
+        "invitation_link": None,
+        "invitation_code": None,
+        "categories": None,
+        "challenges": None,
+        "items": None,
+        **lists,
+    }
+
+
+def test_diff_rows():
+    existing = {1: row(1, name="Tareas", weight=1.0), 2: row(2, name="Lectura", weight=1.0), 3: row(3, name="Examen", weight=2.0)}
+    requested = [
+        row(1, name="Tareas", weight=1.0),         # sin cambios
+        row(2, name="Lectura", weight=0.5),        # cambia el peso
+        row(None, name="Proyecto", weight=1.0),    # nueva
+        row(99, name="Desconocida", weight=1.0),   # id que no existe: nueva
+        row(1, name="Copia", weight=1.0),          # id repetido: nueva
+    ]
+
+    diff = diff_rows(existing, requested, ("name", "weight"))
+
+    assert diff.updates == [{"id": 2, "name": "Lectura", "weight": 0.5}]
+    assert diff.inserts == [
+        {"name": "Proyecto", "weight": 1.0},
+        {"name": "Desconocida", "weight": 1.0},
+        {"name": "Copia", "weight": 1.0},
+    ]
+    assert diff.deletes == {3}
+    assert diff.matched == [1, 2, None, None, None]
+    assert diff.summary() == {"inserted": 3, "updated": 1, "deleted": 1}
+
+
+def test_sync_categories(db, school):
+    comportamiento, participacion, tareas, lectura = (
+        school.categories[name] for name in ("Comportamiento", "Participación", "Tareas", "Lectura")
+    )
+    payload = settings_payload(school.id, categories=[
+        {"id": comportamiento, "name": "Conducta", "weight": 2.0, "subcategories": []},
+        {"id": tareas, "name": "Tareas", "weight": 1.0, "subcategories": [
+            {"id": lectura, "name": "Lectura", "weight": 1.0},
+            {"id": None, "name": "Escritura", "weight": 1.0},
+        ]},
+        {"id": None, "name": "Proyecto", "weight": 1.0, "subcategories": [{"id": None, "name": "Memoria", "weight": 1.0}]},
+    ])
+
+    summary = sync_class_settings(db, school.id, ClassSettingsRequest(**payload))
+    db.commit()
+
+    assert summary == {
+        "categories": {"inserted": 1, "updated": 1, "deleted": 1},
+        "subcategories": {"inserted": 2, "updated": 0, "deleted": 0},
+    }
+    categories = {category.name: category for category in db.query(Category).filter(Category.class_id == school.id)}
+    assert set(categories) == {"Conducta", "Tareas", "Lectura", "Escritura", "Proyecto", "Memoria"}
+    assert categories["Conducta"].id == comportamiento and categories["Conducta"].weight == 2.0
+    assert participacion not in {category.id for category in categories.values()}
+    assert categories["Lectura"].id == lectura and categories["Lectura"].parent_id == tareas
+    assert categories["Escritura"].parent_id == tareas
+    assert categories["Memoria"].parent_id == categories["Proyecto"].id
+
+
+def test_deleting_a_category_deletes_its_subcategories(db, school):
+    payload = settings_payload(school.id, categories=[
+        {"id": school.categories["Comportamiento"], "name": "Comportamiento", "weight": 1.0, "subcategories": []},
+    ])
+
+    sync_class_settings(db, school.id, ClassSettingsRequest(**payload))
+    db.commit()
+
+    assert [category.name for category in db.query(Category).filter(Category.class_id == school.id)] == ["Comportamiento"]
+
+
+def test_none_lists_leave_the_class_unchanged(db, school):
+    summary = sync_class_settings(db, school.id, ClassSettingsRequest(**settings_payload(school.id)))
+    db.commit()
+
+    assert summary == {}
+    assert db.query(Category).filter(Category.class_id == school.id).count() == 4
+
+
+def test_challenges_and_items_keep_their_ids(client, db, teacher, school):
+    """
+    Los retos e items llegan como JSON: antes se comprobaba `"id" in challenge`
+    como si fueran diccionarios, la comprobación siempre fallaba y cada
+    guardado los borraba y los volvía a crear con ids nuevos.
+    """
+    db.add_all([
+        Challenge(class_id=school.id, name="Leer un libro", level=1),
+        Challenge(class_id=school.id, name="Exposición", level=2),
+        Item(class_id=school.id, name="Pase de deberes", price=50),
+        Item(class_id=school.id, name="Elegir sitio", price=20),
+    ])
+    db.commit()
+    challenge_ids = {challenge.name: challenge.id for challenge in db.query(Challenge)}
+    item_ids = {item.name: item.id for item in db.query(Item)}
+
+    payload = settings_payload(
+        school.id,
+        challenges=[
+            {"id": challenge_ids["Leer un libro"], "name": "Leer dos libros", "level": 2},
+            {"id": None, "name": "Debate", "level": 1},
+        ],
+        items=[
+            {"id": item_ids["Pase de deberes"], "name": "Pase de deberes", "description": None, "price": 40},
+            {"id": item_ids["Elegir sitio"], "name": "Elegir sitio", "description": None, "price": 20},
+        ],
+    )
+    response = client.put(f"/classes/user/update_class/{school.id}", json=payload, headers=auth_headers(teacher))
+
+    assert response.status_code == 200
+    db.expire_all()
+    challenges = {challenge.name: challenge for challenge in db.query(Challenge).filter(Challenge.class_id == school.id)}
+    assert set(challenges) == {"Leer dos libros", "Debate"}
+    assert challenges["Leer dos libros"].id == challenge_ids["Leer un libro"]
+    assert challenges["Leer dos libros"].level == 2
+    items = {item.name: item for item in db.query(Item).filter(Item.class_id == school.id)}
+    assert {name: item.id for name, item in items.items()} == item_ids
+    assert items["Pase de deberes"].price == 40
@@ -0,0 +1,46 @@
+import pytest
+from conftest import make_class
+from services.command_parser import parse_local_command
+from services.name_index import get_name_index
+
+
+@pytest.fixture
+def index(db, school):
+    return get_name_index(db, school.id)
+
+
+def parsed(command):
+    return [student.name for student in command.students], command.category.name, command.points
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("Añade 5 puntos a María en comportamiento", (["María Pérez"], "Comportamiento", 5)),
+    ("Súmale 2,5 a Juan en participación.", (["Juan López"], "Participación", 2.5)),
+    ("Juan +10 en lectura", (["Juan López"], "Lectura", 10)),
+    ("Quita 3 puntos a José en comportamiento", (["José Álvarez"], "Comportamiento", -3)),
+    ("Juan -2 en participación", (["Juan López"], "Participación", -2)),
+    ("Dale 4 a Juan, María y José en lectura", (["Juan López", "María Pérez", "José Álvarez"], "Lectura", 4)),
+])
+def test_known_commands(index, message, expected):
+    assert parsed(parse_local_command(message, index)) == expected
+
+
+@pytest.mark.parametrize("message", [
+    "Ponle 5 a María en comportamiento",  # fija la nota, no la suma
+    "Pon 5 puntos a Juan en lectura",
+    "Da 5 a María en comportamiento",
+    "Juan 10 en lectura",  # sin signo ni verbo
+    "Quita -5 a Juan en lectura",
+    "Añade 5 a Juan en tareas",  # categoría con subcategorías
+])
+def test_unclear_commands_go_to_the_model(index, message):
+    assert parse_local_command(message, index) is None
+
+
+def test_ambiguous_name_goes_to_the_model(db, teacher):
+    school = make_class(db, teacher, name="2º B", students=("María Pérez", "María Gómez"))
+    index = get_name_index(db, school.id)
+
+    assert parse_local_command("Añade 5 a María en comportamiento", index) is None
+    command = parse_local_command("Añade 5 a María Gómez en comportamiento", index)
+    assert parsed(command) == (["María Gómez"], "Comportamiento", 5)
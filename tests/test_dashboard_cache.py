@@ -0,0 +1,94 @@
+import pytest
+from conftest import auth_headers
+from services import google_api_v2
+from services.google_api_v2 import LLMCallLimiter
+
+
+@pytest.fixture(autouse=True)
+def limiter(monkeypatch):
+    monkeypatch.setattr(google_api_v2, "llm_limiter", LLMCallLimiter(2))
+
+
+def ask(client, user, message):
+    response = client.post(
+        "/api/chat",
+        json={"message": message, "state": "in_dashboard", "class_id": None},
+        headers=auth_headers(user),
+    )
+    assert response.status_code == 200
+    return response.json()["response"]
+
+
+def reset_conversation(teacher):
+    from routers.chat import chat_sessions
+
+    chat_sessions.invalidate(f"dashboard:{teacher.id}")
+
+
+def test_first_question_is_cached_across_conversations(client, teacher, school, fake_model):
+    assert ask(client, teacher, "¿Cuántas clases tengo?") == "Respuesta de prueba"
+    reset_conversation(teacher)
+    assert ask(client, teacher, "cuantas clases tengo") == "Respuesta de prueba"
+    assert fake_model.calls == 1
+
+
+def test_follow_ups_depend_on_the_previous_turns(client, teacher, school, fake_model):
+    ask(client, teacher, "¿Cuál es mi primera clase?")
+    fake_model.reply = "La segunda es 2º B"
+    assert ask(client, teacher, "¿y la segunda?") == "La segunda es 2º B"
+
+    reset_conversation(teacher)
+    ask(client, teacher, "¿Qué clases tengo?")
+    fake_model.reply = "Tu segunda clase no tiene alumnos"
+    # Misma pregunta tras otra conversación: no vale la respuesta anterior
+    assert ask(client, teacher, "¿y la segunda?") == "Tu segunda clase no tiene alumnos"
+    assert fake_model.calls == 4
+
+
+def test_restored_session_keeps_its_context_hash(client, teacher, school, fake_model, shared_backend):
+    from routers.chat import chat_sessions
+
+    ask(client, teacher, "¿Cuántas clases tengo?")
+    key = f"dashboard:{teacher.id}"
+    assert "context_hash" in shared_backend.data[key]
+
+    # Otro worker: la sesión solo está en el backend compartido
+    chat_sessions.clear()
+    ask(client, teacher, "¿Y alumnos?")
+    assert len(shared_backend.data[key]["history"]) == 5
+
+
+def test_restored_session_without_context_hash_is_rebuilt(client, teacher, school, fake_model, shared_backend):
+    key = f"dashboard:{teacher.id}"
+    # Formato antiguo: solo el historial, creado con unos datos que ya no se conocen
+    shared_backend.data[key] = [
+        {"role": "user", "parts": [{"text": "Contexto antiguo"}]},
+        {"role": "user", "parts": [{"text": "¿Cuántas clases tengo?"}]},
+        {"role": "model", "parts": [{"text": "Ninguna"}]},
+    ]
+
+    ask(client, teacher, "¿Y alumnos?")
+    history = shared_backend.data[key]["history"]
+    assert len(history) == 3
+    assert history[0]["parts"][0]["text"] != "Contexto antiguo"
+
+
+def test_shared_backend_is_used_off_the_event_loop(client, teacher, school, fake_model, shared_backend, monkeypatch):
+    import asyncio
+
+    calls = []
+
+    def on_loop():
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+
+    load, store = shared_backend.load, shared_backend.store
+    monkeypatch.setattr(shared_backend, "load", lambda *args: calls.append(on_loop()) or load(*args))
+    monkeypatch.setattr(shared_backend, "store", lambda *args: calls.append(on_loop()) or store(*args))
+
+    ask(client, teacher, "¿Cuántas clases tengo?")
+
+    assert calls == [False, False]
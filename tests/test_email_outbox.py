@@ -0,0 +1,122 @@
+import socket
+import pytest
+from aiosmtpd.controller import Controller
+import database
+from models import OutboxEmail
+from services.email_outbox import EmailOutboxWorker, SMTPConnection, queue_email
+
+
+class RecordingHandler:
+    """
+    Servidor SMTP de pruebas: guarda los mensajes recibidos, cuenta las
+    conexiones (un EHLO por conexión) y rechaza algunos destinatarios.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connections += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("noexiste"):
+            return "550 5.1.1 Mailbox unavailable"
+        if address.startswith("greylist"):
+            return "451 4.7.1 Try again later"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.rcpt_tos[0], envelope.content))
+        return "250 Message accepted"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def port():
+    return free_port()
+
+
+@pytest.fixture
+def smtp_server(port):
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    yield handler
+    controller.stop()
+
+
+@pytest.fixture
+def worker(port):
+    connection = SMTPConnection("127.0.0.1", port, starttls=False, timeout=5)
+    worker = EmailOutboxWorker(
+        database.SessionLocal,
+        connection,
+        from_addr="nextclass@example.com",
+        batch_size=10,
+        retry_base_seconds=0,
+    )
+    yield worker
+    connection.close()
+
+
+def queue(db, *addresses):
+    for address in addresses:
+        queue_email(db, address, "Asunto", "<p>Hola</p>")
+    db.commit()
+
+
+def statuses(db):
+    db.expire_all()
+    return {email.to_email: (email.status, email.attempts) for email in db.query(OutboxEmail)}
+
+
+def test_batch_is_sent_over_one_connection(db, smtp_server, worker):
+    queue(db, "uno@example.com", "dos@example.com", "tres@example.com")
+
+    assert worker.run_once() == 3
+
+    assert [address for address, _ in smtp_server.messages] == ["uno@example.com", "dos@example.com", "tres@example.com"]
+    assert smtp_server.connections == 1
+    assert worker.connection.connections_opened == 1
+    assert set(statuses(db).values()) == {("sent", 1)}
+    assert db.query(OutboxEmail).filter(OutboxEmail.locked_until.isnot(None)).count() == 0
+
+
+def test_rejected_recipients(db, smtp_server, worker):
+    queue(db, "noexiste@example.com", "greylist@example.com", "uno@example.com")
+
+    assert worker.run_once() == 3
+
+    # 5xx: descartado; 4xx (greylisting): se reintenta más tarde
+    assert statuses(db) == {
+        "noexiste@example.com": ("failed", 1),
+        "greylist@example.com": ("pending", 1),
+        "uno@example.com": ("sent", 1),
+    }
+    assert smtp_server.connections == 1
+
+
+def test_retry_after_the_server_was_down(db, port, worker):
+    queue(db, "uno@example.com", "dos@example.com")
+
+    assert worker.run_once() == 0
+    assert statuses(db) == {"uno@example.com": ("pending", 1), "dos@example.com": ("pending", 1)}
+
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        assert worker.run_once() == 2
+    finally:
+        controller.stop()
+    assert len(handler.messages) == 2
+    assert statuses(db) == {"uno@example.com": ("sent", 2), "dos@example.com": ("sent", 2)}
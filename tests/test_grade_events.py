@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+from conftest import auth_headers, make_user
+from services import grade_events as grade_events_module
+from services.grade_events import GradeEventBroker, stream_grade_events
+
+CLASS_ID = 1
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    broker = GradeEventBroker(history_size=3, max_queue=2)
+    monkeypatch.setattr(grade_events_module, "grade_events", broker)
+    return broker
+
+
+def publish(broker, count):
+    for points in range(1, count + 1):
+        broker.publish(CLASS_ID, {"category_id": 1, "points": points, "grades": [[1, points]]})
+
+
+def read(last_event_id=None, count=1, before_reading=None):
+    """
+    Los primeros `count` mensajes de la respuesta SSE; `before_reading` se
+    ejecuta después del primero, con el cliente ya suscrito.
+    """
+    async def main():
+        stream = stream_grade_events(CLASS_ID, last_event_id)
+        try:
+            messages = [await stream.__anext__()]
+            if before_reading is not None:
+                before_reading()
+                await asyncio.sleep(0)  # entregar lo publicado a la cola
+            while len(messages) < count:
+                messages.append(await asyncio.wait_for(stream.__anext__(), timeout=1))
+            return messages
+        finally:
+            await stream.aclose()
+
+    return asyncio.run(main())
+
+
+def test_non_member_cannot_subscribe(client, db, school):
+    other = make_user(db, "otro")
+    db.commit()
+
+    response = client.get(f"/students/{school.id}/events", headers=auth_headers(other))
+
+    assert response.status_code == 403
+
+
+def test_live_events_follow_ready(broker):
+    messages = read(count=2, before_reading=lambda: publish(broker, 1))
+
+    assert messages[0].startswith("event: ready\n")
+    assert messages[1] == f'id: {broker.boot_id}.1\nevent: grades\ndata: {{"category_id":1,"points":1,"grades":[[1,1]]}}\n\n'
+
+
+def test_last_event_id_replays_the_missed_events(broker):
+    publish(broker, 3)
+
+    messages = read(f"{broker.boot_id}.1", count=2)
+
+    assert [message.splitlines()[0] for message in messages] == [f"id: {broker.boot_id}.2", f"id: {broker.boot_id}.3"]
+    assert all("event: grades" in message for message in messages)
+
+
+@pytest.mark.parametrize("last_event_id", ["{boot}.1", "otroproceso.1", "{boot}.99"])
+def test_resync_when_the_missed_events_are_gone(broker, last_event_id):
+    publish(broker, 5)  # el histórico solo guarda los 3 últimos
+
+    [message] = read(last_event_id.format(boot=broker.boot_id))
+
+    assert message.startswith("event: resync\n")
+
+
+def test_resync_when_the_client_falls_behind(broker):
+    # Más eventos de los que caben en la cola del cliente sin leerlos
+    messages = read(count=2, before_reading=lambda: publish(broker, 4))
+
+    assert "event: resync\n" in messages[1]
@@ -0,0 +1,97 @@
+import pytest
+from models import Grade, GradeHistory
+from services import grades
+from services.grades import apply_grade_changes
+from conftest import auth_headers, make_class, make_user
+
+
+@pytest.mark.parametrize("path", ["on_conflict", "read_modify_write"])
+def test_increments_accumulate_in_one_row(db, school, monkeypatch, path):
+    if path == "read_modify_write":
+        monkeypatch.setattr(grades, "ON_CONFLICT_INSERTS", {})
+    student_id = school.students["María Pérez"]
+    category_id = school.categories["Comportamiento"]
+
+    first = apply_grade_changes(db, category_id, [student_id], 10, description="primera")
+    second = apply_grade_changes(db, category_id, [student_id], 5, description="segunda")
+
+    assert first[0]["total_grade"] == 10
+    assert first[0]["percentage_change"] == 100  # sin nota previa
+    assert second[0]["total_grade"] == 15
+    assert second[0]["percentage_change"] == 50  # 5 sobre una nota previa de 10
+
+    rows = db.query(Grade).filter(Grade.student_id == student_id, Grade.category_id == category_id).all()
+    assert [row.grade for row in rows] == [15]
+    history = db.query(GradeHistory).filter(GradeHistory.grade_id == rows[0].id).order_by(GradeHistory.id).all()
+    assert [(entry.change_amount, entry.current_grade, entry.description) for entry in history] == [
+        (10, 10, "primera"),
+        (5, 15, "segunda"),
+    ]
+
+
+def test_batch_creates_and_updates_grades(db, school):
+    category_id = school.categories["Participación"]
+    maria, juan = school.students["María Pérez"], school.students["Juan López"]
+    apply_grade_changes(db, category_id, [maria], 3)
+
+    results = apply_grade_changes(db, category_id, [maria, juan, maria], -1)
+
+    assert [(result["student_id"], result["total_grade"]) for result in results] == [(maria, 2), (juan, -1)]
+    assert db.query(Grade).filter(Grade.category_id == category_id).count() == 2
+    assert db.query(GradeHistory).count() == 3
+
+
+def post_grades(client, path, user, names, category="Comportamiento"):
+    return client.post(
+        path,
+        json={"student_names": names, "category_name": category, "points": 5},
+        headers=auth_headers(user) if user is not None else {},
+    )
+
+
+def test_only_the_class_teachers_can_update_grades(client, db, school):
+    other = make_user(db, "otro")
+    db.commit()
+
+    response = post_grades(client, f"/students/{school.id}/update_grades", other, ["María Pérez"])
+
+    assert response.status_code == 403
+    assert db.query(Grade).count() == 0
+
+
+def test_legacy_update_grades_requires_auth_and_stays_in_the_teachers_classes(client, db, teacher, school):
+    assert post_grades(client, "/students/update_grades", None, ["María Pérez"]).status_code == 401
+
+    # Otra clase con las mismas categorías que no es del profesor
+    other = make_user(db, "otro")
+    make_class(db, other, name="2º B", students=("María Pérez",))
+    response = post_grades(client, "/students/update_grades", teacher, ["María Pérez"])
+    assert response.status_code == 200
+    grade = db.query(Grade).one()
+    assert grade.student_id == school.students["María Pérez"]
+
+    # Si la categoría existe en varias de sus clases, hay que indicar la clase
+    make_class(db, teacher, name="3º C", students=("María Pérez",))
+    assert post_grades(client, "/students/update_grades", teacher, ["María Pérez"]).status_code == 400
+
+
+def test_grade_writes_bump_the_class_version_once_per_transaction(db, school):
+    from services.class_versions import get_class_version
+
+    version = get_class_version(db, school.id)
+    apply_grade_changes(db, school.categories["Comportamiento"], [school.students["María Pérez"]], 5, commit=False)
+    apply_grade_changes(db, school.categories["Participación"], [school.students["Juan López"]], 3, commit=False)
+    db.commit()
+    assert get_class_version(db, school.id) == version + 1
+
+    Grade.add_grade(db, school.students["María Pérez"], school.categories["Comportamiento"], 2)
+    assert get_class_version(db, school.id) == version + 2
+
+
+def test_add_grade_invalidates_the_roster_etag(client, db, teacher, school):
+    headers = auth_headers(teacher)
+    etag = client.get(f"/students/{school.id}", headers=headers).headers["ETag"]
+
+    Grade.add_grade(db, school.students["María Pérez"], school.categories["Comportamiento"], 2)
+
+    assert client.get(f"/students/{school.id}", headers={**headers, "If-None-Match": etag}).status_code == 200
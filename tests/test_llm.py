@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+import pytest
+from conftest import auth_headers
+from config import settings
+from services import google_api_v2
+from services.google_api_v2 import LLMCallLimiter, LLMTimeoutError, get_gemini_response
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = LLMCallLimiter(2)
+    monkeypatch.setattr(google_api_v2, "llm_limiter", limiter)
+    return limiter
+
+
+def test_concurrency_limit(fake_model, limiter):
+    fake_model.delay = 0.1
+
+    async def main():
+        sessions = [fake_model.start_chat() for _ in range(6)]
+        return await asyncio.gather(*(get_gemini_response(session, "hola") for session in sessions))
+
+    assert asyncio.run(main()) == ["Respuesta de prueba"] * 6
+    assert fake_model.max_running == 2
+    assert limiter.running == 0
+
+
+def test_timeout_keeps_the_slot_until_the_thread_finishes(fake_model, monkeypatch):
+    limiter = LLMCallLimiter(1)
+    monkeypatch.setattr(google_api_v2, "llm_limiter", limiter)
+    fake_model.delay = 0.3
+
+    async def main():
+        with pytest.raises(LLMTimeoutError):
+            await google_api_v2.run_llm_call(fake_model.start_chat().send_message, "uno", timeout=0.05)
+        assert limiter.running == 1  # el hilo sigue ocupado
+        # Sin hueco libre, una llamada con poco margen no llega a empezar
+        with pytest.raises(LLMTimeoutError):
+            await google_api_v2.run_llm_call(fake_model.start_chat().send_message, "dos", timeout=0.05)
+        # Con margen, espera a que el hilo anterior termine
+        response = await google_api_v2.run_llm_call(fake_model.start_chat().send_message, "tres", timeout=2)
+        return response.text
+
+    assert asyncio.run(main()) == "Respuesta de prueba"
+    assert fake_model.calls == 2
+    assert fake_model.max_running == 1
+
+
+def test_calls_on_the_same_session_are_serialized(fake_model, monkeypatch):
+    monkeypatch.setattr(google_api_v2, "llm_limiter", LLMCallLimiter(4))
+    fake_model.delay = 0.05
+    session = fake_model.start_chat()
+
+    async def main():
+        await asyncio.gather(*(get_gemini_response(session, f"mensaje {number}") for number in range(3)))
+
+    asyncio.run(main())
+
+    assert fake_model.max_running == 1
+    assert len(session.history) == 6
+
+
+def test_chat_timeout_returns_504(client, teacher, school, fake_model, limiter, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_TIMEOUT_SECONDS", 0.05)
+    fake_model.delay = 0.3
+
+    response = client.post(
+        "/api/chat",
+        json={"message": "¿Cuántas clases tengo?", "state": "in_dashboard", "class_id": None},
+        headers=auth_headers(teacher),
+    )
+
+    assert response.status_code == 504
+
+
+def test_chat_does_not_block_other_requests(client, teacher, school, fake_model, limiter):
+    fake_model.delay = 0.5
+    results = {}
+
+    def ask():
+        results["chat"] = client.post(
+            "/api/chat",
+            json={"message": "¿Cuántas clases tengo?", "state": "in_dashboard", "class_id": None},
+            headers=auth_headers(teacher),
+        )
+
+    thread = threading.Thread(target=ask)
+    thread.start()
+    while fake_model.running == 0 and thread.is_alive():
+        time.sleep(0.01)
+    started = time.perf_counter()
+    assert client.get("/").status_code == 200
+    elapsed = time.perf_counter() - started
+    thread.join()
+
+    assert elapsed < 0.3
+    assert results["chat"].status_code == 200
+    assert results["chat"].json() == {"response": "Respuesta de prueba"}
@@ -0,0 +1,21 @@
+import pytest
+from conftest import auth_headers
+from config import settings
+
+
+@pytest.mark.parametrize("path", ["/metrics", "/api/chat/metrics"])
+def test_metrics_require_the_metrics_token(client, teacher, monkeypatch, path):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "secreto")
+
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers=auth_headers(teacher)).status_code == 401
+    assert client.get(path, headers={"Authorization": "Bearer secreto"}).status_code == 200
+
+
+@pytest.mark.parametrize("path", ["/metrics", "/api/chat/metrics"])
+def test_metrics_without_token_are_closed_in_production(client, monkeypatch, path):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", None)
+    assert client.get(path).status_code == 200
+
+    monkeypatch.setattr(settings, "ENVIRONMENT", "production")
+    assert client.get(path).status_code == 401
@@ -0,0 +1,62 @@
+from conftest import auth_headers
+from models import Grade, Student
+from services.command_parser import parse_local_command
+from services.name_index import get_name_index
+
+
+def update_grades(client, teacher, school, names, category="Comportamiento", points=5):
+    return client.post(
+        f"/students/{school.id}/update_grades",
+        json={"student_names": names, "category_name": category, "points": points},
+        headers=auth_headers(teacher),
+    )
+
+
+def test_fuzzy_matches_are_only_suggestions(db, school):
+    index = get_name_index(db, school.id)
+
+    assert index.find_students("jose albarez") == []
+    assert [student.name for student in index.suggest_students("jose albarez")] == ["José Álvarez"]
+    assert index.resolve_student("jose albarez") is None
+    assert index.resolve_student("alvarez").name == "José Álvarez"
+    assert index.resolve_student("MARIA").name == "María Pérez"
+    assert index.resolve_category("comportamient") is None
+    assert [category.name for category in index.suggest_categories("comportamient")] == ["Comportamiento"]
+
+
+def test_local_command_leaves_fuzzy_names_to_the_model(db, school):
+    index = get_name_index(db, school.id)
+
+    assert parse_local_command("Añade 5 puntos a jose albarez en comportamiento", index) is None
+    command = parse_local_command("Añade 5 puntos a alvarez en comportamiento", index)
+    assert [student.name for student in command.students] == ["José Álvarez"]
+
+
+def test_fuzzy_name_is_not_written(client, db, teacher, school):
+    response = update_grades(client, teacher, school, ["Jose Albarez"])
+
+    assert response.status_code == 404
+    assert "José Álvarez" in response.json()["detail"]
+    assert db.query(Grade).count() == 0
+
+
+def test_student_added_by_another_worker_is_found(client, db, teacher, school):
+    get_name_index(db, school.id)  # índice en caché sin el estudiante nuevo
+    db.add(Student(name="Lucía Gómez", email="lucia@example.com", class_id=school.id))
+    db.commit()
+
+    response = update_grades(client, teacher, school, ["Lucía Gómez"])
+
+    assert response.status_code == 200
+    assert response.json()["updated_students"] == ["Lucía Gómez"]
+
+
+def test_student_deleted_by_another_worker_is_not_written(client, db, teacher, school):
+    get_name_index(db, school.id)  # índice en caché con el estudiante
+    db.query(Student).filter(Student.id == school.students["Juan López"]).delete()
+    db.commit()
+
+    response = update_grades(client, teacher, school, ["Juan López"])
+
+    assert response.status_code == 404
+    assert db.query(Grade).count() == 0
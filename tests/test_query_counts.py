@@ -0,0 +1,70 @@
+import pytest
+from conftest import auth_headers, make_class
+from services.grades import apply_grade_changes
+from services.query_counter import assert_num_queries, assert_response_queries
+from services.roster import load_class_roster
+
+# Consultas por petición, independientes del número de estudiantes y notas
+# (la autenticación sale de los claims del token y no consulta la base de datos)
+ROSTER_QUERIES = {"full": 5, "last": 5, "none": 4}
+CLASS_DETAILS_QUERIES = 5
+UPDATE_GRADES_QUERIES = 10
+NOT_MODIFIED_QUERIES = 1
+
+MANY_STUDENTS = tuple(f"Estudiante {number:02d}" for number in range(30))
+
+
+@pytest.fixture(params=["small", "large"])
+def graded_class(request, db, teacher):
+    """
+    Clase con notas e historial en todas las categorías hoja: 3 o 30 estudiantes.
+    """
+    school = make_class(db, teacher, students=MANY_STUDENTS) if request.param == "large" else make_class(db, teacher)
+    for category in ("Comportamiento", "Participación", "Lectura"):
+        for points in (5, -2):
+            apply_grade_changes(db, school.categories[category], school.students.values(), points)
+    return school
+
+
+@pytest.mark.parametrize("history", ROSTER_QUERIES)
+def test_roster_queries(client, teacher, graded_class, history):
+    response = client.get(f"/students/{graded_class.id}?history={history}", headers=auth_headers(teacher))
+
+    assert response.status_code == 200
+    assert len(response.json()["students"]) == len(graded_class.students)
+    assert_response_queries(response, ROSTER_QUERIES[history])
+
+
+def test_roster_service_queries(db, graded_class):
+    with assert_num_queries(ROSTER_QUERIES["full"] - 1):  # sin la lectura de la versión
+        load_class_roster(db, graded_class.id)
+
+
+def test_class_details_queries(client, teacher, graded_class):
+    response = client.get(f"/classes/{graded_class.id}", headers=auth_headers(teacher))
+
+    assert response.status_code == 200
+    assert_response_queries(response, CLASS_DETAILS_QUERIES)
+
+
+@pytest.mark.parametrize("path", ["/students/{}", "/classes/{}"])
+def test_not_modified_reads_only_the_version(client, teacher, graded_class, path):
+    headers = auth_headers(teacher)
+    etag = client.get(path.format(graded_class.id), headers=headers).headers["ETag"]
+
+    response = client.get(path.format(graded_class.id), headers={**headers, "If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert_response_queries(response, NOT_MODIFIED_QUERIES)
+
+
+def test_update_grades_queries(client, teacher, graded_class):
+    response = client.post(
+        f"/students/{graded_class.id}/update_grades",
+        json={"student_names": list(graded_class.students), "category_name": "Comportamiento", "points": 5},
+        headers=auth_headers(teacher),
+    )
+
+    assert response.status_code == 200
+    assert len(response.json()["updated_students"]) == len(graded_class.students)
+    assert_response_queries(response, UPDATE_GRADES_QUERIES)
@@ -0,0 +1,91 @@
+import base64
+from datetime import datetime
+import pytest
+from sqlalchemy import func
+from conftest import auth_headers, make_class, make_user
+from models import GradeHistory
+from services.grades import apply_grade_changes
+from services.roster import encode_history_cursor
+
+
+@pytest.fixture
+def graded(db, school):
+    """
+    Cinco cambios para María en Comportamiento (1 a 5 puntos) y dos en
+    Participación, todos con la misma fecha: el orden lo decide el id.
+    """
+    maria = school.students["María Pérez"]
+    for points in (1, 2, 3, 4, 5):
+        apply_grade_changes(db, school.categories["Comportamiento"], [maria], points)
+    for points in (10, 20):
+        apply_grade_changes(db, school.categories["Participación"], [maria], points)
+    db.query(GradeHistory).update({GradeHistory.created_at: datetime(2026, 10, 1, 9, 0)})
+    db.commit()
+    return maria
+
+
+def history_page(client, user, school, student_id, **params):
+    return client.get(f"/students/{school.id}/history/{student_id}", params=params, headers=auth_headers(user))
+
+
+def test_cursor_pages_are_stable_with_equal_timestamps(client, teacher, school, graded):
+    changes = []
+    cursor = None
+    while True:
+        params = {"limit": 2, "category": "Comportamiento"}
+        if cursor:
+            params["cursor"] = cursor
+        response = history_page(client, teacher, school, graded, **params)
+        assert response.status_code == 200
+        page = response.json()
+        changes.append([entry["change_amount"] for entry in page["grade_history"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert changes == [[5, 4], [3, 2], [1]]
+
+
+def test_roster_last_keeps_the_latest_entries_per_grade(client, teacher, school, graded):
+    response = client.get(f"/students/{school.id}?history=last&history_limit=2", headers=auth_headers(teacher))
+
+    assert response.status_code == 200
+    [maria] = [student for student in response.json()["students"] if student["id"] == graded]
+    assert [(entry["category"], entry["change_amount"]) for entry in maria["grade_history"]] == [
+        ("Comportamiento", 5),
+        ("Comportamiento", 4),
+        ("Participación", 20),
+        ("Participación", 10),
+    ]
+
+
+@pytest.mark.parametrize("cursor", [
+    "no-es-un-cursor",
+    base64.urlsafe_b64encode(b"x:1").decode(),
+    base64.urlsafe_b64encode(b"h:abc").decode(),
+    encode_history_cursor(999999),
+])
+def test_invalid_cursor(client, teacher, school, graded, cursor):
+    response = history_page(client, teacher, school, graded, cursor=cursor)
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Cursor de historial no válido"
+
+
+def test_cursor_from_another_student(client, db, teacher, school, graded):
+    juan = school.students["Juan López"]
+    apply_grade_changes(db, school.categories["Comportamiento"], [juan], 7)
+    entry_id = db.query(func.max(GradeHistory.id)).scalar()
+
+    response = history_page(client, teacher, school, graded, cursor=encode_history_cursor(entry_id))
+
+    assert response.status_code == 400
+
+
+def test_history_requires_class_membership(client, db, school, graded):
+    other_teacher = make_user(db, "otro")
+    make_class(db, other_teacher, name="2º B")
+
+    response = history_page(client, other_teacher, school, graded)
+
+    assert response.status_code == 403
@@ -0,0 +1,133 @@
+import io
+from openpyxl import Workbook
+from sqlalchemy import false
+from conftest import auth_headers, make_class, make_user
+from models import Student
+from services import student_import
+from services.student_import import import_students
+
+
+def upload(client, user, filename, content, class_id=None):
+    return client.post(
+        "/students/students/import",
+        files={"file": (filename, content)},
+        data={} if class_id is None else {"class_id": str(class_id)},
+        headers=auth_headers(user),
+    )
+
+
+def xlsx(*rows) -> bytes:
+    workbook = Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    content = io.BytesIO()
+    workbook.save(content)
+    return content.getvalue()
+
+
+def class_emails(db, class_id):
+    db.expire_all()
+    return {email for (email,) in db.query(Student.email).filter(Student.class_id == class_id)}
+
+
+def test_csv_with_semicolons_and_spanish_headers(client, db, teacher, school):
+    content = "\ufeffNombre;Correo\nAna Ruiz;ana@example.com\n;\nLuis Gil ; luis@example.com\n".encode()
+
+    response = upload(client, teacher, "alumnos.csv", content, class_id=school.id)
+
+    assert response.status_code == 200
+    assert response.json() == {"added_count": 2, "errors": []}
+    assert {"ana@example.com", "luis@example.com"} <= class_emails(db, school.id)
+
+
+def test_xlsx_with_class_column(client, db, teacher, school):
+    other = make_class(db, teacher, name="2º B", students=())
+    content = xlsx(["name", "email", "clase"], ["Ana Ruiz", "ana@example.com", school.id], ["Luis Gil", "luis@example.com", other.id])
+
+    response = upload(client, teacher, "alumnos.xlsx", content)
+
+    assert response.status_code == 200
+    assert response.json() == {"added_count": 2, "errors": []}
+    assert "ana@example.com" in class_emails(db, school.id)
+    assert class_emails(db, other.id) == {"luis@example.com"}
+
+
+def test_chunks_across_the_boundary(db, school):
+    rows = [(number, {"name": f"Estudiante {number}", "email": f"e{number}@example.com"}) for number in range(2, 503)]
+
+    chunks = list(import_students(db, rows, default_class_id=school.id, chunk_size=500))
+
+    assert [len(added) for added, _ in chunks] == [500, 1]
+    assert all(errors == [] for _, errors in chunks)
+    assert len(class_emails(db, school.id)) == len(school.students) + 501
+
+
+def test_duplicates_in_the_file_and_in_the_database(db, teacher, school):
+    other = make_class(db, teacher, name="2º B", students=("Eva Sanz",))
+    rows = [
+        (2, {"name": "Ana Ruiz", "email": "ana@example.com"}),
+        (3, {"name": "Ana Ruiz", "email": "otra@example.com"}),
+        (4, {"name": "Luis Gil", "email": "ana@example.com"}),
+        (5, {"name": "Otra María", "email": f"{school.id}-0@example.com"}),
+        (6, {"name": "Eva Copia", "email": f"{other.id}-0@example.com"}),
+        (7, {"name": "María Pérez", "email": "maria@example.com"}),
+        (8, {"name": "Sin Clase", "email": "sin@example.com", "class_id": "999"}),
+        (9, {"name": "Correo Malo", "email": "no-es-un-email"}),
+    ]
+
+    [(added, errors)] = import_students(db, rows, default_class_id=school.id)
+
+    assert added == ["ana@example.com"]
+    assert {error["row"]: error["error"] for error in errors} == {
+        3: "Nombre repetido en la clase dentro del fichero.",
+        4: "Email repetido en el fichero.",
+        5: f"El estudiante con correo {school.id}-0@example.com ya está en la clase.",
+        6: "El estudiante ya está registrado en otra clase.",
+        7: "Ya existe un estudiante llamado María Pérez en la clase.",
+        8: "Clase no encontrada.",
+        9: "Valor no válido en 'email'.",
+    }
+
+
+def test_falls_back_to_row_by_row_after_an_integrity_error(db, school, monkeypatch):
+    # Otra petición guarda el estudiante entre la comprobación y el insert
+    monkeypatch.setattr(student_import, "or_", lambda *clauses: false())
+    rows = [
+        (2, {"name": "Ana Ruiz", "email": "ana@example.com"}),
+        (3, {"name": "Otra María", "email": f"{school.id}-0@example.com"}),
+        (4, {"name": "Luis Gil", "email": "luis@example.com"}),
+    ]
+
+    [(added, errors)] = import_students(db, rows, default_class_id=school.id)
+
+    assert added == ["ana@example.com", "luis@example.com"]
+    assert errors == [{"row": 3, "email": f"{school.id}-0@example.com", "error": "El estudiante ya existe."}]
+    assert {"ana@example.com", "luis@example.com"} <= class_emails(db, school.id)
+
+
+def test_import_requires_every_class(client, db, teacher, school):
+    foreign = make_class(db, make_user(db, "otro"), name="3º C", students=())
+    content = f"name,email,class_id\nAna Ruiz,ana@example.com,{school.id}\nLuis Gil,luis@example.com,{foreign.id}\n".encode()
+
+    response = upload(client, teacher, "alumnos.csv", content)
+
+    assert response.status_code == 403
+    assert "ana@example.com" not in class_emails(db, school.id)
+    assert class_emails(db, foreign.id) == set()
+
+
+def test_bulk_add_requires_every_class(client, db, teacher, school):
+    foreign = make_class(db, make_user(db, "otro"), name="3º C", students=())
+
+    response = client.post(
+        "/students/students/bulk_add",
+        json={"students": [
+            {"name": "Ana Ruiz", "email": "ana@example.com", "class_id": school.id},
+            {"name": "Luis Gil", "email": "luis@example.com", "class_id": foreign.id},
+        ]},
+        headers=auth_headers(teacher),
+    )
+
+    assert response.status_code == 403
+    assert "ana@example.com" not in class_emails(db, school.id)
+    assert class_emails(db, foreign.id) == set()
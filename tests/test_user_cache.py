@@ -0,0 +1,28 @@
+import time
+from conftest import auth_headers
+from services.user_cache import CurrentUser, InMemoryInvalidationBackend, UserCache, user_cache
+
+
+def test_invalidation_is_seen_by_every_worker():
+    shared = InMemoryInvalidationBackend()  # hace de Redis
+    worker_a = UserCache(ttl_seconds=60, max_size=10, invalidations=shared)
+    worker_b = UserCache(ttl_seconds=60, max_size=10, invalidations=shared)
+    user = CurrentUser(id=1, username="profe", email="profe@example.com", is_teacher=True)
+    issued_at = time.time() - 1
+    worker_a.set(user)
+    assert worker_a.get(1) == user
+
+    worker_b.invalidate(1)
+    assert worker_a.get(1) is None
+    assert worker_a.invalidated_since(1, issued_at)
+    assert not worker_a.invalidated_since(1, time.time() + 1)
+
+
+def test_deleted_user_loses_access(client, db, teacher):
+    headers = auth_headers(teacher)
+    assert client.get("/users/me", headers=headers).status_code == 200
+    assert user_cache.get(teacher.id) is not None
+
+    db.delete(teacher)
+    db.commit()
+    assert client.get("/users/me", headers=headers).status_code == 401